@@ -1,14 +1,46 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-from sklearn.ensemble import IsolationForest
+import numpy as np
 import os
-import joblib
+from compiled_forest import CompiledForest, compile_isolation_forest, explain_anomalies
+from model_registry import ModelRegistry, REGISTRY_DIR
+from instrumentation import instrumented
 
-def run_isolation_forest(csv_path="output/task2_stopwatch_features.csv", contamination=0.01, random_state=42):
+FEATURE_COLUMNS = ['total_time_sec', 'max_subtask_percent', 'sum_other_subtask_time', 'ratio_other_to_max']
+
+
+def reservoir_sample(chunks, k, random_state=42):
     """
-    Load stopwatch features and apply Isolation Forest for anomaly detection.
-    Saves results as CSV and plot in the 'output/' folder.
+    Uniform sample of `k` rows from an iterable of DataFrame chunks in one pass
+    (reservoir sampling, algorithm R), holding at most `k` rows at a time.
+    Rows are returned in stream order.
     """
+    rng = np.random.default_rng(random_state)
+    reservoir, positions, seen = None, np.empty(0, dtype=np.int64), 0
+    for chunk in chunks:
+        stream = np.arange(seen, seen + len(chunk))
+        # Row t fills slot t while the reservoir fills, then replaces a random slot j <= t if j < k
+        slots = np.where(stream < k, stream, rng.integers(0, stream + 1))
+        accepted = np.flatnonzero(slots < k)
+        # A slot written twice within the chunk keeps the later row
+        _, last = np.unique(slots[accepted][::-1], return_index=True)
+        accepted = np.sort(accepted[len(accepted) - 1 - last])
+
+        n_old, size = len(positions), min(k, seen + len(chunk))
+        take = np.concatenate([np.arange(n_old), np.zeros(size - n_old, dtype=np.int64)])
+        take[slots[accepted]] = n_old + np.arange(len(accepted))
+        new_rows = chunk.iloc[accepted]
+        reservoir = (new_rows if reservoir is None else pd.concat([reservoir, new_rows])).iloc[take]
+        positions = np.concatenate([positions, np.zeros(size - n_old, dtype=np.int64)])
+        positions[slots[accepted]] = stream[accepted]
+        seen += len(chunk)
+
+    if reservoir is None:
+        return pd.DataFrame()
+    return reservoir.iloc[np.argsort(positions, kind='stable')]
+
+
+def load_isolation_forest_features(csv_path="output/task2_stopwatch_features.csv"):
+    """(stopwatch feature rows with a ratio, their feature matrix)."""
     print("📦 Loading feature data...")
     df = pd.read_csv(csv_path)
     print(f"✅ Feature data shape: {df.shape}")
@@ -18,15 +50,86 @@ def run_isolation_forest(csv_path="output/task2_stopwatch_features.csv", contami
 
 
     # Feature matrix
-    X = df[['total_time_sec', 'max_subtask_percent', 'sum_other_subtask_time', 'ratio_other_to_max']].copy()
+    X = df[FEATURE_COLUMNS].copy()
+    return df, X
+
+
+def train_isolation_forest(X, contamination=0.01, random_state=42, n_estimators=100, n_jobs=None,
+                           max_train_rows=None):
+    """
+    Fit an Isolation Forest on `X` (a frame or a sparse matrix, or on a
+    `max_train_rows` reservoir sample of it), with trees built in parallel
+    over `n_jobs` cores. The threshold (`offset_`) is set from the raw scores
+    of all rows, exactly as sklearn sets it from the training rows. Returns (model, raw scores of `X`).
+    """
+    from sklearn.ensemble import IsolationForest
+
+    X_train = X
+    n_rows = X.shape[0]
+    if max_train_rows is not None and n_rows > max_train_rows:
+        if hasattr(X, 'tocsr'):
+            # Sparse matrices are sampled by row number and sliced, never densified
+            rows = reservoir_sample([pd.DataFrame({'row': np.arange(n_rows)})], max_train_rows, random_state)
+            X_train = X.tocsr()[rows['row'].to_numpy()]
+        else:
+            X_train = reservoir_sample([X], max_train_rows, random_state=random_state)
+        print(f"🎲 Training on a reservoir sample of {X_train.shape[0]} / {n_rows} rows")
+
+    # 'auto' skips sklearn's own scoring pass over the training rows; the
+    # contamination threshold is applied below from the scores of every row
+    model = IsolationForest(n_estimators=n_estimators, contamination='auto', random_state=random_state,
+                            n_jobs=n_jobs)
+    model.fit(X_train)
+    raw_scores = model.score_samples(X)
+    model.set_params(contamination=contamination)
+    model.offset_ = contamination_threshold(raw_scores, contamination)
+    return model, raw_scores
+
+
+def contamination_threshold(raw_scores, contamination):
+    """`offset_` flagging the lowest `contamination` share of `raw_scores` (sklearn's rule)."""
+    return float(np.percentile(raw_scores, 100.0 * contamination))
+
+
+@instrumented()
+def run_isolation_forest(csv_path="output/task2_stopwatch_features.csv", contamination=0.01, random_state=42,
+                         registry_dir=REGISTRY_DIR, n_jobs=None, max_train_rows=None):
+    """
+    Load stopwatch features and apply Isolation Forest for anomaly detection.
+    Saves results as CSV in the 'output/' folder and registers the model (with
+    its compiled node arrays and the sorted raw scores of every row, so the
+    contamination can be changed later without refitting) as a new
+    'isolation_forest' version. See `train_isolation_forest` for `n_jobs`
+    and `max_train_rows`.
+    """
+    df, X = load_isolation_forest_features(csv_path)
 
     # Fit Isolation Forest
     print("🧠 Training Isolation Forest...")
-    model = IsolationForest(n_estimators=100, contamination=contamination, random_state=random_state)
-    df['anomaly_score'] = model.fit_predict(X)
-    df['anomaly_score_value'] = model.decision_function(X)
+    model, raw_scores = train_isolation_forest(X, contamination, random_state, n_jobs=n_jobs,
+                                               max_train_rows=max_train_rows)
+    return save_isolation_forest_results(df, X, model, raw_scores, random_state, max_train_rows, registry_dir)
+
+
+def save_isolation_forest_results(df, X, model, raw_scores, random_state=42, max_train_rows=None,
+                                  registry_dir=REGISTRY_DIR):
+    """
+    Flag the rows of `df` from a trained model's raw scores of `X`, save
+    output/anomaly_results.csv and register the model.
+    """
+    contamination = model.contamination
+    # The raw scores are kept so the threshold can be moved later (`recalibrate_anomaly_results`)
+    df['raw_score'] = raw_scores
+    df['anomaly_score_value'] = raw_scores - model.offset_
+    df['anomaly_score'] = np.where(df['anomaly_score_value'] < 0, -1, 1)
+    df = df[[col for col in df.columns if col not in ('raw_score', 'anomaly_score_value')]
+            + ['raw_score', 'anomaly_score_value']]
     df['is_anomaly'] = df['anomaly_score'] == -1
 
+    # Which features isolated each anomaly (walks the trees for the flagged rows only)
+    compiled = compile_isolation_forest(model)
+    df = explain_anomalies(df, compiled, FEATURE_COLUMNS, df['is_anomaly'])
+
     # Preview
     print("🔍 Anomalies Detected:", df['is_anomaly'].sum())
     print(df[df['is_anomaly']].head())
@@ -38,11 +141,47 @@ def run_isolation_forest(csv_path="output/task2_stopwatch_features.csv", contami
     df.to_csv("output/anomaly_results.csv", index=False)
     print("💾 Anomaly results saved to output/anomaly_results.csv")
 
-    os.makedirs(os.path.dirname("output/isolation_forest_model.joblib"), exist_ok=True)
-    joblib.dump(model, "output/isolation_forest_model.joblib")
+    # Flattened node arrays (memory-mapped at load time) for fast batch scoring
+    ModelRegistry(registry_dir).register(
+        'isolation_forest', X, model=model,
+        arrays={**compiled.to_arrays(), 'score_distribution': np.sort(raw_scores)},
+        params={'n_estimators': model.n_estimators, 'n_jobs': model.n_jobs, 'max_samples': model.max_samples,
+                'contamination': contamination, 'random_state': random_state, 'max_train_rows': max_train_rows},
+        metrics={'n_anomalies': int(df['is_anomaly'].sum()), 'n_training_rows_sampled': int(min(
+            len(X), max_train_rows if max_train_rows is not None else len(X)))},
+    )
 
     return df
+
+
+def recalibrate_anomaly_results(contamination, results_csv="output/anomaly_results.csv", version=None,
+                                registry_dir=REGISTRY_DIR):
+    """
+    Re-flag saved Isolation Forest results for a new `contamination` using the
+    registered version's stored score distribution (no refit, no rescoring),
+    and re-explain the newly flagged rows. Scores are shifted from the CSV's
+    `raw_score` column, so recalibrating again starts from the trained scores.
+    """
+    entry = ModelRegistry(registry_dir).load('isolation_forest', version)
+    if 'score_distribution' not in entry.arrays:
+        raise ValueError(f"❌ isolation_forest v{entry.version} has no stored score distribution, retrain it")
+    new_offset = contamination_threshold(entry.arrays['score_distribution'], contamination)
+
+    df = pd.read_csv(results_csv)
+    if 'raw_score' not in df.columns:
+        raise ValueError(f"❌ {results_csv} has no raw_score column, rerun run_isolation_forest()")
+    df['anomaly_score_value'] = df['raw_score'] - new_offset
+    df['anomaly_score'] = np.where(df['anomaly_score_value'] < 0, -1, 1)
+    df['is_anomaly'] = df['anomaly_score'] == -1
+    df = explain_anomalies(df, CompiledForest.from_arrays(entry.arrays), FEATURE_COLUMNS, df['is_anomaly'])
+    df.to_csv(results_csv, index=False)
+    print(f"🎚️ contamination {contamination}: {int(df['is_anomaly'].sum())} anomalies, saved to {results_csv}")
+    return df
+
+
+@instrumented()
 def plot_anomaly_scores(df,save_dir="output/figures"):
+    import matplotlib.pyplot as plt
 
     # Plot and save figure
     plt.figure(figsize=(10, 6))
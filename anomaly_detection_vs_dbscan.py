@@ -1,7 +1,12 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 import os
+from itertools import combinations
+from instrumentation import instrumented
 
+COMPARISON_KEYS = ['trace_id', 'stopwatch_name']
+COMPARISON_FEATURES = ['total_time_sec', 'max_subtask_percent', 'sum_other_subtask_time', 'ratio_other_to_max']
+
+@instrumented()
 def compare_dbscan_and_anomaly(csv_dbscan="output/dbscan_clustering_results.csv", 
                                csv_anomaly="output/anomaly_results.csv",output_dir="output"):
     """
@@ -11,6 +16,7 @@ def compare_dbscan_and_anomaly(csv_dbscan="output/dbscan_clustering_results.csv"
     2. Anomalies detected by Isolation Forest but not by DBSCAN.
     3. Anomalies detected by DBSCAN but not by Isolation Forest.
     """
+    import matplotlib.pyplot as plt
     
     # Step 1: Load the DBSCAN and Anomaly Detection results
     dbscan_df = pd.read_csv(csv_dbscan)
@@ -26,74 +32,34 @@ def compare_dbscan_and_anomaly(csv_dbscan="output/dbscan_clustering_results.csv"
     print(f"✅ DBSCAN Anomalies: {dbscan_anomalies.shape[0]}")
     print(f"✅ Isolation Forest Anomalies: {isolation_forest_anomalies.shape[0]}")
 
-    # Step 3: Initialize a list to store results
-    final_comparison = []
-
-    # Step 4: Compare anomalies from Isolation Forest with DBSCAN
-    for idx, anomaly_row in isolation_forest_anomalies.iterrows():
-        trace_id = anomaly_row['trace_id']
-        stopwatch_name = anomaly_row['stopwatch_name']
-
-        # Compare both trace_id and stopwatch_name to ensure correct matching
-        dbscan_row = dbscan_anomalies[(dbscan_anomalies['trace_id'] == trace_id) & 
-                                      (dbscan_anomalies['stopwatch_name'] == stopwatch_name)]
-        
-        if not dbscan_row.empty:
-            # If there's a match, compare anomalies detected by both models
-            dbscan_is_anomaly = dbscan_row['cluster'].values[0] == -1
-            isolation_forest_is_anomaly = anomaly_row['is_anomaly'] == True
-
-            final_comparison.append({
-                'trace_id': trace_id,
-                'stopwatch_name': stopwatch_name,
-                'dbscan_is_anomaly': dbscan_is_anomaly,
-                'isolation_forest_is_anomaly': isolation_forest_is_anomaly,
-                'total_time_sec': anomaly_row['total_time_sec'],
-                'max_subtask_percent': anomaly_row['max_subtask_percent'],
-                'sum_other_subtask_time': anomaly_row['sum_other_subtask_time'],
-                'ratio_other_to_max': anomaly_row['ratio_other_to_max'],
-                'detected_by_both_models': dbscan_is_anomaly and isolation_forest_is_anomaly
-            })
-        
-        else:
-            # If no match in DBSCAN, the anomaly is only detected by Isolation Forest
-            final_comparison.append({
-                'trace_id': trace_id,
-                'stopwatch_name': stopwatch_name,
-                'dbscan_is_anomaly': False,
-                'isolation_forest_is_anomaly': True,
-                'total_time_sec': anomaly_row['total_time_sec'],
-                'max_subtask_percent': anomaly_row['max_subtask_percent'],
-                'sum_other_subtask_time': anomaly_row['sum_other_subtask_time'],
-                'ratio_other_to_max': anomaly_row['ratio_other_to_max'],
-                'detected_by_both_models': False
-            })
-
-    # Step 5: Compare anomalies for DBSCAN that are not in Isolation Forest
-    for idx, dbscan_row in dbscan_anomalies.iterrows():
-        trace_id = dbscan_row['trace_id']
-        stopwatch_name = dbscan_row['stopwatch_name']
-
-        # Check if the pair (trace_id, stopwatch_name) does not exist in Isolation Forest anomalies
-        match = isolation_forest_anomalies[
-            (isolation_forest_anomalies['trace_id'] == trace_id) &
-            (isolation_forest_anomalies['stopwatch_name'] == stopwatch_name)
-        ]
-        if match.empty:
-            final_comparison.append({
-                'trace_id': trace_id,
-                'stopwatch_name': stopwatch_name,
-                'dbscan_is_anomaly': True,
-                'isolation_forest_is_anomaly': False,
-                'total_time_sec': dbscan_row['total_time_sec'],
-                'max_subtask_percent': dbscan_row['max_subtask_percent'],
-                'sum_other_subtask_time': dbscan_row['sum_other_subtask_time'],
-                'ratio_other_to_max': dbscan_row['ratio_other_to_max'],
-                'detected_by_both_models': False
-            })
+    # Step 3: Outer join both anomaly sets on (trace_id, stopwatch_name).
+    # Keys are unique per model (features are grouped by them), so DBSCAN keys are
+    # deduplicated to keep one output row per Isolation Forest anomaly.
+    if_side = isolation_forest_anomalies[COMPARISON_KEYS + COMPARISON_FEATURES].copy()
+    if_side['_order'] = range(len(if_side))
+    db_side = dbscan_anomalies[COMPARISON_KEYS + COMPARISON_FEATURES].drop_duplicates(subset=COMPARISON_KEYS).copy()
+    db_side['_order'] = range(len(db_side))
+
+    merged = if_side.merge(db_side, on=COMPARISON_KEYS, how='outer', suffixes=('', '_dbscan'), indicator=True)
+
+    # Step 4: Rows found by Isolation Forest (with or without a DBSCAN match), in Isolation Forest order
+    in_if = merged['_merge'] != 'right_only'
+    if_rows = merged[in_if].sort_values('_order')
+    if_part = if_rows[COMPARISON_KEYS + COMPARISON_FEATURES].copy()
+    if_part.insert(2, 'dbscan_is_anomaly', (if_rows['_merge'] == 'both').values)
+    if_part.insert(3, 'isolation_forest_is_anomaly', True)
+
+    # Step 5: Rows found only by DBSCAN, in DBSCAN order, with DBSCAN's feature values
+    db_rows = merged[~in_if].sort_values('_order_dbscan')
+    db_part = db_rows[COMPARISON_KEYS].copy()
+    for col in COMPARISON_FEATURES:
+        db_part[col] = db_rows[f'{col}_dbscan'].values
+    db_part.insert(2, 'dbscan_is_anomaly', True)
+    db_part.insert(3, 'isolation_forest_is_anomaly', False)
 
     # Step 6: Create DataFrame from the comparison
-    comparison_df = pd.DataFrame(final_comparison)
+    comparison_df = pd.concat([if_part, db_part], ignore_index=True)
+    comparison_df['detected_by_both_models'] = comparison_df['dbscan_is_anomaly'] & comparison_df['isolation_forest_is_anomaly']
     print(f"✅ Comparison DataFrame created with shape: {comparison_df.shape}")
 
     # 🔎 Preview: Show the number of anomalies in each category
@@ -106,6 +72,12 @@ def compare_dbscan_and_anomaly(csv_dbscan="output/dbscan_clustering_results.csv"
     print(f"Anomalies detected only by Isolation Forest: {num_isolation}")
     print(f"Anomalies detected only by DBSCAN: {num_dbscan}")
 
+    _, pair_stats_df = compare_detectors(
+        {'isolation_forest': isolation_forest_anomalies, 'dbscan': dbscan_anomalies},
+        output_dir=output_dir
+    )
+    print(pair_stats_df[['detector_a', 'detector_b', 'overlap', 'jaccard']])
+
     # Step 7: Save the comparison DataFrame to CSV
     os.makedirs(output_dir, exist_ok=True)
     comparison_df.to_csv(os.path.join(output_dir, "dbscan_vs_isolation_forest_comparison.csv"), index=False)
@@ -135,3 +107,60 @@ def compare_dbscan_and_anomaly(csv_dbscan="output/dbscan_clustering_results.csv"
     plt.show()
 
     return comparison_df
+
+
+@instrumented()
+def compare_detectors(detections, keys=COMPARISON_KEYS, output_dir=None):
+    """
+    Compare the anomalies flagged by any number of detectors.
+
+    `detections` maps a detector name to a DataFrame holding the rows it flagged
+    (at least the `keys` columns). All flagged keys are stacked once and pivoted
+    into a boolean membership table, so the cost is linear in the number of
+    flagged rows rather than a pairwise scan.
+
+    Returns (membership_df, pair_stats_df). The pair stats hold, for every pair
+    of detectors, the overlap, union, Jaccard index and the precision of each
+    detector when the other one is taken as reference.
+    """
+    names = list(detections)
+    stacked = pd.concat(
+        [df[keys].drop_duplicates().assign(detector=name) for name, df in detections.items()],
+        ignore_index=True
+    )
+    membership_df = (
+        stacked.assign(flagged=True)
+        .pivot_table(index=keys, columns='detector', values='flagged', aggfunc='any', fill_value=False)
+        .reindex(columns=names, fill_value=False)
+        .astype(bool)
+        .reset_index()
+    )
+    membership_df.columns.name = None
+    membership_df['num_detectors'] = membership_df[names].sum(axis=1)
+
+    pair_stats = []
+    for a, b in combinations(names, 2):
+        count_a = int(membership_df[a].sum())
+        count_b = int(membership_df[b].sum())
+        overlap = int((membership_df[a] & membership_df[b]).sum())
+        union = count_a + count_b - overlap
+        pair_stats.append({
+            'detector_a': a,
+            'detector_b': b,
+            'count_a': count_a,
+            'count_b': count_b,
+            'overlap': overlap,
+            'union': union,
+            'jaccard': overlap / union if union else 0.0,
+            'precision_a_vs_b': overlap / count_a if count_a else 0.0,
+            'precision_b_vs_a': overlap / count_b if count_b else 0.0,
+        })
+    pair_stats_df = pd.DataFrame(pair_stats)
+
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+        membership_df.to_csv(os.path.join(output_dir, "detector_membership.csv"), index=False)
+        pair_stats_df.to_csv(os.path.join(output_dir, "detector_pair_stats.csv"), index=False)
+        print(f"✅ Detector comparison saved to {output_dir}/detector_pair_stats.csv")
+
+    return membership_df, pair_stats_df
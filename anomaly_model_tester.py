@@ -2,14 +2,34 @@ import pandas as pd
 import numpy as np
 import os
 import joblib
-from sklearn.ensemble import IsolationForest
+from compiled_forest import CompiledForest, load_compiled_forest
+from model_registry import ModelRegistry, REGISTRY_DIR
+from instrumentation import instrumented
 
 # ✅ Load trained model
 def load_model(path="output/isolation_forest_model.joblib"):
     if not os.path.exists(path):
         raise FileNotFoundError(f"❌ Model not found at {path}")
+    if path.endswith(".npz"):
+        return load_compiled_forest(path)
     return joblib.load(path)
 
+# ✅ Load a registered version (compiled node arrays, memory-mapped)
+def load_registered_model(version=None, registry_dir=REGISTRY_DIR, contamination=None):
+    """
+    CompiledForest of 'isolation_forest' `version` from the model registry
+    (default: the latest version). A `contamination` other than the trained
+    one re-sets the threshold from the version's stored score distribution.
+    """
+    entry = ModelRegistry(registry_dir).load('isolation_forest', version)
+    print(f"📦 Using isolation_forest v{entry.version} (trained {entry.metadata['created_at']})")
+    model = CompiledForest.from_arrays(entry.arrays)
+    if contamination is not None:
+        if 'score_distribution' not in entry.arrays:
+            raise ValueError(f"❌ isolation_forest v{entry.version} has no stored score distribution, retrain it")
+        model.offset_ = float(np.percentile(entry.arrays['score_distribution'], 100.0 * contamination))
+    return model
+
 # ✅ Create test samples (custom or synthetic)
 def generate_test_samples():
     """
@@ -33,6 +53,7 @@ def generate_test_samples():
     return pd.DataFrame(samples)
 
 # ✅ Run prediction
+@instrumented()
 def test_model_on_samples(model, test_df):
     """
     Test the trained Isolation Forest model on new data and return the results.
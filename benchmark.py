@@ -0,0 +1,428 @@
+import os
+import sys
+import json
+import time
+import shutil
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+from instrumentation import PeakRSS, current_rss_mb
+
+FEATURE_COLUMNS = ['total_time_sec', 'max_subtask_percent', 'sum_other_subtask_time', 'ratio_other_to_max']
+
+
+def _time_call(func, *args, repeat=3, **kwargs):
+    """Return (best wall time in seconds, last result) over `repeat` calls."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _measure(func, *args, trace_memory=False, **kwargs):
+    """
+    Run `func` once; return ({wall_sec, cpu_sec, rss_before_mb, peak_rss_mb}, result).
+    `trace_memory=True` adds tracemalloc's peak Python allocation (`peak_alloc_mb`),
+    which slows the call down considerably.
+    """
+    if trace_memory:
+        tracemalloc.start()
+    rss_before = current_rss_mb()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        with PeakRSS() as rss:
+            result = func(*args, **kwargs)
+    finally:
+        stats = {'wall_sec': time.perf_counter() - wall, 'cpu_sec': time.process_time() - cpu}
+        if trace_memory:
+            stats['peak_alloc_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+    stats['rss_before_mb'] = rss_before
+    stats['peak_rss_mb'] = rss.peak_mb
+    return stats, result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+
+def _save_results(results, output_json):
+    os.makedirs(os.path.dirname(output_json), exist_ok=True)
+    with open(output_json, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"💾 Benchmark results saved to {output_json}")
+
+
+def benchmark_compiled_forest(model_version=None,
+                              batch_sizes=(1, 10, 100, 1_000, 10_000, 100_000, 1_000_000),
+                              output_json="output/benchmarks/compiled_forest.json"):
+    """
+    Compare sklearn IsolationForest.decision_function against the compiled
+    node-array forest for batch sizes from 1 to 10^6 rows, using the
+    registered 'isolation_forest' `model_version` (default: latest).
+    """
+    from compiled_forest import compile_isolation_forest
+    from model_registry import ModelRegistry
+
+    model = ModelRegistry().load('isolation_forest', model_version).model
+    compiled = compile_isolation_forest(model)
+
+    rng = np.random.default_rng(0)
+    results = []
+    for n in batch_sizes:
+        X = pd.DataFrame(rng.lognormal(size=(n, len(FEATURE_COLUMNS))), columns=FEATURE_COLUMNS)
+        repeat = 3 if n <= 100_000 else 1
+
+        sklearn_sec, sklearn_scores = _time_call(model.decision_function, X, repeat=repeat)
+        compiled_sec, compiled_scores = _time_call(compiled.decision_function, X, repeat=repeat)
+
+        results.append({
+            'batch_size': n,
+            'sklearn_sec': sklearn_sec,
+            'compiled_sec': compiled_sec,
+            'speedup': sklearn_sec / compiled_sec if compiled_sec else None,
+            'max_abs_diff': float(np.abs(sklearn_scores - compiled_scores).max()),
+        })
+        print(f"⏱️ batch={n:>9}: sklearn {sklearn_sec:.4f}s | compiled {compiled_sec:.4f}s")
+
+    _save_results(results, output_json)
+    return pd.DataFrame(results)
+
+
+def _synthetic_received_event(n_items, kind='records', escaped=True):
+    """
+    'Received event result' message whose payload holds one array of `n_items`
+    elements: small records with strings (`kind='records'`) or plain IDs (`kind='ids'`).
+    """
+    if kind == 'records':
+        items = [{'FieldID': i, 'Value': f'value {i}, [x]'} for i in range(n_items)]
+    else:
+        items = list(range(n_items))
+    payload = json.dumps({'EventID': 1, 'Rows': items, 'Status': 'OK'})
+    if escaped:
+        payload = payload.replace('"', '\\"')
+    return f"Received event result from database: {payload}"
+
+
+def _legacy_large_arrays(messages, array_length_threshold):
+    """Baseline: regex + unescape + json.loads of every payload (the previous Task 3 approach)."""
+    import re
+    found = 0
+    for msg in messages:
+        match = re.search(r"Received event result from database: ({.*})", msg)
+        parsed = json.loads(match.group(1).replace('\\"', '"').replace("\\'", "'"))
+        found += sum(isinstance(v, list) and len(v) > array_length_threshold for v in parsed.values())
+    return found
+
+
+def benchmark_large_array_check(items_per_payload=(1_000, 10_000, 50_000, 200_000, 1_000_000), n_rows=8,
+                                kinds=('records', 'ids'), array_length_threshold=500,
+                                output_json="output/benchmarks/large_array_check.json"):
+    """
+    Time Task 3 on multi-MB 'Received event result' payloads: json.loads
+    baseline vs the bracket-depth scanner (exact and stop-at-threshold).
+    """
+    from large_array_check import detect_large_json_arrays
+
+    results = []
+    for kind, n_items in ((k, n) for k in kinds for n in items_per_payload):
+        messages = [_synthetic_received_event(n_items, kind) for _ in range(n_rows)]
+        df = pd.DataFrame({'line.message': messages, 'line.mdc.trace_id': 'bench', 'timestamp_raw': 0})
+        payload_mb = len(messages[0]) / 1e6
+
+        legacy_sec, _ = _time_call(_legacy_large_arrays, messages, array_length_threshold)
+        scan_sec, _ = _time_call(detect_large_json_arrays, df, array_length_threshold, n_jobs=1,
+                                 stop_at_threshold=False)
+        early_sec, _ = _time_call(detect_large_json_arrays, df, array_length_threshold, n_jobs=1)
+
+        results.append({
+            'payload_kind': kind,
+            'items_per_payload': n_items,
+            'payload_mb': payload_mb,
+            'rows': n_rows,
+            'json_loads_sec': legacy_sec,
+            'scanner_sec': scan_sec,
+            'scanner_early_exit_sec': early_sec,
+        })
+        print(f"⏱️ {kind} {payload_mb:.1f} MB x {n_rows}: json.loads {legacy_sec:.3f}s | "
+              f"scanner {scan_sec:.3f}s | early exit {early_sec:.3f}s")
+
+    _save_results(results, output_json)
+    return pd.DataFrame(results)
+
+
+def _pipeline_stages(data_dir, store, frames):
+    """(name, callable) for every pipeline stage; callables share state through `frames`."""
+    from load_and_parse import load_all_logs
+    from preprocess import clean_logs
+    from global_stats import analyze_execute_event_flat, analyze_execute_event_hierarchy
+    from stopwatch import extract_stopwatch_tasks
+    from large_array_check import detect_large_json_arrays
+    from task2_anomaly_features import build_stopwatch_features
+    from anomaly_detection import run_isolation_forest
+
+    def load():
+        frames['raw'] = load_all_logs(data_dir)
+        return frames['raw']
+
+    def clean():
+        frames['parsed'], store['payloads'] = clean_logs(frames['raw'], return_store=True)
+        return frames['parsed']
+
+    def feature_engineering():
+        from feature_engineering import process
+        process("output/task2_stopwatch_features.csv", "output/preprocessed_clustering_features.csv")
+
+    def dbscan():
+        from dbscan_clustering import run_dbscan_clustering
+        return run_dbscan_clustering()
+
+    def comparison():
+        from anomaly_detection_vs_dbscan import compare_dbscan_and_anomaly
+        return compare_dbscan_and_anomaly()
+
+    return [
+        ('load_all_logs', load),
+        ('clean_logs', clean),
+        ('task1_flat', lambda: analyze_execute_event_flat(frames['parsed'])),
+        ('task1_hierarchy', lambda: analyze_execute_event_hierarchy(frames['parsed'])),
+        ('task2_stopwatch', lambda: extract_stopwatch_tasks(frames['parsed'], store=store['payloads'])),
+        ('task3_large_arrays', lambda: detect_large_json_arrays(frames['parsed'], store=store['payloads'])),
+        ('stopwatch_features', build_stopwatch_features),
+        ('isolation_forest', run_isolation_forest),
+        ('feature_engineering', feature_engineering),
+        ('dbscan', dbscan),
+        ('comparison', comparison),
+    ]
+
+
+def benchmark_pipeline(n_records=20_000, n_files=4, anomaly_rate=0.01, large_array_rate=0.02,
+                       large_array_size=1_000, data_dir=None, work_dir="output/benchmarks/pipeline_run",
+                       trace_memory=False, output_json=None, seed=42):
+    """
+    Time and memory-profile every pipeline stage on synthetic logs (or on
+    `data_dir` if given): wall and CPU time, peak RSS while the stage runs and,
+    with `trace_memory=True`, tracemalloc's allocation peak. Stages run inside `work_dir`, so their hard-coded
+    `output/` files do not overwrite real results. A failing stage (e.g. a
+    missing optional dependency) is recorded with its error and the run
+    continues. Results are saved as `output/benchmarks/pipeline_<commit>.json`
+    for `compare_benchmark_results`.
+    """
+    from log_generator import generate_synthetic_logs
+    from load_and_parse import log_file_type
+
+    commit = _git_commit()
+    output_json = os.path.abspath(output_json or f"output/benchmarks/pipeline_{commit}.json")
+    work_dir = os.path.abspath(work_dir)
+    if data_dir is None:
+        data_dir = os.path.join(work_dir, "data")
+        generate_synthetic_logs(data_dir, n_records, n_files, anomaly_rate, large_array_rate,
+                                large_array_size, seed=seed)
+    data_dir = os.path.abspath(data_dir)
+    data_mb = sum(os.path.getsize(os.path.join(data_dir, f)) for f in os.listdir(data_dir) if log_file_type(f)) / 1e6
+
+    results = []
+    store, frames = {}, {}
+    previous_dir = os.getcwd()
+    os.makedirs(os.path.join(work_dir, "output", "figures"), exist_ok=True)
+    os.chdir(work_dir)
+    try:
+        for name, stage in _pipeline_stages(data_dir, store, frames):
+            try:
+                stats, result = _measure(stage, trace_memory=trace_memory)
+                stats['rows_out'] = len(result) if isinstance(result, pd.DataFrame) else None
+                stats['error'] = None
+            except Exception as e:
+                stats = {'wall_sec': None, 'rows_out': None, 'error': f"{type(e).__name__}: {e}"}
+            results.append({'stage': name, **stats})
+            status = f"{stats['wall_sec']:.3f}s" if stats['error'] is None else f"failed ({stats['error']})"
+            print(f"⏱️ {name}: {status}")
+    finally:
+        os.chdir(previous_dir)
+
+    report = {
+        'commit': commit,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {
+            'n_records': n_records, 'n_files': n_files, 'anomaly_rate': anomaly_rate,
+            'large_array_rate': large_array_rate, 'large_array_size': large_array_size,
+            'data_mb': data_mb, 'seed': seed,
+        },
+        'stages': results,
+    }
+    _save_results(report, output_json)
+    return pd.DataFrame(results)
+
+
+def compare_benchmark_results(baseline_json, current_json):
+    """Per-stage time and peak memory of two `benchmark_pipeline` runs, with current/baseline ratios."""
+    with open(baseline_json, encoding='utf-8') as f:
+        baseline = pd.DataFrame(json.load(f)['stages']).set_index('stage')
+    with open(current_json, encoding='utf-8') as f:
+        current = pd.DataFrame(json.load(f)['stages']).set_index('stage')
+
+    columns = [col for col in ('wall_sec', 'cpu_sec', 'peak_rss_mb', 'peak_alloc_mb')
+               if col in baseline.columns and col in current.columns]
+    comparison = baseline[columns].join(current[columns], lsuffix='_baseline', rsuffix='_current', how='outer')
+    comparison = comparison.reindex(baseline.index.append(current.index.difference(baseline.index)))
+    for col in columns:
+        comparison[f"{col}_ratio"] = comparison[f"{col}_current"] / comparison[f"{col}_baseline"]
+    return comparison.reset_index()
+
+
+HEAVY_MODULES = ('torch', 'sentence_transformers', 'sklearn', 'scipy', 'matplotlib', 'seaborn')
+
+
+def _startup_run(command, cwd):
+    """Wall time and heavy top-level packages imported by one fresh interpreter."""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime'] + command, cwd=cwd, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    # -X importtime lines: "import time: self [us] | cumulative | imported package"
+    imported = {line.rsplit('|', 1)[-1].strip().split('.')[0]
+                for line in proc.stderr.splitlines() if line.startswith('import time:')}
+    return wall, proc.returncode, sorted(imported & set(HEAVY_MODULES))
+
+
+def benchmark_startup(commands=('score', 'ingest', 'analyze', 'train', 'compare'), repeat=5,
+                      output_json="output/benchmarks/startup.json"):
+    """
+    Cold-start cost of each CLI subcommand: a fresh interpreter runs
+    `cli.py <command> --import-only` (parse args + import the stage's modules)
+    `repeat` times. `import main` (everything imported up front) is the
+    baseline. Records the median wall time and which heavy packages
+    (torch, sklearn, matplotlib, ...) each command pulled in.
+    """
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    runs = [('import main', ['-c', 'import main'])]
+    runs += [(f"cli {name}", ['cli.py', '--import-only', name]) for name in commands]
+
+    results = []
+    for label, command in runs:
+        walls, returncode, heavy = [], 0, []
+        for _ in range(repeat):
+            wall, returncode, heavy = _startup_run(command, repo_dir)
+            walls.append(wall)
+        results.append({'command': label, 'median_sec': float(np.median(walls)), 'min_sec': min(walls),
+                        'ok': returncode == 0, 'heavy_imports': heavy})
+        print(f"🚀 {label}: {np.median(walls):.2f}s (heavy imports: {', '.join(heavy) or 'none'})")
+
+    _save_results({'commit': _git_commit(), 'repeat': repeat, 'runs': results}, output_json)
+    return pd.DataFrame(results)
+
+
+def _write_variant(src_path, dst_path, jsonl, compression):
+    """Copy a generated `.json` log file as JSON lines and/or compressed."""
+    with open(src_path, encoding='utf-8') as f:
+        text = "".join(json.dumps(record) + "\n" for record in json.load(f)) if jsonl else f.read()
+    data = text.encode('utf-8')
+    if compression == '.gz':
+        import gzip
+        data = gzip.compress(data, compresslevel=6)
+    elif compression == '.bz2':
+        import bz2
+        data = bz2.compress(data)
+    elif compression == '.zst':
+        try:
+            import zstandard
+            data = zstandard.ZstdCompressor(level=3).compress(data)
+        except ImportError:
+            data = subprocess.run(['zstd', '-q', '-c', '-3'], input=data, capture_output=True, check=True).stdout
+    with open(dst_path, 'wb') as f:
+        f.write(data)
+
+
+def benchmark_compressed_loading(n_records=20_000, n_files=4, compressions=('.gz', '.bz2', '.zst'), repeat=3,
+                                 n_jobs=-1, work_dir="output/benchmarks/compressed_run",
+                                 output_json="output/benchmarks/compressed_loading.json", seed=42):
+    """
+    `load_all_logs` throughput on the same synthetic logs stored as plain
+    .json (the pre-decompressed baseline), .jsonl and each compression of both.
+    Records best-of-`repeat` time, MB/s of uncompressed JSON, size on disk
+    and the decompressor used (external command or Python module).
+    """
+    from load_and_parse import load_all_logs, EXTERNAL_DECOMPRESSORS
+    from log_generator import generate_synthetic_logs
+
+    plain_dir = os.path.join(work_dir, "plain")
+    source_files = generate_synthetic_logs(plain_dir, n_records, n_files, seed=seed)
+    raw_mb = sum(os.path.getsize(path) for path in source_files) / 1e6
+
+    variants = [('.json', None), ('.jsonl', None)]
+    variants += [(log_format, compression) for compression in compressions for log_format in ('.json', '.jsonl')]
+    results = []
+    for log_format, compression in variants:
+        suffix = log_format + (compression or '')
+        if (log_format, compression) == ('.json', None):
+            data_dir = plain_dir
+        else:
+            data_dir = os.path.join(work_dir, suffix.lstrip('.').replace('.', '_'))
+            os.makedirs(data_dir, exist_ok=True)
+            for path in source_files:
+                name = os.path.splitext(os.path.basename(path))[0] + suffix
+                _write_variant(path, os.path.join(data_dir, name), log_format == '.jsonl', compression)
+
+        seconds, df_logs = _time_call(load_all_logs, data_dir, n_jobs=n_jobs, repeat=repeat)
+        disk_mb = sum(os.path.getsize(os.path.join(data_dir, f)) for f in os.listdir(data_dir)) / 1e6
+        decompressor = None
+        if compression is not None:
+            command = EXTERNAL_DECOMPRESSORS[compression][0]
+            decompressor = command if shutil.which(command) else 'python'
+        results.append({
+            'format': suffix,
+            'decompressor': decompressor,
+            'disk_mb': disk_mb,
+            'load_sec': seconds,
+            'mb_per_sec': raw_mb / seconds,
+            'rows': len(df_logs),
+        })
+        print(f"📦 {suffix}: {seconds:.2f}s ({raw_mb / seconds:.1f} MB/s, {disk_mb:.1f} MB on disk)")
+
+    baseline = results[0]['load_sec']
+    for result in results:
+        result['relative_to_plain'] = result['load_sec'] / baseline
+    _save_results({'commit': _git_commit(), 'n_records': n_records, 'n_files': n_files, 'raw_mb': raw_mb,
+                   'results': results}, output_json)
+    return pd.DataFrame(results)
+
+
+def benchmark_isolation_forest_training(row_counts=(10_000, 100_000, 1_000_000), n_jobs=(1, 2, 4, -1),
+                                        max_train_rows=100_000,
+                                        output_json="output/benchmarks/isolation_forest_training.json"):
+    """
+    `train_isolation_forest` time vs. feature rows and cores, fitting on all
+    rows and (when larger) on a `max_train_rows` reservoir sample. Times
+    include scoring every row to set the contamination threshold.
+    """
+    from anomaly_detection import train_isolation_forest
+
+    rng = np.random.default_rng(0)
+    results = []
+    for n in row_counts:
+        X = pd.DataFrame(rng.lognormal(size=(n, len(FEATURE_COLUMNS))), columns=FEATURE_COLUMNS)
+        samples = (None, max_train_rows) if max_train_rows is not None and n > max_train_rows else (None,)
+        for jobs in n_jobs:
+            for sample in samples:
+                seconds, _ = _time_call(train_isolation_forest, X, n_jobs=jobs, max_train_rows=sample, repeat=1)
+                results.append({'rows': n, 'n_jobs': jobs, 'max_train_rows': sample, 'train_sec': seconds})
+                print(f"🌲 rows={n:>9} n_jobs={jobs:>2} sample={sample}: {seconds:.2f}s")
+
+    _save_results({'commit': _git_commit(), 'cpu_count': os.cpu_count(), 'results': results}, output_json)
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    print(benchmark_pipeline())
+    print(benchmark_compiled_forest())
+    print(benchmark_large_array_check())
+    print(benchmark_startup())
+    print(benchmark_compressed_loading())
+    print(benchmark_isolation_forest_training())
@@ -0,0 +1,283 @@
+"""
+Command-line entry point with one subcommand per pipeline stage:
+
+    python cli.py ingest  --data-dir data        # parse + clean into the date-partitioned log store (--full: all columns)
+    python cli.py analyze --start 2024-01-31     # Tasks 1-3, traces, time-series alerts, EDA
+    python cli.py train                          # features, Isolation Forest, DBSCAN
+    python cli.py score   --data-dir new_logs    # score a new batch with the trained model
+    python cli.py compare                        # DBSCAN vs Isolation Forest
+
+Heavy dependencies (matplotlib/seaborn, sklearn, sentence_transformers/torch)
+are imported inside the stages that use them, so `score` starts with only
+pandas/numpy loaded.
+"""
+import os
+import sys
+import time
+import argparse
+
+LOG_STORE_PATH = "output/log_store"
+TEMPLATE_MINER_PATH = "output/template_miner.json"
+
+
+def _open_log_store(args):
+    """LogStoreReader over the partitions written by `ingest`, limited to --start/--end."""
+    from log_store import LogStoreReader
+
+    if not os.path.exists(LOG_STORE_PATH):
+        raise FileNotFoundError(f"❌ {LOG_STORE_PATH} not found, run `python cli.py ingest` first")
+    reader = LogStoreReader(LOG_STORE_PATH, start=args.start, end=args.end)
+    print(f"📂 Reading {len(reader.partitions())} partitions from {LOG_STORE_PATH}")
+    return reader
+
+
+def ingest(args):
+    from load_and_parse import load_all_logs
+    from preprocess import clean_logs
+    from template_miner import load_or_create_miner
+    from dtype_optimizer import optimize_dtypes
+    from log_store import write_log_store
+    from projection import projection_for
+    if args.import_only:
+        return
+
+    # Only the columns `analyze` and `train` read, unless --full (full-width EDA summary)
+    projection = projection_for(full=args.full)
+    print("📥 Loading and parsing logs...")
+    df_logs = load_all_logs(args.data_dir, projection=projection)
+    template_miner = load_or_create_miner(TEMPLATE_MINER_PATH)
+    df_logs_parsed, payload_store = clean_logs(df_logs, return_store=True, template_miner=template_miner,
+                                               projection=projection)
+    df_logs_parsed, _ = optimize_dtypes(df_logs_parsed, report_csv="output/dtype_report.csv")
+
+    template_miner.save(TEMPLATE_MINER_PATH)
+    template_miner.template_table().to_csv("output/log_templates.csv", index=False)
+    write_log_store(df_logs_parsed, payload_store, LOG_STORE_PATH,
+                    partition_by_message_type=args.partition_by_message_type)
+    print(f"✅ Parsed log shape: {df_logs_parsed.shape}")
+
+
+def analyze(args):
+    from global_stats import analyze_execute_event_flat, analyze_execute_event_hierarchy, plot_execute_event_combinations
+    from stopwatch import extract_stopwatch_tasks, plot_stopwatch_analysis
+    from quantile_sketch import LatencySketches
+    from large_array_check import detect_large_json_arrays
+    from trace_sessions import build_trace_index, build_trace_features
+    from timeseries_monitor import detect_time_series_anomalies
+    from template_miner import load_or_create_miner
+    from eda import (
+        summarize_columns, plot_log_volume_over_time, plot_status_and_loggers,
+        extract_top_keywords, plot_top_templates,
+    )
+    if args.import_only:
+        return
+
+    reader = _open_log_store(args)
+
+    print("\n📊 Running Task 1: Occurrence Counts (Flat + Hierarchy)...")
+    event_index = reader.event_index()
+    analyze_execute_event_flat(reader, index=event_index)
+    analyze_execute_event_hierarchy(reader)
+
+    print("\n⏱️ Running Task 2: Stopwatch Timing Breakdown...")
+    latency_sketches = LatencySketches()
+    df_task2 = extract_stopwatch_tasks(reader, sketches=latency_sketches)
+    latency_sketches.save("output/latency_sketches")
+    latency_sketches.quantile_table('stopwatch_total').to_csv("output/task2_stopwatch_latency_quantiles.csv", index=False)
+
+    print("\n📦 Running Task 3: Large Array Detection...")
+    detect_large_json_arrays(reader)
+
+    print("\n🧵 Sessionizing logs by trace...")
+    build_trace_features(reader, index=build_trace_index(reader))
+    detect_time_series_anomalies(reader)
+
+    print("\n🔎 Running EDA...")
+    # Column statistics were aggregated per partition at ingest time, so the
+    # full-width frame is never read back; only the messages are
+    eda_aggregates = reader.eda_aggregates()
+    summarize_columns(aggregates=eda_aggregates)
+    df_messages, _ = reader.read(columns=['line.message'])
+    extract_top_keywords(df_messages)
+
+    if not args.no_plots:
+        plot_execute_event_combinations(reader, index=event_index)
+        plot_stopwatch_analysis(df_task2, sketches=latency_sketches)
+        plot_log_volume_over_time(aggregates=eda_aggregates)
+        plot_status_and_loggers(aggregates=eda_aggregates)
+        plot_top_templates(template_miner=load_or_create_miner(TEMPLATE_MINER_PATH), aggregates=eda_aggregates)
+    print("\n✅ Analysis completed")
+
+
+def train(args):
+    from task2_anomaly_features import build_stopwatch_features
+    from anomaly_detection import run_isolation_forest, plot_anomaly_scores
+    from feature_engineering import process as feature_engineering_process
+    from dbscan_clustering import run_dbscan_clustering, plot_dbscan_clusters
+    from shared_features import run_models_shared
+    from subtask_timings import build_subtask_timing_matrix, run_subtask_models
+    if args.import_only:
+        return
+
+    build_stopwatch_features(_open_log_store(args))
+    build_subtask_timing_matrix(n_hash_features=args.subtask_hash_features)
+
+    if args.shared_memory:
+        feature_engineering_process()
+        print("\n🧵 Training Isolation Forest and tuning DBSCAN in shared memory...")
+        anomaly_df, dbscan_df = run_models_shared(contamination=args.contamination,
+                                                  max_train_rows=args.max_train_rows, n_workers=args.workers)
+    else:
+        print("\n🚨 Training Isolation Forest...")
+        anomaly_df = run_isolation_forest("output/task2_stopwatch_features.csv", contamination=args.contamination,
+                                          n_jobs=args.n_jobs, max_train_rows=args.max_train_rows)
+
+        print("\n🔍 Running DBSCAN Clustering...")
+        feature_engineering_process()
+        dbscan_df = run_dbscan_clustering()
+
+    if args.subtask_models:
+        print("\n🧮 Training on the sparse subtask timing matrix...")
+        run_subtask_models(contamination=args.contamination, n_jobs=args.n_jobs, max_train_rows=args.max_train_rows)
+
+    if not args.no_plots:
+        os.makedirs("output/figures", exist_ok=True)
+        plot_anomaly_scores(anomaly_df)
+        plot_dbscan_clusters(dbscan_df)
+    print("\n✅ Training completed")
+
+
+def score(args):
+    import pandas as pd
+    from load_and_parse import load_all_logs
+    from preprocess import clean_logs
+    from stopwatch import extract_stopwatch_tasks
+    from task2_anomaly_features import build_stopwatch_features
+    from anomaly_model_tester import load_model, load_registered_model, test_model_on_samples
+    from compiled_forest import CompiledForest, compile_isolation_forest, explain_anomalies
+    from anomaly_detection import FEATURE_COLUMNS
+    from projection import projection_for
+    if args.import_only:
+        return
+
+    details_csv = os.path.join(args.output_dir, "task2_stopwatch_details.csv")
+    features_csv = os.path.join(args.output_dir, "task2_stopwatch_features.csv")
+
+    projection = projection_for(['task2'])
+    df_logs = load_all_logs(args.data_dir, projection=projection)
+    df_logs_parsed, payload_store = clean_logs(df_logs, return_store=True, projection=projection)
+    extract_stopwatch_tasks(df_logs_parsed, output_csv=details_csv, store=payload_store)
+    build_stopwatch_features(input_path=details_csv, output_csv=features_csv)
+
+    df_features = pd.read_csv(features_csv).dropna(subset=['ratio_other_to_max'])
+    if args.model:
+        model = load_model(args.model)
+    else:
+        model = load_registered_model(args.model_version, contamination=args.contamination)
+    results = test_model_on_samples(model, df_features)
+    results['is_anomaly'] = results['prediction'] == -1
+    forest = model if isinstance(model, CompiledForest) else compile_isolation_forest(model)
+    results = explain_anomalies(results, forest, FEATURE_COLUMNS, results['is_anomaly'])
+
+    results.to_csv(os.path.join(args.output_dir, "anomaly_results.csv"), index=False)
+    results[results['is_anomaly']].to_csv(os.path.join(args.output_dir, "anomalies_detected.csv"), index=False)
+    print(f"🚨 {int(results['is_anomaly'].sum())} of {len(results)} StopWatch blocks flagged, "
+          f"results saved to {args.output_dir}")
+
+
+def ensemble(args):
+    from ensemble_scoring import run_ensemble_scoring
+    if args.import_only:
+        return
+
+    run_ensemble_scoring(args.features_csv, detectors=args.detectors, weights=args.weights,
+                         contamination=args.contamination)
+
+
+def compare(args):
+    from anomaly_detection_vs_dbscan import compare_dbscan_and_anomaly
+    if args.import_only:
+        return
+
+    compare_dbscan_and_anomaly(csv_dbscan=args.dbscan_csv, csv_anomaly=args.anomaly_csv)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Log anomaly detection pipeline")
+    parser.add_argument('--metrics', action='store_true',
+                        help="record per-stage metrics (same as PIPELINE_METRICS=1)")
+    # Import the stage's modules and exit (used by benchmark_startup)
+    parser.add_argument('--import-only', action='store_true', help=argparse.SUPPRESS)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = subparsers.add_parser('ingest', help="load, clean and save the parsed logs")
+    ingest_parser.add_argument('--data-dir', default="data")
+    ingest_parser.add_argument('--partition-by-message-type', action='store_true')
+    ingest_parser.add_argument('--full', action='store_true',
+                               help="keep every flattened column instead of only those later stages read")
+    ingest_parser.set_defaults(func=ingest)
+
+    analyze_parser = subparsers.add_parser('analyze', help="Tasks 1-3, traces, time-series alerts and EDA")
+    analyze_parser.add_argument('--start', help="first day/time to read from the log store (inclusive)")
+    analyze_parser.add_argument('--end', help="last day/time to read from the log store (exclusive)")
+    analyze_parser.add_argument('--no-plots', action='store_true')
+    analyze_parser.set_defaults(func=analyze)
+
+    train_parser = subparsers.add_parser('train', help="build features, train Isolation Forest and DBSCAN")
+    train_parser.add_argument('--start', help="first day/time to train on (inclusive)")
+    train_parser.add_argument('--end', help="last day/time to train on (exclusive)")
+    train_parser.add_argument('--contamination', type=float, default=0.01)
+    train_parser.add_argument('--n-jobs', type=int, default=-1, help="cores used to build the trees")
+    train_parser.add_argument('--max-train-rows', type=int, default=None,
+                              help="fit on a reservoir sample of at most this many feature rows")
+    train_parser.add_argument('--shared-memory', action='store_true',
+                              help="train Isolation Forest and every DBSCAN candidate in worker processes "
+                                   "sharing one copy of the feature matrices")
+    train_parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    train_parser.add_argument('--subtask-hash-features', type=int, default=None,
+                              help="hash subtask names into N timing-matrix columns (default: one column per name)")
+    train_parser.add_argument('--subtask-models', action='store_true',
+                              help="also train Isolation Forest and DBSCAN on the sparse subtask timing matrix")
+    train_parser.add_argument('--no-plots', action='store_true')
+    train_parser.set_defaults(func=train)
+
+    score_parser = subparsers.add_parser('score', help="score a new batch of logs with the trained model")
+    score_parser.add_argument('--data-dir', default="test_data")
+    score_parser.add_argument('--model-version', type=int, default=None,
+                              help="registered isolation_forest version (default: latest)")
+    score_parser.add_argument('--model', default=None, help="score with a model file instead of the registry")
+    score_parser.add_argument('--contamination', type=float, default=None,
+                              help="re-set the threshold from the stored training scores (default: as trained)")
+    score_parser.add_argument('--output-dir', default="test_result")
+    score_parser.set_defaults(func=score)
+
+    ensemble_parser = subparsers.add_parser('ensemble', help="score the stopwatch features with a detector ensemble")
+    ensemble_parser.add_argument('--features-csv', default="output/task2_stopwatch_features.csv")
+    ensemble_parser.add_argument('--detectors', nargs='+', default=['isolation_forest', 'dbscan_core_distance',
+                                                                     'robust_zscore', 'lof'])
+    ensemble_parser.add_argument('--weights', nargs='+', type=float, default=None,
+                                 help="one weight per detector for the combined score (default: equal)")
+    ensemble_parser.add_argument('--contamination', type=float, default=0.01)
+    ensemble_parser.set_defaults(func=ensemble)
+
+    compare_parser = subparsers.add_parser('compare', help="compare DBSCAN and Isolation Forest anomalies")
+    compare_parser.add_argument('--dbscan-csv', default="output/dbscan_clustering_results.csv")
+    compare_parser.add_argument('--anomaly-csv', default="output/anomaly_results.csv")
+    compare_parser.set_defaults(func=compare)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.metrics:
+        from instrumentation import configure
+        configure(enabled=True)
+
+    start = time.perf_counter()
+    args.func(args)
+    if not args.import_only:
+        print(f"⏱️ {args.command} finished in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,312 @@
+import os
+import numpy as np
+
+
+def _average_path_length(n_samples_leaf):
+    """
+    Average path length of an unsuccessful BST search in a tree built on
+    `n_samples_leaf` samples (same correction term sklearn uses).
+    """
+    n = np.asarray(n_samples_leaf, dtype=np.float64)
+    result = np.zeros_like(n)
+    result[n == 2] = 1.0
+    mask = n > 2
+    result[mask] = 2.0 * (np.log(n[mask] - 1.0) + np.euler_gamma) - 2.0 * (n[mask] - 1.0) / n[mask]
+    return result
+
+
+def _cell_lookup(X_chunk):
+    """
+    Function mapping flat cell indices (row * n_features + feature) of a chunk
+    to its values. Dense chunks are indexed directly; CSR chunks are searched
+    in their sorted stored-entry keys, with absent entries read as 0 (as
+    sklearn trees treat sparse input), so they are never densified.
+    """
+    if not hasattr(X_chunk, "indptr"):
+        return X_chunk.ravel().__getitem__
+
+    n_rows, n_features = X_chunk.shape
+    entry_cells = (np.repeat(np.arange(n_rows, dtype=np.intp) * n_features, np.diff(X_chunk.indptr))
+                   + X_chunk.indices)
+    entry_values = np.append(X_chunk.data, np.float32(0))
+
+    def lookup(cells):
+        pos = np.searchsorted(entry_cells, cells)
+        found = entry_cells[np.minimum(pos, len(entry_cells) - 1)] == cells if len(entry_cells) else False
+        return entry_values[np.where(found, pos, len(entry_cells))]
+    return lookup
+
+
+def _has_nan(X):
+    return bool(np.isnan(X.data if hasattr(X, "indptr") else X).any())
+
+
+def _breadth_first_order(children_left, children_right):
+    """
+    Renumber tree nodes breadth-first so that every right child sits directly
+    after its left sibling. Returns (order, depth) where `order[new_id]` is the
+    original node id and `depth` counts the root as 1 (matches sklearn's
+    decision path length).
+    """
+    order = [0]
+    depth = [1.0]
+    head = 0
+    while head < len(order):
+        node = order[head]
+        if children_left[node] != -1:
+            order.extend((children_left[node], children_right[node]))
+            depth.extend((depth[head] + 1.0, depth[head] + 1.0))
+        head += 1
+    return np.asarray(order, dtype=np.intp), np.asarray(depth, dtype=np.float64)
+
+
+class CompiledForest:
+    """
+    Isolation Forest flattened into contiguous NumPy node arrays.
+
+    All trees are stored back to back in breadth-first order; `roots` holds the
+    offset of each tree's root node and a right child is always `left + 1`.
+    Leaves point to themselves with an infinite threshold, so every sample can
+    be walked a fixed number of steps over the whole batch without per-tree
+    Python work.
+    """
+
+    def __init__(self, feature, threshold, left, missing_left, leaf_value,
+                 roots, max_depth, denominator, offset, feature_names=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.missing_left = missing_left
+        self.leaf_value = leaf_value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.denominator = float(denominator)
+        self.offset_ = float(offset)
+        self.feature_names = list(feature_names) if feature_names is not None else None
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    def _to_array(self, X):
+        if hasattr(X, "tocsr"):
+            # Sparse rows are scored in place, see _cell_lookup
+            X = X.tocsr().astype(np.float32)
+            X.sort_indices()
+            return X
+        if self.feature_names is not None and hasattr(X, "columns"):
+            X = X[self.feature_names]
+        # sklearn trees compare float32 inputs against float64 thresholds
+        return np.ascontiguousarray(np.asarray(X, dtype=np.float32))
+
+    def _descend(self, X_chunk, has_nan, split_features=None):
+        """
+        Leaf node of every (row, tree) for a chunk of rows. With
+        `split_features` (max_depth x rows x trees), also records the feature
+        split on at each step, or -1 once the row has reached its leaf.
+        """
+        n_rows, n_features = X_chunk.shape
+        lookup = _cell_lookup(X_chunk)
+        # Offset of each row in the flattened chunk, broadcast over trees
+        row_base = (np.arange(n_rows, dtype=np.intp) * n_features)[:, None]
+        nodes = np.broadcast_to(self.roots, (n_rows, self.n_estimators)).copy()
+
+        for step in range(self.max_depth):
+            if split_features is not None:
+                split_features[step] = np.where(self.left[nodes] == nodes, -1, self.feature[nodes])
+            values = lookup(row_base + self.feature[nodes])
+            go_right = values > self.threshold[nodes]
+            if has_nan:
+                go_right = np.where(np.isnan(values), ~self.missing_left[nodes], go_right)
+            nodes = self.left[nodes] + go_right
+        return nodes
+
+    def _default_chunk_size(self):
+        # Keep the (rows x trees) node matrix cache-sized (~64K entries)
+        return max(1, (1 << 16) // max(self.n_estimators, 1))
+
+    def _path_lengths(self, X, chunk_size):
+        depths = np.zeros(X.shape[0], dtype=np.float64)
+        has_nan = _has_nan(X)
+        for start in range(0, X.shape[0], chunk_size):
+            nodes = self._descend(X[start:start + chunk_size], has_nan)
+            depths[start:start + chunk_size] = self.leaf_value[nodes].sum(axis=1)
+        return depths
+
+    def path_contributions(self, X, chunk_size=None):
+        """
+        (rows x features) attribution of each row's path-length deficit: in
+        every tree, the gap between the average path length c(max_samples)
+        and the row's path length is split evenly over the splits on its
+        path and credited to their features, then averaged over trees. A row
+        sums to c(max_samples) - E[h(x)], so large positive values mark the
+        features that isolated an anomaly quickly. Cost is linear in the rows
+        passed in, so pass only the rows to explain.
+        """
+        X = self._to_array(X)
+        n_samples, n_features = X.shape
+        chunk_size = chunk_size or self._default_chunk_size()
+        has_nan = _has_nan(X)
+        contributions = np.zeros((n_samples, n_features), dtype=np.float64)
+
+        for start in range(0, n_samples, chunk_size):
+            X_chunk = X[start:start + chunk_size]
+            n_rows = X_chunk.shape[0]
+            split_features = np.empty((self.max_depth, n_rows, self.n_estimators), dtype=np.intp)
+            nodes = self._descend(X_chunk, has_nan, split_features)
+
+            on_path = split_features >= 0
+            n_splits = on_path.sum(axis=0)
+            deficit = self.denominator - self.leaf_value[nodes]
+            weight = np.broadcast_to(np.where(n_splits > 0, deficit / np.maximum(n_splits, 1), 0.0),
+                                     split_features.shape)
+            cell = (np.arange(n_rows, dtype=np.intp) * n_features)[None, :, None] + split_features
+            contributions[start:start + n_rows] = np.bincount(
+                cell[on_path], weights=weight[on_path], minlength=n_rows * n_features,
+            ).reshape(n_rows, n_features)
+        return contributions / max(self.n_estimators, 1)
+
+    def score_samples(self, X, chunk_size=None):
+        """Opposite of the anomaly score, identical to IsolationForest.score_samples."""
+        X = self._to_array(X)
+        depths = self._path_lengths(X, chunk_size or self._default_chunk_size())
+
+        denominator = self.n_estimators * self.denominator
+        if denominator == 0:
+            return -np.ones_like(depths)
+        return -(2 ** (-depths / denominator))
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.offset_
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+    def to_arrays(self):
+        """Node arrays and scalars as a dict of NumPy arrays (the saved form)."""
+        return {
+            'feature': self.feature,
+            'threshold': self.threshold,
+            'left': self.left,
+            'missing_left': self.missing_left,
+            'leaf_value': self.leaf_value,
+            'roots': self.roots,
+            'max_depth': np.asarray(self.max_depth),
+            'denominator': np.asarray(self.denominator),
+            'offset': np.asarray(self.offset_),
+            'feature_names': np.array(self.feature_names or [], dtype=str),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Inverse of `to_arrays`; memory-mapped arrays are used in place."""
+        fields = {name: np.asarray(arrays[name]) for name in
+                  ('feature', 'threshold', 'left', 'missing_left', 'leaf_value', 'roots')}
+        return cls(
+            max_depth=arrays['max_depth'],
+            denominator=arrays['denominator'],
+            offset=arrays['offset'],
+            feature_names=np.asarray(arrays['feature_names']).tolist() or None,
+            **fields,
+        )
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(path, **self.to_arrays())
+
+
+def compile_isolation_forest(model, feature_names=None):
+    """
+    Flatten a fitted sklearn IsolationForest into a CompiledForest.
+    Node features are remapped to the global column order, so per-tree feature
+    subsets are handled at export time instead of at scoring time.
+    """
+    features, thresholds, lefts, missing, leaf_values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+
+    for estimator, est_features in zip(model.estimators_, model.estimators_features_):
+        tree = estimator.tree_
+        order, depth = _breadth_first_order(tree.children_left, tree.children_right)
+        n_nodes = len(order)
+        new_id = np.empty(n_nodes, dtype=np.intp)
+        new_id[order] = np.arange(n_nodes)
+
+        is_leaf = tree.children_left[order] == -1
+        max_depth = max(max_depth, int(depth.max()) - 1)
+
+        feature = np.asarray(est_features)[np.where(is_leaf, 0, tree.feature[order])]
+        threshold = np.where(is_leaf, np.inf, tree.threshold[order])
+        left = np.where(is_leaf, np.arange(n_nodes), new_id[tree.children_left[order]]) + offset
+        if getattr(tree, "missing_go_to_left", None) is not None:
+            missing_left = np.asarray(tree.missing_go_to_left, dtype=bool)[order] | is_leaf
+        else:
+            missing_left = is_leaf.copy()
+
+        # Path length contribution of each leaf: depth + c(n_node_samples) - 1
+        leaf_value = np.where(is_leaf, depth + _average_path_length(tree.n_node_samples[order]) - 1.0, 0.0)
+
+        features.append(feature)
+        thresholds.append(threshold)
+        lefts.append(left)
+        missing.append(missing_left)
+        leaf_values.append(leaf_value)
+        roots.append(offset)
+        offset += n_nodes
+
+    if feature_names is None and hasattr(model, "feature_names_in_"):
+        feature_names = model.feature_names_in_
+
+    return CompiledForest(
+        feature=np.concatenate(features).astype(np.intp),
+        threshold=np.concatenate(thresholds).astype(np.float64),
+        left=np.concatenate(lefts).astype(np.intp),
+        missing_left=np.concatenate(missing),
+        leaf_value=np.concatenate(leaf_values),
+        roots=np.asarray(roots, dtype=np.intp),
+        max_depth=max_depth,
+        denominator=_average_path_length([model.max_samples_])[0],
+        offset=model.offset_,
+        feature_names=feature_names,
+    )
+
+
+def explain_anomalies(df, forest, feature_columns, is_anomaly, top_k=2, X=None):
+    """
+    Add `top_feature_<i>` and `top_feature_<i>_contribution` (i = 1..top_k)
+    to `df`: the features with the largest `path_contributions` for each
+    flagged row, computed for the `is_anomaly` rows only (empty elsewhere).
+    The rows are taken from `df[feature_columns]`, or from `X` when given
+    (e.g. a sparse matrix whose columns are `feature_columns`).
+    """
+    is_anomaly = np.asarray(is_anomaly, dtype=bool)
+    rows = df.loc[is_anomaly, feature_columns] if X is None else X[np.flatnonzero(is_anomaly)]
+    contributions = forest.path_contributions(rows)
+    top = np.argsort(-contributions, axis=1, kind='stable')[:, :top_k]
+    names = np.asarray(feature_columns, dtype=object)
+
+    for i in range(min(top_k, len(feature_columns))):
+        feature = np.full(len(df), None, dtype=object)
+        contribution = np.full(len(df), np.nan)
+        feature[is_anomaly] = names[top[:, i]]
+        contribution[is_anomaly] = np.take_along_axis(contributions, top[:, i:i + 1], axis=1)[:, 0]
+        df[f'top_feature_{i + 1}'] = feature
+        df[f'top_feature_{i + 1}_contribution'] = contribution
+    return df
+
+
+def export_compiled_forest(model, path="output/isolation_forest_compiled.npz"):
+    """
+    Compile a trained Isolation Forest and save the node arrays to `path`.
+    """
+    compiled = compile_isolation_forest(model)
+    compiled.save(path)
+    print(f"💾 Compiled Isolation Forest saved to {path}")
+    return compiled
+
+
+def load_compiled_forest(path="output/isolation_forest_compiled.npz"):
+    """
+    Load a CompiledForest previously written by `export_compiled_forest`.
+    """
+    return CompiledForest.from_arrays(np.load(path))
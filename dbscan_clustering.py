@@ -1,17 +1,15 @@
 import pandas as pd
-from sklearn.cluster import DBSCAN
-from sklearn.metrics import silhouette_score, adjusted_rand_score
-from sklearn.decomposition import PCA
-import matplotlib.pyplot as plt
 import os
 import numpy as np
-import joblib
+from model_registry import ModelRegistry, REGISTRY_DIR
+from instrumentation import instrumented
 
 
-def run_dbscan_clustering(csv_file="output/preprocessed_clustering_features.csv", eps=0.5, min_samples=5):
-    """
-    Perform DBSCAN clustering on the preprocessed feature data.
-    """
+PARAM_GRID = {'eps': [0.2,0.3,0.4, 0.5,0.6, 0.7,0.8], 'min_samples': [1, 3, 5, 7, 10, 12, 15]}
+
+
+def load_dbscan_features(csv_file="output/preprocessed_clustering_features.csv"):
+    """(preprocessed feature frame, clustering feature matrix)."""
     # ✅ Step 1: Load preprocessed feature data
     df = pd.read_csv(csv_file)
     print(f"✅ Loaded data from {csv_file}, shape: {df.shape}")
@@ -23,25 +21,61 @@ def run_dbscan_clustering(csv_file="output/preprocessed_clustering_features.csv"
     feature_columns = [col for col in df.columns if col.startswith('embed_')]  # Using embedding columns
     feature_columns += ['total_time_sec', 'max_subtask_percent', 'sum_other_subtask_time', 'ratio_other_to_max']  # Original features
     X = df[feature_columns]
-    detail_columns = ['trace_id', 'stopwatch_name']  # Keep these for later use
+    return df, X
 
-    # ✅ Step 4: Hyperparameter tuning using GridSearch (search for best eps and min_samples)
-    param_grid = {'eps': [0.2,0.3,0.4, 0.5,0.6, 0.7,0.8], 'min_samples': [1, 3, 5, 7, 10, 12, 15]}
+
+def dbscan_candidates():
+    """(eps, min_samples) of the tuning grid, in evaluation order."""
+    return [(eps_val, min_samples_val) for eps_val in PARAM_GRID['eps'] for min_samples_val in PARAM_GRID['min_samples']]
+
+
+def score_dbscan_candidate(X, eps, min_samples):
+    """Silhouette score of DBSCAN(eps, min_samples) on X, or None if it finds a single label."""
+    from sklearn.cluster import DBSCAN
+    from sklearn.metrics import silhouette_score
+    labels = DBSCAN(eps=eps, min_samples=min_samples).fit_predict(X)
+
+    # Evaluate clustering performance using Silhouette Score (for DBSCAN, values range from -1 to 1)
+    if len(set(labels)) > 1:  # Ensure at least two clusters were formed
+        return silhouette_score(X, labels)
+    return None
+
+
+def best_dbscan_params(scores, eps=0.5, min_samples=5):
+    """
+    (best params, best score) from candidate scores in `dbscan_candidates()`
+    order; the first candidate wins ties, so the choice does not depend on
+    which worker finished first.
+    """
     best_score = -1
     best_params = {'eps': eps, 'min_samples': min_samples}
-    
-    for eps_val in param_grid['eps']:
-        for min_samples_val in param_grid['min_samples']:
-            dbscan = DBSCAN(eps=eps_val, min_samples=min_samples_val)
-            labels = dbscan.fit_predict(X)
-            
-            # Evaluate clustering performance using Silhouette Score (for DBSCAN, values range from -1 to 1)
-            if len(set(labels)) > 1:  # Ensure at least two clusters were formed
-                score = silhouette_score(X, labels)
-                if score > best_score:
-                    best_score = score
-                    best_params = {'eps': eps_val, 'min_samples': min_samples_val}
+    for (eps_val, min_samples_val), score in zip(dbscan_candidates(), scores):
+        if score is not None and score > best_score:
+            best_score = score
+            best_params = {'eps': eps_val, 'min_samples': min_samples_val}
+    return best_params, best_score
+
+
+@instrumented()
+def run_dbscan_clustering(csv_file="output/preprocessed_clustering_features.csv", eps=0.5, min_samples=5,
+                          registry_dir=REGISTRY_DIR):
+    """
+    Perform DBSCAN clustering on the preprocessed feature data.
+    The chosen parameters, labels and core samples are registered as a new
+    'dbscan' version.
+    """
+    df, X = load_dbscan_features(csv_file)
+
+    # ✅ Step 4: Hyperparameter tuning using GridSearch (search for best eps and min_samples)
+    scores = [score_dbscan_candidate(X, eps_val, min_samples_val) for eps_val, min_samples_val in dbscan_candidates()]
+    best_params, best_score = best_dbscan_params(scores, eps, min_samples)
+    return save_dbscan_results(df, X, best_params, best_score, registry_dir)
 
+
+def save_dbscan_results(df, X, best_params, best_score, registry_dir=REGISTRY_DIR):
+    """Fit DBSCAN with the tuned parameters, save the clustering results and register them."""
+    from sklearn.cluster import DBSCAN
+    from sklearn.metrics import adjusted_rand_score
     print(f"Best hyperparameters: eps={best_params['eps']}, min_samples={best_params['min_samples']}")
     
     # ✅ Step 5: Apply DBSCAN with the best parameters
@@ -57,18 +91,14 @@ def run_dbscan_clustering(csv_file="output/preprocessed_clustering_features.csv"
     df.to_csv("output/dbscan_clustering_results.csv", index=False)
     print(f"✅ Clustering results saved to output/dbscan_clustering_results.csv")
 
-    # ✅ Step 8: Save the DBSCAN model 
-    os.makedirs("output", exist_ok=True)
-    feature_columns = X.columns.tolist()
-    dbscan_info = {
-    'eps': best_params['eps'],
-    'min_samples': best_params['min_samples'],
-    'labels': dbscan.labels_,
-    'model': dbscan,
-    'feature_columns': feature_columns}
-
-    joblib.dump(dbscan_info, "output/dbscan_model.joblib")
-    print(f"✅ DBSCAN model saved to output/dbscan_model.joblib")
+    # ✅ Step 8: Register the DBSCAN parameters; labels and core samples are saved as arrays
+    ModelRegistry(registry_dir).register(
+        'dbscan', X,
+        arrays={'labels': dbscan.labels_, 'core_sample_indices': dbscan.core_sample_indices_,
+                'components': dbscan.components_},
+        params=best_params,
+        metrics={'silhouette_score': float(best_score), 'n_noise': int((dbscan.labels_ == -1).sum())},
+    )
 
     if 'ground_truth_label' in df.columns:
         ari = adjusted_rand_score(df['ground_truth_label'], df['cluster'])
@@ -78,7 +108,9 @@ def run_dbscan_clustering(csv_file="output/preprocessed_clustering_features.csv"
     
 
     return df
+@instrumented()
 def plot_dbscan_clusters(df,save_dir="output/figures"):
+    import matplotlib.pyplot as plt
         
 
     # ✅ Step 9: Visualize the clusters (2D visualization)
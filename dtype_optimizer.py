@@ -0,0 +1,100 @@
+import os
+import numpy as np
+import pandas as pd
+from instrumentation import instrumented
+
+# Columns that are always left alone unless the schema says otherwise
+DEFAULT_SCHEMA = {
+    'line.message': 'keep',
+    'timestamp_raw': 'keep',
+}
+_NULLABLE_INTS = [('Int8', np.int8), ('Int16', np.int16), ('Int32', np.int32), ('Int64', np.int64)]
+
+
+def _smallest_int(values):
+    """Smallest nullable integer dtype holding all (non-null, integral) values."""
+    low, high = values.min(), values.max()
+    for name, np_type in _NULLABLE_INTS:
+        info = np.iinfo(np_type)
+        if info.min <= low and high <= info.max:
+            return name
+    return None
+
+
+def infer_dtype(series, category_ratio=0.5, use_float32=True):
+    """
+    Compact dtype for one column, or None to leave it as is:
+    - strings with at most `category_ratio` distinct values per non-null row -> 'category'
+    - True/False objects -> 'boolean'
+    - integral floats and ints -> the smallest nullable Int that fits
+    - other floats -> 'float32' (if `use_float32`)
+    """
+    non_null = series.dropna()
+    if non_null.empty:
+        return None
+
+    if series.dtype == object or isinstance(series.dtype, pd.StringDtype):
+        kind = pd.api.types.infer_dtype(non_null, skipna=True)
+        if kind == 'string' and non_null.nunique() <= category_ratio * len(non_null):
+            return 'category'
+        if kind == 'boolean':
+            return 'boolean'
+        return None
+
+    if pd.api.types.is_bool_dtype(series.dtype) or isinstance(series.dtype, pd.CategoricalDtype):
+        return None
+
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return _smallest_int(non_null.to_numpy())
+
+    if pd.api.types.is_float_dtype(series.dtype):
+        values = non_null.to_numpy(dtype=np.float64)
+        if np.isfinite(values).all() and (values == np.round(values)).all():
+            return _smallest_int(values)
+        if use_float32 and series.dtype != np.float32:
+            return 'float32'
+    return None
+
+
+@instrumented()
+def optimize_dtypes(df, schema=None, category_ratio=0.5, use_float32=True,
+                    report_csv="output/dtype_report.csv"):
+    """
+    Downcast the parsed log frame to compact dtypes (see `infer_dtype`).
+
+    `schema` maps column names to a dtype to force (e.g. {'EventID': 'Int64'})
+    or to 'keep' to leave the column untouched; it is applied on top of
+    DEFAULT_SCHEMA. Returns (optimized frame, per-column memory report) and
+    prints the total memory before and after.
+    """
+    schema = {**DEFAULT_SCHEMA, **(schema or {})}
+    bytes_before = df.memory_usage(deep=True, index=False)
+
+    converted = {}
+    for col in df.columns:
+        target = schema.get(col)
+        if target is None:
+            target = infer_dtype(df[col], category_ratio, use_float32)
+        if target is None or target == 'keep':
+            continue
+        converted[col] = df[col].astype(target)
+
+    df_optimized = df.assign(**converted) if converted else df.copy()
+    bytes_after = df_optimized.memory_usage(deep=True, index=False)
+
+    report = pd.DataFrame({
+        'column': df.columns,
+        'dtype_before': [str(dtype) for dtype in df.dtypes],
+        'dtype_after': [str(dtype) for dtype in df_optimized.dtypes],
+        'bytes_before': bytes_before.to_numpy(),
+        'bytes_after': bytes_after.to_numpy(),
+    })
+    total_before, total_after = report['bytes_before'].sum(), report['bytes_after'].sum()
+    print(f"🗜️ Memory: {total_before / 1e6:.1f} MB -> {total_after / 1e6:.1f} MB "
+          f"({len(converted)} columns downcast)")
+
+    if report_csv is not None:
+        os.makedirs(os.path.dirname(report_csv) or ".", exist_ok=True)
+        report.to_csv(report_csv, index=False)
+
+    return df_optimized, report
@@ -1,26 +1,301 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 from collections import defaultdict
 import numpy as np
-from sklearn.feature_extraction.text import CountVectorizer
 import os
+import json
+import datetime
+from instrumentation import instrumented
 
 
+class DistinctCounter:
+    """
+    Mergeable distinct-value counter for one column.
 
+    Keeps the exact set of 64-bit value hashes while it is small (so low
+    cardinality columns are counted exactly) and switches to a HyperLogLog
+    sketch with 2**precision one-byte registers once it grows past
+    `exact_limit`. Memory per column is bounded by max(8 * exact_limit, 2**precision) bytes.
+    The sketch estimate is capped by the number of values added (`n_values`),
+    since a column cannot hold more distinct values than non-null ones.
+    """
+
+    def __init__(self, precision=12, exact_limit=1024):
+        self.precision = precision
+        self.exact_limit = exact_limit
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.registers = None
+        self.n_values = 0
+
+    @staticmethod
+    def hash_values(values):
+        """64-bit hashes of non-null values (numbers hashed as float64 so chunk dtypes agree)."""
+        values = np.asarray(values)
+        if values.dtype.kind in 'biuf':
+            values = values.astype(np.float64)
+        elif values.dtype.kind != 'O':
+            values = values.astype(str).astype(object)
+        return pd.util.hash_array(values).astype(np.uint64)
+
+    def _add_to_registers(self, hashes):
+        p = self.precision
+        index = (hashes >> np.uint64(64 - p)).astype(np.intp)
+        rest = hashes & np.uint64((1 << (64 - p)) - 1)
+        # rho = position of the leftmost 1-bit in the remaining (64 - p) bits
+        rho = np.full(len(rest), 64 - p + 1, dtype=np.uint8)
+        nonzero = rest > 0
+        top_bit = np.floor(np.log2(rest[nonzero].astype(np.float64))).astype(np.int64)
+        # float64 rounding can overshoot by one bit for values just below a power of two
+        top_bit -= (np.left_shift(np.uint64(1), top_bit.astype(np.uint64)) > rest[nonzero])
+        rho[nonzero] = (64 - p - top_bit).astype(np.uint8)
+        np.maximum.at(self.registers, index, rho)
+
+    def _switch_to_sketch(self):
+        self.registers = np.zeros(1 << self.precision, dtype=np.uint8)
+        self._add_to_registers(self.hashes)
+        self.hashes = None
+
+    def add_hashes(self, hashes):
+        self.n_values += len(hashes)
+        if self.registers is None:
+            self.hashes = np.union1d(self.hashes, hashes)
+            if len(self.hashes) > self.exact_limit:
+                self._switch_to_sketch()
+        else:
+            self._add_to_registers(hashes)
+
+    def update(self, values):
+        """Add the non-null values of a Series or array."""
+        values = pd.Series(values) if not isinstance(values, pd.Series) else values
+        self.add_hashes(self.hash_values(values.dropna().to_numpy()))
+
+    def merge(self, other):
+        if other.registers is None:
+            self.add_hashes(other.hashes)
+            self.n_values += other.n_values - len(other.hashes)
+            return self
+        if self.registers is None:
+            self._switch_to_sketch()
+        np.maximum(self.registers, other.registers, out=self.registers)
+        self.n_values += other.n_values
+        return self
+
+    def count(self):
+        if self.registers is None:
+            return len(self.hashes)
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Small-range correction (linear counting)
+            estimate = m * np.log(m / zeros)
+        return min(int(round(estimate)), self.n_values)
+
+
+class EDAAggregates:
+    """
+    Mergeable streaming EDA statistics.
+
+    `update` takes one chunk of the parsed log frame at a time (a row slice,
+    one file, one worker's share), and `merge` combines aggregates computed
+    separately. Per column it keeps row/null counts, a DistinctCounter and the
+    first non-null sample; globally it keeps per-day and per-hour log counts
+    and value counts of the detected level, logger and (when `clean_logs` mined
+    templates) template ID. Memory does not grow with the number of rows.
+    """
+
+    VALUE_COUNT_COLUMNS = ('fields.detected_level', 'line.logger', 'template_id')
+
+    def __init__(self, precision=12, exact_limit=1024):
+        self.precision = precision
+        self.exact_limit = exact_limit
+        self.n_rows = 0
+        self.columns = {}
+        self.day_counts = pd.Series(dtype='int64')
+        self.hour_counts = pd.Series(dtype='int64')
+        self.value_counts = {col: pd.Series(dtype='int64') for col in self.VALUE_COUNT_COLUMNS}
+
+    def _column(self, col):
+        if col not in self.columns:
+            self.columns[col] = {
+                'non_null': 0,
+                'sample': np.nan,
+                'has_sample': False,
+                'distinct': DistinctCounter(self.precision, self.exact_limit),
+            }
+        return self.columns[col]
+
+    @staticmethod
+    def _add_counts(total, counts):
+        return total.add(counts, fill_value=0).astype('int64')
+
+    def update(self, df_chunk):
+        # One vectorized null mask for the whole chunk, then only non-null values per column
+        not_null = df_chunk.notna().to_numpy()
+        non_null_counts = not_null.sum(axis=0)
+        for i, col in enumerate(df_chunk.columns):
+            stats = self._column(col)
+            if not non_null_counts[i]:
+                continue
+            values = df_chunk.iloc[:, i].to_numpy()[not_null[:, i]]
+            stats['non_null'] += int(non_null_counts[i])
+            if not stats['has_sample']:
+                stats['sample'] = values[0]
+                stats['has_sample'] = True
+            stats['distinct'].add_hashes(DistinctCounter.hash_values(values))
+
+        if 'timestamp_raw' in df_chunk.columns:
+            timestamps = _convert_timestamps(df_chunk['timestamp_raw']).dropna()
+            self.day_counts = self._add_counts(self.day_counts, timestamps.dt.date.value_counts())
+            self.hour_counts = self._add_counts(self.hour_counts, timestamps.dt.hour.value_counts())
+
+        for col in self.VALUE_COUNT_COLUMNS:
+            if col in df_chunk.columns:
+                counts = df_chunk[col].value_counts()
+                if isinstance(counts.index, pd.CategoricalIndex):
+                    # Plain labels so chunks with different category sets still add up
+                    counts = counts[counts > 0]
+                    counts.index = counts.index.astype(object)
+                self.value_counts[col] = self._add_counts(self.value_counts[col], counts)
+
+        self.n_rows += len(df_chunk)
+        return self
+
+    def merge(self, other):
+        """Fold another EDAAggregates (computed on later rows) into this one."""
+        for col, other_stats in other.columns.items():
+            stats = self._column(col)
+            stats['non_null'] += other_stats['non_null']
+            if not stats['has_sample'] and other_stats['has_sample']:
+                stats['sample'] = other_stats['sample']
+                stats['has_sample'] = True
+            stats['distinct'].merge(other_stats['distinct'])
+
+        self.day_counts = self._add_counts(self.day_counts, other.day_counts)
+        self.hour_counts = self._add_counts(self.hour_counts, other.hour_counts)
+        for col in self.VALUE_COUNT_COLUMNS:
+            self.value_counts[col] = self._add_counts(self.value_counts[col], other.value_counts[col])
+        self.n_rows += other.n_rows
+        return self
+
+    def save(self, path):
+        """
+        Write the aggregates to `path`: counts and samples in eda.json, the
+        distinct-counter hashes and registers as arrays in distinct.npz.
+        """
+        os.makedirs(path, exist_ok=True)
+        counters = [stats['distinct'] for stats in self.columns.values()]
+        exact = [c.hashes for c in counters if c.registers is None]
+        sketches = [c.registers for c in counters if c.registers is not None]
+        np.savez(os.path.join(path, "distinct.npz"),
+                 hashes=np.concatenate(exact) if exact else np.empty(0, dtype=np.uint64),
+                 hash_counts=np.array([len(h) for h in exact], dtype=np.int64),
+                 registers=np.vstack(sketches) if sketches else np.empty((0, 1 << self.precision), dtype=np.uint8))
+        meta = {
+            'precision': self.precision,
+            'exact_limit': self.exact_limit,
+            'n_rows': self.n_rows,
+            'columns': {col: {'non_null': stats['non_null'],
+                              'sample': _json_value(stats['sample']) if stats['has_sample'] else None,
+                              'has_sample': stats['has_sample'],
+                              'sketch': stats['distinct'].registers is not None,
+                              'n_values': stats['distinct'].n_values}
+                        for col, stats in self.columns.items()},
+            'day_counts': [[str(day), int(n)] for day, n in self.day_counts.items()],
+            'hour_counts': [[int(hour), int(n)] for hour, n in self.hour_counts.items()],
+            'value_counts': {col: [[_json_value(label), int(n)] for label, n in counts.items()]
+                             for col, counts in self.value_counts.items()},
+        }
+        with open(os.path.join(path, "eda.json"), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "eda.json"), encoding='utf-8') as f:
+            meta = json.load(f)
+        with np.load(os.path.join(path, "distinct.npz"), allow_pickle=False) as arrays:
+            hashes = np.split(arrays['hashes'], np.cumsum(arrays['hash_counts'])[:-1]) if len(arrays['hash_counts']) else []
+            registers = arrays['registers']
+
+        aggregates = cls(meta['precision'], meta['exact_limit'])
+        aggregates.n_rows = meta['n_rows']
+        exact, sketch = iter(hashes), iter(registers)
+        for col, entry in meta['columns'].items():
+            stats = aggregates._column(col)
+            stats['non_null'] = entry['non_null']
+            stats['has_sample'] = entry['has_sample']
+            stats['sample'] = entry['sample'] if entry['has_sample'] else np.nan
+            counter = stats['distinct']
+            if entry['sketch']:
+                counter.hashes, counter.registers = None, next(sketch).copy()
+            else:
+                counter.hashes = next(exact)
+            counter.n_values = entry['n_values']
+
+        aggregates.day_counts = _count_series(meta['day_counts'], datetime.date.fromisoformat)
+        aggregates.hour_counts = _count_series(meta['hour_counts'])
+        aggregates.value_counts = {col: _count_series(meta['value_counts'].get(col, []))
+                                   for col in cls.VALUE_COUNT_COLUMNS}
+        return aggregates
+
+    def column_summary(self):
+        """Same columns as `summarize_columns`, built from the aggregates."""
+        names = list(self.columns)
+        non_null = np.array([self.columns[c]['non_null'] for c in names], dtype=np.int64)
+        null_pct = pd.Series((self.n_rows - non_null) / self.n_rows if self.n_rows else np.nan, index=names)
+        return pd.DataFrame({
+            'Column': names,
+            'Non-Null Count': non_null,
+            'Null %': null_pct.round(4) * 100,
+            'Unique Values': [self.columns[c]['distinct'].count() for c in names],
+            'Sample Value': [self.columns[c]['sample'] for c in names]
+        })
+
+
+@instrumented()
+def collect_eda_aggregates(data, chunk_size=50_000, aggregates=None):
+    """
+    Build EDAAggregates from a DataFrame (processed in row chunks of
+    `chunk_size`) or from any iterable of DataFrame chunks, e.g. one parsed
+    file at a time during ingestion.
+    """
+    aggregates = aggregates if aggregates is not None else EDAAggregates()
+    if isinstance(data, pd.DataFrame):
+        chunks = (data.iloc[start:start + chunk_size] for start in range(0, len(data), chunk_size))
+    else:
+        chunks = data
+    for chunk in chunks:
+        aggregates.update(chunk)
+    return aggregates
+
+
+def _json_value(value):
+    """JSON-safe form of a sample value or count label (NumPy scalars unwrapped, other objects as str)."""
+    value = value.item() if isinstance(value, np.generic) else value
+    return value if value is None or isinstance(value, (str, int, float, bool)) else str(value)
+
+
+def _count_series(pairs, parse=None):
+    labels = [parse(label) if parse else label for label, _ in pairs]
+    return pd.Series([n for _, n in pairs], index=labels, dtype='int64')
+
+
+def _convert_timestamps(timestamp_raw):
+    ts_numeric = pd.to_numeric(timestamp_raw, errors='coerce')
+    return pd.to_datetime(ts_numeric / 1e9, unit='s', errors='coerce')
 
 
 # 1. Column Summary Stats (Top 30 Columns)
-def summarize_columns(df,output_csv="output/eda_column_summary.csv"):
-    summary = pd.DataFrame({
-        'Column': df.columns,
-        'Non-Null Count': df.notnull().sum().values,
-        'Null %': df.isnull().mean().round(4) * 100,
-        'Unique Values': df.nunique().values,
-        'Sample Value': [
-            df[col].dropna().iloc[0] if df[col].notna().any() else np.nan 
-            for col in df.columns
-        ]
-    })
+@instrumented()
+def summarize_columns(df=None, output_csv="output/eda_column_summary.csv", aggregates=None):
+    """
+    Per-column non-null count, null %, distinct count and a sample value.
+    Computed chunk by chunk through EDAAggregates; pass precomputed
+    `aggregates` to skip touching the frame at all.
+    """
+    if aggregates is None:
+        aggregates = collect_eda_aggregates(df)
+    summary = aggregates.column_summary()
     os.makedirs(os.path.dirname(output_csv), exist_ok=True)
     summary.to_csv(output_csv, index=False)
     return summary.sort_values('Null %').head(30)
@@ -35,19 +310,16 @@ def group_columns_by_prefix(df):
 
 
 # 3. Log Volume Over Time
-def plot_log_volume_over_time(df, save_dir="output/figures"):
-
-    df_time = df.copy()
-    ts_numeric = pd.to_numeric(df_time['timestamp_raw'], errors='coerce')
-    df_time['timestamp_converted'] = pd.to_datetime(ts_numeric / 1e9, unit='s', errors='coerce')
-    df_time = df_time.dropna(subset=['timestamp_converted'])
-
-    df_time['date'] = df_time['timestamp_converted'].dt.date
-    df_time['hour'] = df_time['timestamp_converted'].dt.hour
+@instrumented()
+def plot_log_volume_over_time(df=None, save_dir="output/figures", aggregates=None):
+    import matplotlib.pyplot as plt
+    if aggregates is None:
+        # Only the timestamp column is needed, no copy of the frame
+        aggregates = EDAAggregates().update(df[['timestamp_raw']])
 
     # Logs per day
     plt.figure(figsize=(14, 4))
-    df_time['date'].value_counts().sort_index().plot(kind='bar', color='steelblue')
+    aggregates.day_counts.sort_index().plot(kind='bar', color='steelblue')
     plt.title("Logs per Day")
     plt.ylabel("Log Count")
     plt.xlabel("Date")
@@ -58,7 +330,7 @@ def plot_log_volume_over_time(df, save_dir="output/figures"):
 
     # Logs per hour
     plt.figure(figsize=(10, 4))
-    df_time['hour'].value_counts().sort_index().plot(kind='bar', color='orange')
+    aggregates.hour_counts.sort_index().plot(kind='bar', color='orange')
     plt.title("Logs per Hour")
     plt.ylabel("Log Count")
     plt.xlabel("Hour of Day")
@@ -68,12 +340,16 @@ def plot_log_volume_over_time(df, save_dir="output/figures"):
     plt.close()
 
 # 4. Status Fields and Logger Analysis
-def plot_status_and_loggers(df, save_dir="output/figures"):
- 
+@instrumented()
+def plot_status_and_loggers(df=None, save_dir="output/figures", aggregates=None):
+    import matplotlib.pyplot as plt
+    if aggregates is None:
+        columns = [col for col in EDAAggregates.VALUE_COUNT_COLUMNS if col in df.columns]
+        aggregates = EDAAggregates().update(df[columns])
 
      # Detected levels
     plt.figure(figsize=(8, 4))
-    df['fields.detected_level'].value_counts().plot(kind='bar', title="Detected Levels")
+    aggregates.value_counts['fields.detected_level'].sort_values(ascending=False, kind='stable').plot(kind='bar', title="Detected Levels")
     plt.tight_layout()
     plt.savefig(f"{save_dir}/detected_levels.png")
     plt.close()
@@ -81,21 +357,55 @@ def plot_status_and_loggers(df, save_dir="output/figures"):
 
     # Top 15 logger classes
     plt.figure(figsize=(10, 6))
-    df['line.logger'].value_counts().head(15).plot(kind='barh', title="Top 15 Logger Classes")
+    aggregates.value_counts['line.logger'].sort_values(ascending=False, kind='stable').head(15).plot(kind='barh', title="Top 15 Logger Classes")
     plt.tight_layout()
     plt.savefig(f"{save_dir}/top_15_loggers.png")
     plt.close()
 
-def extract_top_keywords(df, top_n=30, save_csv=True, save_dir="output"):
+# 5. Most Common Log Templates
+@instrumented()
+def plot_top_templates(df=None, template_miner=None, save_dir="output/figures", aggregates=None, top_n=15):
+    """
+    Bar chart of the most frequent mined log templates (needs the `template_id`
+    column from `clean_logs(..., template_miner=...)`). Bars are labelled with
+    the template text when the miner is passed.
+    """
+    import matplotlib.pyplot as plt
+    if aggregates is None:
+        aggregates = EDAAggregates().update(df[['template_id']])
 
+    counts = aggregates.value_counts['template_id'].sort_values(ascending=False, kind='stable').head(top_n)
+    if counts.empty:
+        print("⚠️ No template IDs to plot.")
+        return counts
 
-    corpus = df['line.message'].dropna().astype(str).values
-    vectorizer = CountVectorizer(stop_words='english', max_features=top_n)
-    X = vectorizer.fit_transform(corpus)
+    if template_miner is not None:
+        labels = [f"{tid}: {' '.join(template_miner.templates[int(tid)])[:60]}" for tid in counts.index]
+        counts.index = labels
 
-    keywords = pd.DataFrame(X.sum(axis=0), columns=vectorizer.get_feature_names_out()).T
-    keywords.columns = ['Frequency']
-    result = keywords.sort_values(by='Frequency', ascending=False)
+    plt.figure(figsize=(12, 6))
+    counts.plot(kind='barh', title=f"Top {top_n} Log Templates")
+    plt.gca().invert_yaxis()
+    plt.tight_layout()
+    plt.savefig(f"{save_dir}/top_{top_n}_templates.png")
+    plt.close()
+    return counts
+
+@instrumented()
+def extract_top_keywords(df, top_n=30, save_csv=True, save_dir="output", capacity=10_000, chunk_size=10_000,
+                         n_jobs=1):
+    """
+    Top message terms (CountVectorizer tokenization and English stop words),
+    counted chunk by chunk with a bounded-memory KeywordCounter instead of a
+    full vocabulary. Frequencies are exact while the vocabulary fits in
+    `capacity`; otherwise each one undercounts by at most the printed bound.
+    """
+    from keyword_counter import count_keywords
+    corpus = df['line.message'].dropna().astype(str).values
+    counter = count_keywords(corpus, capacity=capacity, chunk_size=chunk_size, n_jobs=n_jobs)
+    result = counter.top(top_n)
+    if counter.error_bound:
+        print(f"ℹ️ Keyword frequencies may undercount by up to {counter.error_bound}")
 
     if save_csv:
         result.to_csv(f"{save_dir}/top_keywords.csv")
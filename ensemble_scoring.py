@@ -0,0 +1,256 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+from model_registry import ModelRegistry, REGISTRY_DIR
+from instrumentation import instrumented
+from anomaly_detection import FEATURE_COLUMNS, load_isolation_forest_features
+
+MAD_SCALE = 1.4826  # MAD of a normal distribution -> standard deviation
+
+
+class IsolationForestDetector:
+    """Isolation Forest, scored with the compiled node arrays (anomaly score, higher = more anomalous)."""
+    name = 'isolation_forest'
+
+    def __init__(self, n_estimators=100, random_state=42, n_jobs=None):
+        self.n_estimators = n_estimators
+        self.random_state = random_state
+        self.n_jobs = n_jobs
+
+    def fit(self, X):
+        from sklearn.ensemble import IsolationForest
+        from compiled_forest import compile_isolation_forest
+        model = IsolationForest(n_estimators=self.n_estimators, random_state=self.random_state, n_jobs=self.n_jobs)
+        self.forest_ = compile_isolation_forest(model.fit(X))
+        return self
+
+    def score(self, X):
+        return -self.forest_.score_samples(X)
+
+
+class DBSCANCoreDistanceDetector:
+    """
+    Distance to the nearest DBSCAN core sample, in units of `eps`: points
+    above 1 are what DBSCAN would label noise.
+    """
+    name = 'dbscan_core_distance'
+
+    def __init__(self, eps=0.5, min_samples=5):
+        self.eps = eps
+        self.min_samples = min_samples
+
+    def fit(self, X):
+        from sklearn.cluster import DBSCAN
+        from sklearn.neighbors import NearestNeighbors
+        dbscan = DBSCAN(eps=self.eps, min_samples=self.min_samples).fit(X)
+        if len(dbscan.components_):
+            core, self.core_sample_indices_ = dbscan.components_, dbscan.core_sample_indices_
+        else:
+            core, self.core_sample_indices_ = np.asarray(X), np.arange(len(X))
+        self.neighbors_ = NearestNeighbors(n_neighbors=1).fit(core)
+        return self
+
+    def score(self, X):
+        distances, _ = self.neighbors_.kneighbors(X)
+        return distances[:, 0] / self.eps
+
+    def training_scores(self, X):
+        """Scores of the rows `fit` was given, measuring core rows to the nearest other core sample."""
+        n_neighbors = min(2, self.neighbors_.n_samples_fit_)
+        distances, _ = self.neighbors_.kneighbors(X, n_neighbors=n_neighbors)
+        nearest = distances[:, 0]
+        # A core row's nearest core sample is itself
+        nearest[self.core_sample_indices_] = distances[self.core_sample_indices_, n_neighbors - 1]
+        return nearest / self.eps
+
+
+class RobustZScoreDetector:
+    """Largest per-feature robust z-score |x - median| / (1.4826 * MAD)."""
+    name = 'robust_zscore'
+
+    def fit(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        self.median_ = np.median(X, axis=0)
+        mad = np.median(np.abs(X - self.median_), axis=0) * MAD_SCALE
+        self.scale_ = np.where(mad > 0, mad, 1.0)
+        return self
+
+    def score(self, X):
+        return (np.abs(np.asarray(X, dtype=np.float64) - self.median_) / self.scale_).max(axis=1)
+
+
+class LOFDetector:
+    """Local Outlier Factor in novelty mode (~1 for inliers, larger for outliers)."""
+    name = 'lof'
+
+    def __init__(self, n_neighbors=20):
+        self.n_neighbors = n_neighbors
+
+    def fit(self, X):
+        from sklearn.neighbors import LocalOutlierFactor
+        n_neighbors = max(1, min(self.n_neighbors, len(X) - 1))
+        self.lof_ = LocalOutlierFactor(n_neighbors=n_neighbors, novelty=True).fit(X)
+        return self
+
+    def score(self, X):
+        return -self.lof_.score_samples(X)
+
+    def training_scores(self, X):
+        """LOF of the rows `fit` was given, without counting each row as its own neighbour."""
+        return -self.lof_.negative_outlier_factor_
+
+
+DETECTORS = {
+    detector.name: detector
+    for detector in (IsolationForestDetector, DBSCANCoreDistanceDetector, RobustZScoreDetector, LOFDetector)
+}
+
+
+class EnsembleScorer:
+    """
+    Runs a set of detectors over one prepared feature matrix.
+
+    `fit` standardizes the features once, fits every detector on the same
+    matrix and keeps each detector's training scores (from its
+    `training_scores(X)` if it has one, so neighbour-based detectors do not
+    score a row against itself, otherwise from `score`); `score` turns raw
+    scores into their empirical quantile among the training scores (0-1,
+    comparable across detectors), averages them with `weights` into
+    `combined_score` and flags rows above the training quantile
+    1 - `contamination`. The normalization is fixed at fit time, so scoring
+    one large batch or a stream of small ones gives the same numbers.
+    Per-detector wall times of the last fit/score are in `timings`.
+    """
+
+    def __init__(self, detectors=tuple(DETECTORS), weights=None, contamination=0.01,
+                 feature_columns=FEATURE_COLUMNS):
+        unknown = [d for d in detectors if isinstance(d, str) and d not in DETECTORS]
+        if unknown:
+            raise ValueError(f"Unknown detectors {unknown}, expected some of {list(DETECTORS)}")
+        self.detectors = [DETECTORS[d]() if isinstance(d, str) else d for d in detectors]
+        self.weights = np.asarray(weights if weights is not None else [1.0] * len(self.detectors), dtype=np.float64)
+        if len(self.weights) != len(self.detectors):
+            raise ValueError(f"Got {len(self.weights)} weights for {len(self.detectors)} detectors")
+        self.contamination = contamination
+        self.feature_columns = list(feature_columns)
+        self.timings = {}
+
+    @property
+    def names(self):
+        return [detector.name for detector in self.detectors]
+
+    def _prepare(self, X):
+        if isinstance(X, pd.DataFrame):
+            X = X[self.feature_columns]
+        return (np.asarray(X, dtype=np.float64) - self.mean_) / self.std_
+
+    def _normalize(self, i, raw):
+        return np.searchsorted(self.training_scores_[i], raw, side='right') / len(self.training_scores_[i])
+
+    def fit(self, X):
+        self._fit(X)
+        return self
+
+    def fit_score(self, X):
+        """`fit`, then the `score` frame of the training rows, built from their training scores."""
+        raws = self._fit(X)
+        return self._result(raws, X.index if isinstance(X, pd.DataFrame) else None)
+
+    def _fit(self, X):
+        X = X[self.feature_columns] if isinstance(X, pd.DataFrame) else X
+        X = np.asarray(X, dtype=np.float64)
+        if not len(X):
+            raise ValueError("Cannot fit the ensemble on an empty feature matrix")
+        self.mean_ = X.mean(axis=0)
+        std = X.std(axis=0)
+        self.std_ = np.where(std > 0, std, 1.0)
+        X_scaled = (X - self.mean_) / self.std_
+
+        raws = []
+        self.timings = {}
+        for detector in self.detectors:
+            start = time.perf_counter()
+            detector.fit(X_scaled)
+            raws.append(getattr(detector, 'training_scores', detector.score)(X_scaled))
+            self.timings[f"{detector.name}_fit_sec"] = time.perf_counter() - start
+        self.training_scores_ = [np.sort(raw) for raw in raws]
+
+        combined = self._combine([self._normalize(i, scores) for i, scores in enumerate(self.training_scores_)])
+        self.threshold_ = float(np.quantile(combined, 1.0 - self.contamination))
+        return raws
+
+    def _combine(self, normalized):
+        return np.average(np.vstack(normalized), axis=0, weights=self.weights)
+
+    def score(self, X):
+        """
+        Frame (one row per input row) with `<detector>_raw`, `<detector>_score`
+        (normalized), `combined_score` and `is_anomaly`.
+        """
+        X_scaled = self._prepare(X)
+        raws = []
+        for detector in self.detectors:
+            start = time.perf_counter()
+            # Streaming batches may be empty, which sklearn estimators reject
+            raws.append(detector.score(X_scaled) if len(X_scaled) else np.empty(0))
+            self.timings[f"{detector.name}_score_sec"] = time.perf_counter() - start
+        return self._result(raws, X.index if isinstance(X, pd.DataFrame) else None)
+
+    def _result(self, raws, index):
+        result = {}
+        normalized = []
+        for i, (detector, raw) in enumerate(zip(self.detectors, raws)):
+            normalized.append(self._normalize(i, raw))
+            result[f"{detector.name}_raw"] = raw
+            result[f"{detector.name}_score"] = normalized[-1]
+        result['combined_score'] = self._combine(normalized)
+        result['is_anomaly'] = result['combined_score'] > self.threshold_
+        return pd.DataFrame(result, index=index)
+
+    def score_stream(self, batches):
+        """Score an iterable of feature batches (frames or arrays) one at a time, yielding each result."""
+        for batch in batches:
+            yield self.score(batch)
+
+    def timing_table(self):
+        return pd.DataFrame([
+            {'detector': name,
+             'fit_sec': self.timings.get(f"{name}_fit_sec"),
+             'score_sec': self.timings.get(f"{name}_score_sec")}
+            for name in self.names
+        ])
+
+
+@instrumented()
+def run_ensemble_scoring(csv_path="output/task2_stopwatch_features.csv", detectors=tuple(DETECTORS),
+                         weights=None, contamination=0.01, output_csv="output/ensemble_scores.csv",
+                         registry_dir=REGISTRY_DIR):
+    """
+    Fit the ensemble on the stopwatch features, score them in one batch and
+    save per-detector and combined scores. The fitted EnsembleScorer is
+    registered as an 'ensemble' version for streaming scoring of new batches.
+    """
+    df, X = load_isolation_forest_features(csv_path)
+    df, X = df.reset_index(drop=True), X.reset_index(drop=True)
+
+    scorer = EnsembleScorer(detectors, weights=weights, contamination=contamination)
+    scores = scorer.fit_score(X)
+    timings = scorer.timing_table()
+    print("⏱️ Detector timings:")
+    print(timings)
+
+    key_columns = [col for col in ['trace_id', 'stopwatch_name'] if col in df.columns]
+    df_scores = pd.concat([df[key_columns], X, scores], axis=1)
+    os.makedirs(os.path.dirname(output_csv), exist_ok=True)
+    df_scores.to_csv(output_csv, index=False)
+    print(f"🚨 {int(scores['is_anomaly'].sum())} of {len(df_scores)} StopWatch blocks flagged by the ensemble, "
+          f"saved to {output_csv}")
+
+    ModelRegistry(registry_dir).register(
+        'ensemble', X, model=scorer,
+        params={'detectors': scorer.names, 'weights': scorer.weights.tolist(), 'contamination': contamination},
+        metrics={'n_anomalies': int(scores['is_anomaly'].sum()), 'threshold': scorer.threshold_,
+                 **{key: float(value) for key, value in scorer.timings.items()}},
+    )
+    return df_scores
@@ -0,0 +1,298 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from payload_store import _offsets
+
+EXECUTE_EVENT_FIELDS = ['FileTypeID', 'EventID', 'FieldID', 'CommandID']
+TRACE_ID_COLUMNS = ['fields.TraceID', 'line.mdc.trace_id']
+INDEX_DIR = "event_index"
+
+
+def is_index_column(col):
+    """Columns `EventIndex.build` reads: the ExecuteEvent IDs and the trace IDs."""
+    return col in TRACE_ID_COLUMNS or any(key in col for key in EXECUTE_EVENT_FIELDS)
+
+
+def _int_values(series):
+    """
+    float64 `int(val)` of every value of `series` (NaN where it is null or int()
+    fails), converting each distinct value once instead of every row.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        lookup = np.append(_int_values(pd.Series(series.cat.categories)), np.nan)
+        return lookup[series.cat.codes.to_numpy()]
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        values = np.trunc(values)
+        values[~np.isfinite(values)] = np.nan
+        return values
+
+    values = series.astype(object)
+    converted = {}
+    for value in pd.unique(values[values.notna()]):
+        try:
+            converted[value] = float(int(value))
+        except (ValueError, TypeError, OverflowError):
+            converted[value] = np.nan
+    return values.map(converted).to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _field_columns(df_logs_parsed):
+    return {key: [col for col in df_logs_parsed.columns if key in col] for key in EXECUTE_EVENT_FIELDS}
+
+
+def flat_combinations(df_logs_parsed):
+    """
+    Task 1 flat combination of every row: per field, the first non-null
+    int-castable value over the columns containing the field name (in column
+    order), NaN if there is none.
+    """
+    combinations = {}
+    for key, columns in _field_columns(df_logs_parsed).items():
+        values = np.full(len(df_logs_parsed), np.nan)
+        for col in columns:
+            missing = np.isnan(values)
+            if not missing.any():
+                break
+            values[missing] = _int_values(df_logs_parsed[col])[missing]
+        combinations[key] = values
+    return pd.DataFrame(combinations, index=pd.RangeIndex(len(df_logs_parsed)))
+
+
+def _postings(keys, rows):
+    """
+    (unique keys, CSR offsets, row IDs) from one (key, row) pair per entry;
+    keys are sorted like `groupby(dropna=False)` (NaN last) and each key's
+    rows ascending.
+    """
+    codes = keys.groupby(list(keys.columns), dropna=False, sort=True).ngroup().to_numpy()
+    order = np.lexsort((rows, codes))
+    offsets = _offsets(np.bincount(codes, minlength=codes.max() + 1 if len(codes) else 0))
+    unique_keys = keys.iloc[order[offsets[:-1]]].reset_index(drop=True)
+    return unique_keys, offsets, rows[order]
+
+
+class EventIndex:
+    """
+    Inverted index over the ExecuteEvent IDs of a parsed frame:
+    - `field_keys` (field, value) -> sorted row IDs of every row where any
+      column containing the field name holds that value
+    - `combination_keys` (FileTypeID, EventID, FieldID, CommandID) -> sorted
+      row IDs of the rows with that Task 1 flat combination (NaN = absent)
+    - `trace_codes` the trace of every row (-1 = none), into `trace_ids`
+
+    Posting lists are CSR slices of one int64 array per kind, so queries are
+    array intersections/unions and Task 1 counts are the slice lengths.
+    """
+
+    def __init__(self, n_rows, field_keys, field_offsets, field_postings,
+                 combination_keys, combination_offsets, combination_postings, trace_codes, trace_ids):
+        self.n_rows = n_rows
+        self.field_keys = field_keys
+        self.field_offsets = field_offsets
+        self.field_postings = field_postings
+        self.combination_keys = combination_keys
+        self.combination_offsets = combination_offsets
+        self.combination_postings = combination_postings
+        self.trace_codes = trace_codes
+        self.trace_ids = trace_ids
+        self._lookup = {
+            (field, int(value)): i
+            for i, (field, value) in enumerate(zip(field_keys['field'], field_keys['value']))
+        }
+
+    @classmethod
+    def build(cls, df_logs_parsed):
+        from trace_sessions import trace_keys  # trace_sessions imports log_store, which imports this module
+        df_logs_parsed = df_logs_parsed.reset_index(drop=True)
+        n_rows = len(df_logs_parsed)
+
+        combinations = flat_combinations(df_logs_parsed)
+        combination_keys, combination_offsets, combination_postings = _postings(
+            combinations, np.arange(n_rows, dtype=np.int64))
+
+        # (field, value, row) for every non-null ID cell, deduplicated per row
+        fields, values, rows = [], [], []
+        for key, columns in _field_columns(df_logs_parsed).items():
+            for col in columns:
+                col_values = _int_values(df_logs_parsed[col])
+                present = np.flatnonzero(~np.isnan(col_values))
+                fields.append(np.full(len(present), key, dtype=object))
+                values.append(col_values[present].astype(np.int64))
+                rows.append(present)
+        triples = pd.DataFrame({
+            'field': np.concatenate(fields) if fields else np.array([], dtype=object),
+            'value': np.concatenate(values) if values else np.array([], dtype=np.int64),
+            'row': np.concatenate(rows).astype(np.int64) if rows else np.array([], dtype=np.int64),
+        }).drop_duplicates()
+        field_keys, field_offsets, field_postings = _postings(
+            triples[['field', 'value']], triples['row'].to_numpy())
+
+        trace_codes, trace_ids = pd.factorize(trace_keys(df_logs_parsed), sort=True)
+        return cls(n_rows, field_keys, field_offsets, field_postings,
+                   combination_keys, combination_offsets, combination_postings,
+                   trace_codes.astype(np.int32), np.asarray(trace_ids, dtype=object))
+
+    def rows(self, field, values):
+        """Sorted row IDs where `field` holds `values` (one value or a list, OR-ed)."""
+        if field not in EXECUTE_EVENT_FIELDS:
+            raise ValueError(f"Unknown field '{field}', expected one of {EXECUTE_EVENT_FIELDS}")
+        values = values if isinstance(values, (list, tuple, set, np.ndarray)) else [values]
+        postings = []
+        for value in values:
+            i = self._lookup.get((field, int(value)))
+            if i is not None:
+                postings.append(self.field_postings[self.field_offsets[i]:self.field_offsets[i + 1]])
+        return union(*postings)
+
+    def query(self, how='and', **conditions):
+        """
+        Sorted row IDs matching `conditions`, e.g.
+        `index.query(FileTypeID=3, EventID=[5, 7])` (fields AND-ed, list values OR-ed);
+        `how='or'` OR-s the fields instead.
+        """
+        postings = [self.rows(field, values) for field, values in conditions.items()]
+        if how == 'and':
+            return intersect(*postings)
+        if how == 'or':
+            return union(*postings)
+        raise ValueError(f"how must be 'and' or 'or', got '{how}'")
+
+    def combination_rows(self, file_type_id=None, event_id=None, field_id=None, command_id=None):
+        """Sorted row IDs of one exact Task 1 flat combination (None = field absent)."""
+        target = np.array([file_type_id, event_id, field_id, command_id], dtype=np.float64)
+        keys = self.combination_keys[EXECUTE_EVENT_FIELDS].to_numpy(dtype=np.float64)
+        match = np.flatnonzero(((keys == target) | (np.isnan(keys) & np.isnan(target))).all(axis=1))
+        if not len(match):
+            return np.array([], dtype=np.int64)
+        i = match[0]
+        return self.combination_postings[self.combination_offsets[i]:self.combination_offsets[i + 1]]
+
+    def traces(self, rows):
+        """Distinct trace IDs of `rows` (sorted)."""
+        codes = np.unique(self.trace_codes[rows])
+        return self.trace_ids[codes[codes >= 0]]
+
+    def combination_counts(self):
+        """Task 1 flat table, counted from the combination posting-list lengths."""
+        df_counts = self.combination_keys.copy()
+        for key in EXECUTE_EVENT_FIELDS:
+            # Same dtypes as the groupby over the per-row combinations
+            if df_counts[key].notna().all() and len(df_counts):
+                df_counts[key] = df_counts[key].astype(np.int64)
+        df_counts['count'] = np.diff(self.combination_offsets)
+        return df_counts
+
+    def take(self, rows):
+        """Index of the frame `df.iloc[rows]` (sorted positions), renumbering row IDs."""
+        rows = np.asarray(rows, dtype=np.int64)
+        return self._renumbered([(self, rows, 0)], len(rows))
+
+    @classmethod
+    def concat(cls, indexes):
+        """Index of the row-wise concatenation of the indexed frames."""
+        parts, start = [], 0
+        for index in indexes:
+            parts.append((index, None, start))
+            start += index.n_rows
+        return cls._renumbered(parts, start)
+
+    @classmethod
+    def _renumbered(cls, parts, n_rows):
+        """Merge (index, kept sorted rows or None, row offset) parts by re-expanding their postings."""
+        field_keys, field_rows, combination_keys, combination_rows = [], [], [], []
+        trace_values = []
+        for index, keep, start in parts:
+            for keys, offsets, postings, out_keys, out_rows in (
+                    (index.field_keys, index.field_offsets, index.field_postings, field_keys, field_rows),
+                    (index.combination_keys, index.combination_offsets, index.combination_postings,
+                     combination_keys, combination_rows)):
+                key_rows = np.repeat(np.arange(len(keys)), np.diff(offsets))
+                postings = np.asarray(postings)
+                if keep is not None:
+                    # New position of each kept row, dropping the others
+                    positions = np.searchsorted(keep, postings)
+                    found = (positions < len(keep)) & (keep[np.minimum(positions, len(keep) - 1)] == postings) \
+                        if len(keep) else np.zeros(len(postings), dtype=bool)
+                    key_rows, postings = key_rows[found], positions[found]
+                out_keys.append(keys.iloc[key_rows])
+                out_rows.append(postings.astype(np.int64) + start)
+            codes = np.asarray(index.trace_codes) if keep is None else np.asarray(index.trace_codes)[keep]
+            trace_values.append(np.where(codes >= 0, index.trace_ids[np.maximum(codes, 0)], None)
+                                if len(index.trace_ids) else np.full(len(codes), None, dtype=object))
+
+        field_keys, field_offsets, field_postings = _postings(
+            pd.concat(field_keys, ignore_index=True), np.concatenate(field_rows))
+        combination_keys, combination_offsets, combination_postings = _postings(
+            pd.concat(combination_keys, ignore_index=True), np.concatenate(combination_rows))
+        trace_codes, trace_ids = pd.factorize(pd.Series(np.concatenate(trace_values), dtype=object), sort=True)
+        return cls(n_rows, field_keys, field_offsets, field_postings,
+                   combination_keys, combination_offsets, combination_postings,
+                   trace_codes.astype(np.int32), np.asarray(trace_ids, dtype=object))
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        arrays = {
+            'field_values': self.field_keys['value'].to_numpy(dtype=np.int64),
+            'field_offsets': self.field_offsets,
+            'field_postings': self.field_postings,
+            'combination_keys': self.combination_keys[EXECUTE_EVENT_FIELDS].to_numpy(dtype=np.float64),
+            'combination_offsets': self.combination_offsets,
+            'combination_postings': self.combination_postings,
+            'trace_codes': self.trace_codes,
+        }
+        for name, values in arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), np.asarray(values))
+        with open(os.path.join(path, "keys.json"), 'w', encoding='utf-8') as f:
+            json.dump({
+                'n_rows': int(self.n_rows),
+                'fields': self.field_keys['field'].tolist(),
+                'trace_ids': [str(t) for t in self.trace_ids],
+            }, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Load an index written by `save`, with the posting arrays memory-mapped."""
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in ['field_values', 'field_offsets', 'field_postings', 'combination_keys',
+                         'combination_offsets', 'combination_postings', 'trace_codes']
+        }
+        with open(os.path.join(path, "keys.json"), encoding='utf-8') as f:
+            keys = json.load(f)
+        field_keys = pd.DataFrame({'field': pd.Series(keys['fields'], dtype=object),
+                                   'value': np.asarray(arrays['field_values'])})
+        combination_keys = pd.DataFrame(np.asarray(arrays['combination_keys']).reshape(-1, len(EXECUTE_EVENT_FIELDS)),
+                                        columns=EXECUTE_EVENT_FIELDS)
+        return cls(keys['n_rows'], field_keys, arrays['field_offsets'], arrays['field_postings'],
+                   combination_keys, arrays['combination_offsets'], arrays['combination_postings'],
+                   arrays['trace_codes'], np.asarray(keys['trace_ids'], dtype=object))
+
+
+def event_index_for(logs):
+    """EventIndex of a parsed frame, or the saved partition indexes of a LogStoreReader."""
+    from log_store import LogStoreReader
+    if isinstance(logs, LogStoreReader):
+        return logs.event_index()
+    return EventIndex.build(logs)
+
+
+def intersect(*postings):
+    """AND of sorted row-ID arrays (smallest first, so each step shrinks)."""
+    if not postings:
+        return np.array([], dtype=np.int64)
+    postings = sorted(postings, key=len)
+    result = np.asarray(postings[0])
+    for other in postings[1:]:
+        result = np.intersect1d(result, other, assume_unique=True)
+    return result
+
+
+def union(*postings):
+    """OR of sorted row-ID arrays."""
+    if not postings:
+        return np.array([], dtype=np.int64)
+    if len(postings) == 1:
+        return np.asarray(postings[0])
+    return np.unique(np.concatenate(postings))
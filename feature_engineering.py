@@ -1,8 +1,6 @@
 import pandas as pd
-from sklearn.preprocessing import StandardScaler
-from sklearn.decomposition import PCA
-from sentence_transformers import SentenceTransformer
 import os
+from instrumentation import instrumented
 
 def load_data(file_path="output/task2_stopwatch_features.csv"):
     """
@@ -18,6 +16,9 @@ def preprocess_data(df):
     Preprocess the data: normalize numeric features, apply sentence transformer to `stopwatch_name`, 
     and create any additional features.
     """
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.decomposition import PCA
+    from sentence_transformers import SentenceTransformer
     # ✅ Step 1: Normalize numeric features
     feature_columns = ['total_time_sec', 'max_subtask_percent', 'sum_other_subtask_time', 'ratio_other_to_max']
     X = df[feature_columns]
@@ -64,6 +65,7 @@ def save_preprocessed_data(df, output_path="output/preprocessed_clustering_featu
     print(f"✅ Preprocessed data saved to {output_path}")
 
 
+@instrumented()
 def process(input_csv="output/task2_stopwatch_features.csv", output_csv="output/preprocessed_clustering_features.csv"):
     """
     Load, preprocess, and save the features.
@@ -1,47 +1,24 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import math
 import os
+from instrumentation import instrumented
+from log_store import resolve_logs
+from event_index import EXECUTE_EVENT_FIELDS, event_index_for, _int_values
 
-def analyze_execute_event_flat(df_logs_parsed, output_csv="output/task1_global_field_combination.csv"):
+
+def _is_field_column(col):
+    return any(key in col for key in EXECUTE_EVENT_FIELDS)
+
+@instrumented()
+def analyze_execute_event_flat(df_logs_parsed, output_csv="output/task1_global_field_combination.csv", index=None):
     """
     Extract and count combinations of [FileTypeID, EventID, FieldID, CommandID]
     from all columns in a flat way (regardless of hierarchy).
+    Counts are the posting-list lengths of an EventIndex: `index` if given, the
+    one saved with the log store for a LogStoreReader, else built from the frame.
     """
-    target_fields = ['FileTypeID', 'EventID', 'FieldID', 'CommandID']
-
-    # 🔍 Find all columns containing each field name
-    field_columns = {
-        key: [col for col in df_logs_parsed.columns if key in col]
-        for key in target_fields
-    }
-
-    # 🧱 Build flat combinations
-    combinations = []
-    for idx, row in df_logs_parsed.iterrows():
-        entry = {}
-        for key in target_fields:
-            for col in field_columns[key]:
-                val = row[col]
-                if pd.notnull(val):
-                    try:
-                        entry[key] = int(val)
-                        break
-                    except (ValueError, TypeError):
-                        continue
-            if key not in entry:
-                entry[key] = np.nan
-        combinations.append(entry)
-
-    # 📊 Create grouped dataframe
-    df_combinations = pd.DataFrame(combinations)
-    df_grouped = (
-        df_combinations.groupby(target_fields, dropna=False)
-        .size()
-        .reset_index(name='count')
-        .sort_values(by='count', ascending=False)
-    )
+    df_grouped = _flat_combination_counts(df_logs_parsed, index)
 
     os.makedirs(os.path.dirname(output_csv), exist_ok=True)
     df_grouped.to_csv(output_csv, index=False)
@@ -49,38 +26,23 @@ def analyze_execute_event_flat(df_logs_parsed, output_csv="output/task1_global_f
     return df_grouped
 
 
+def _flat_combination_counts(df_logs_parsed, index=None):
+    if index is None:
+        index = event_index_for(df_logs_parsed)
+    return index.combination_counts().sort_values(by='count', ascending=False)
 
 
-
-def plot_execute_event_combinations(df_logs_parsed, records_per_plot=20, save_dir="output/figures"):
+@instrumented()
+def plot_execute_event_combinations(df_logs_parsed, records_per_plot=20, save_dir="output/figures", index=None):
     """
     Visualize grouped ExecuteEvent combinations in bar chart subplots.
     Each group of 20 records is saved as a separate PNG file.
     """
+    import matplotlib.pyplot as plt
     os.makedirs(save_dir, exist_ok=True)
 
-    target_fields = ['FileTypeID', 'EventID', 'FieldID', 'CommandID']
-    field_columns = {key: [col for col in df_logs_parsed.columns if key in col] for key in target_fields}
-    combinations = []
-
-    for idx, row in df_logs_parsed.iterrows():
-        entry = {}
-        for key in target_fields:
-            for col in field_columns[key]:
-                val = row[col]
-                if pd.notnull(val):
-                    try:
-                        entry[key] = int(val)
-                        break
-                    except (ValueError, TypeError):
-                        continue
-            if key not in entry:
-                entry[key] = float('nan')
-        combinations.append(entry)
-
-    df_combinations = pd.DataFrame(combinations)
-    df_grouped = df_combinations.groupby(target_fields, dropna=False).size().reset_index(name='count')
-    df_grouped = df_grouped.sort_values(by='count', ascending=False)
+    target_fields = EXECUTE_EVENT_FIELDS
+    df_grouped = _flat_combination_counts(df_logs_parsed, index)
 
     # Filter out all-NaN rows and create labels
     df_grouped_no_nan = df_grouped[~(df_grouped[target_fields].isnull().all(axis=1))].copy()
@@ -116,38 +78,81 @@ def plot_execute_event_combinations(df_logs_parsed, records_per_plot=20, save_di
         plt.close()
 
 
-def analyze_execute_event_hierarchy(df_logs_parsed, output_csv="output/task1_hierarchy_field_combination.csv"):
+HIERARCHY_FIELDS = ['CommandID', 'EventID', 'FieldID', 'FileTypeID']
+HIERARCHY_KEYS = ['Field', 'JSON_Path', 'Value']
+
+
+def hierarchy_counts(df_logs_parsed):
+    """
+    Partial state of Task 1 Method 2: a count Series indexed by
+    (Field, JSON_Path, Value) for one frame, file or chunk. States of disjoint
+    chunks add up with `merge_hierarchy_counts`, so chunks can be counted in
+    parallel and new files added without recounting history.
+    """
+    df_logs_parsed, _ = resolve_logs(df_logs_parsed, columns=_is_field_column)
+    parts = []
+    for field in HIERARCHY_FIELDS:
+        columns = [col for col in df_logs_parsed.columns if field in col]
+        # 🧱 Long form: (column, value) of every int-castable cell, stacked column by column
+        paths, values = [], []
+        for i, col in enumerate(columns):
+            col_values = _int_values(df_logs_parsed[col])
+            present = ~np.isnan(col_values)
+            values.append(col_values[present].astype(np.int64))
+            paths.append(np.full(int(present.sum()), i, dtype=np.int64))
+        if not columns or not sum(len(v) for v in values):
+            continue
+
+        counts = pd.DataFrame({'path': np.concatenate(paths), 'Value': np.concatenate(values)}).value_counts(sort=False)
+        path_codes = counts.index.get_level_values('path').to_numpy()
+        parts.append(pd.Series(counts.to_numpy(dtype=np.int64), index=pd.MultiIndex.from_arrays(
+            [np.full(len(counts), field, dtype=object), np.asarray(columns, dtype=object)[path_codes],
+             counts.index.get_level_values('Value').to_numpy(dtype=np.int64)],
+            names=HIERARCHY_KEYS)))
+
+    if not parts:
+        return _empty_hierarchy_counts()
+    return pd.concat(parts).sort_index()
+
+
+def _empty_hierarchy_counts():
+    index = pd.MultiIndex.from_arrays([np.array([], dtype=object), np.array([], dtype=object),
+                                       np.array([], dtype=np.int64)], names=HIERARCHY_KEYS)
+    return pd.Series(np.array([], dtype=np.int64), index=index)
+
+
+def merge_hierarchy_counts(*partials):
+    """Sum partial `hierarchy_counts` states (e.g. one per file or per day)."""
+    partials = [counts for counts in partials if len(counts)]
+    if not partials:
+        return _empty_hierarchy_counts()
+    return pd.concat(partials).groupby(level=HIERARCHY_KEYS, sort=True).sum().astype(np.int64)
+
+
+def load_hierarchy_counts(csv_path):
+    """Counts state back from a Task 1 Method 2 CSV, to be merged with newer files."""
+    df_summary = pd.read_csv(csv_path, dtype={'Field': object, 'JSON_Path': object})
+    if df_summary.empty:
+        return _empty_hierarchy_counts()
+    return df_summary.set_index(HIERARCHY_KEYS)['Count'].astype(np.int64).sort_index()
+
+
+@instrumented()
+def analyze_execute_event_hierarchy(df_logs_parsed, output_csv="output/task1_hierarchy_field_combination.csv",
+                                    previous_counts=None):
     """
     Task 1 - Method 2:
     Count occurrences of CommandID, EventID, FieldID, and FileTypeID
     with respect to their exact JSON column path (hierarchy-aware).
+    `df_logs_parsed` may also be a LogStoreReader (only ID columns are read).
+    `previous_counts` (e.g. `load_hierarchy_counts(output_csv)`) is added to
+    the counts of `df_logs_parsed`, to update the table with new files only.
     """
-    target_fields = ['CommandID', 'EventID', 'FieldID', 'FileTypeID']
-    hierarchy_data = []
-
-    field_column_map = {
-        key: [col for col in df_logs_parsed.columns if key in col]
-        for key in target_fields
-    }
-
-    for field, columns in field_column_map.items():
-        for col in columns:
-            non_null_values = df_logs_parsed[col].dropna()
-            for val in non_null_values:
-                try:
-                    val_int = int(val)
-                    hierarchy_data.append((field, col, val_int))
-                except (ValueError, TypeError):
-                    continue
-
-    df_hierarchy = pd.DataFrame(hierarchy_data, columns=['Field', 'JSON_Path', 'Value'])
-    df_summary = (
-        df_hierarchy
-        .groupby(['Field', 'JSON_Path', 'Value'])
-        .size()
-        .reset_index(name='Count')
-        .sort_values(by='Count', ascending=False)
-    )
+    counts = hierarchy_counts(df_logs_parsed)
+    if previous_counts is not None:
+        counts = merge_hierarchy_counts(previous_counts, counts)
+
+    df_summary = counts.reset_index(name='Count').sort_values(by='Count', ascending=False)
     os.makedirs(os.path.dirname(output_csv), exist_ok=True)
     df_summary.to_csv(output_csv, index=False)
     
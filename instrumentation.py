@@ -0,0 +1,289 @@
+import os
+import re
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager
+
+# Off unless enabled here or through the environment, e.g.
+#   PIPELINE_METRICS=1 PIPELINE_PROFILE=cprofile python main.py
+_config = {
+    'enabled': os.environ.get('PIPELINE_METRICS', '') == '1',
+    'json_log': os.environ.get('PIPELINE_METRICS_LOG', 'output/metrics/stages.jsonl'),
+    'prometheus_path': os.environ.get('PIPELINE_METRICS_PROM', 'output/metrics/pipeline.prom'),
+    'profiler': os.environ.get('PIPELINE_PROFILE') or None,
+    'profile_dir': os.environ.get('PIPELINE_PROFILE_DIR', 'output/metrics/profiles'),
+}
+_latest = {}
+_lock = threading.Lock()
+_active = threading.local()
+
+PROMETHEUS_METRICS = [
+    # (record key, metric name, help text, scale to the metric's base unit, integer-valued)
+    ('wall_sec', 'pipeline_stage_wall_seconds', 'Wall-clock time of the last run', 1, False),
+    ('cpu_sec', 'pipeline_stage_cpu_seconds', 'Process CPU time of the last run', 1, False),
+    ('peak_rss_mb', 'pipeline_stage_peak_rss_bytes', 'Peak resident memory during the last run', 1e6, True),
+    ('rows_in', 'pipeline_stage_rows_in', 'Rows passed in to the last run', 1, True),
+    ('rows_out', 'pipeline_stage_rows_out', 'Rows returned by the last run', 1, True),
+    ('bytes_read', 'pipeline_stage_read_bytes', 'Bytes read by the process during the last run', 1, True),
+    ('bytes_written', 'pipeline_stage_written_bytes', 'Bytes written by the process during the last run', 1, True),
+]
+PROMETHEUS_COUNTERS = [
+    # (metric name, help text, increment for a record)
+    ('pipeline_stage_runs_total', 'Completed stage runs', lambda record: 1),
+    ('pipeline_stage_errors_total', 'Stage runs that raised', lambda record: int(record['status'] == 'error')),
+]
+_SERIES_PATTERN = re.compile(r'^(\w+)\{stage="([^"]*)"\} (\S+)$')
+
+
+def configure(enabled=True, json_log=None, prometheus_path=None, profiler=None, profile_dir=None):
+    """
+    Turn instrumentation on or off. `profiler` is None, 'cprofile' or
+    'pyinstrument' (one profile file per stage run under `profile_dir`).
+    Passing None for a path keeps its current value.
+    """
+    _config['enabled'] = enabled
+    _config['profiler'] = profiler
+    for key, value in (('json_log', json_log), ('prometheus_path', prometheus_path), ('profile_dir', profile_dir)):
+        if value is not None:
+            _config[key] = value
+
+
+def is_enabled():
+    return _config['enabled']
+
+
+def current_rss_mb():
+    """Resident set size of this process (falls back to the peak where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def _io_bytes():
+    """(bytes read, bytes written) by this process so far, or (None, None) without /proc."""
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(':') for line in f.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, ValueError, KeyError):
+        return None, None
+
+
+class PeakRSS:
+    """Samples RSS in a background thread while the block runs and keeps the maximum."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak_mb = current_rss_mb()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+
+def _row_count(obj):
+    """Rows of a DataFrame/Series (or of the first element of a returned tuple)."""
+    if isinstance(obj, tuple) and obj:
+        obj = obj[0]
+    if hasattr(obj, 'shape') and hasattr(obj, 'iloc'):
+        return int(obj.shape[0])
+    return None
+
+
+class _Profiler:
+    def __init__(self, kind):
+        self.kind = kind
+        if kind == 'pyinstrument':
+            from pyinstrument import Profiler
+            self.profiler = Profiler()
+        else:
+            import cProfile
+            self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.profiler.start() if self.kind == 'pyinstrument' else self.profiler.enable()
+
+    def stop(self, name):
+        os.makedirs(_config['profile_dir'], exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        if self.kind == 'pyinstrument':
+            self.profiler.stop()
+            path = os.path.join(_config['profile_dir'], f"{name}-{stamp}.html")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self.profiler.output_html())
+        else:
+            self.profiler.disable()
+            self.profiler.dump_stats(os.path.join(_config['profile_dir'], f"{name}-{stamp}.prof"))
+
+
+def _read_series(path):
+    """{(metric, stage): value text} of the series in an existing textfile."""
+    series = {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                match = _SERIES_PATTERN.match(line.strip())
+                if match:
+                    series[(match[1], match[2])] = match[3]
+    except FileNotFoundError:
+        pass
+    return series
+
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive lock on `path` + '.lock' across processes (no-op where fcntl is unavailable)."""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(path + '.lock', 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _write_prometheus(record):
+    """
+    Merge one stage record into the textfile: its gauges replace that stage's
+    previous values and its counters are added to the totals already in the
+    file, so series written by other runs and processes are kept.
+    """
+    path = _config['prometheus_path']
+    if not path:
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with _file_lock(path):
+        series = _read_series(path)
+        for key, metric, _, scale, integer in PROMETHEUS_METRICS:
+            if record.get(key) is not None:
+                value = record[key] * scale
+                series[(metric, record['stage'])] = str(int(round(value))) if integer else repr(float(value))
+        for metric, _, increment in PROMETHEUS_COUNTERS:
+            previous = series.get((metric, record['stage']), '0')
+            series[(metric, record['stage'])] = str(int(float(previous)) + increment(record))
+
+        lines = []
+        metrics = [(metric, help_text, 'gauge') for _, metric, help_text, _, _ in PROMETHEUS_METRICS]
+        metrics += [(metric, help_text, 'counter') for metric, help_text, _ in PROMETHEUS_COUNTERS]
+        for metric, help_text, kind in metrics:
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+            lines += [f'{metric}{{stage="{name}"}} {series[(m, name)]}'
+                      for m, name in sorted(series) if m == metric]
+
+        # Write-then-rename so the textfile collector never reads a partial file;
+        # the temporary name is per process so concurrent workers do not collide
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+
+def _emit(record):
+    with _lock:
+        _latest[record['stage']] = record
+        if _config['json_log']:
+            os.makedirs(os.path.dirname(_config['json_log']) or ".", exist_ok=True)
+            with open(_config['json_log'], 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + "\n")
+        _write_prometheus(record)
+
+
+class StageRecord(dict):
+    """Metrics of one stage run; set `rows_out` on it inside a `stage` block if known."""
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """
+    Record wall time, CPU time, peak RSS, rows in/out and bytes read/written
+    for the block, then emit them as a JSON log line and Prometheus gauges.
+    Yields a StageRecord (or None when instrumentation is disabled).
+    """
+    if not _config['enabled']:
+        yield None
+        return
+
+    record = StageRecord(stage=name, parent=getattr(_active, 'name', None), rows_in=rows_in, rows_out=None)
+    _active.name, parent = name, record['parent']
+    # Only the outermost stage is profiled (profilers cannot nest)
+    profiler = _Profiler(_config['profiler']) if _config['profiler'] and parent is None else None
+    rss = PeakRSS()
+    read_before, written_before = _io_bytes()
+    started = time.time()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        with rss:
+            if profiler:
+                profiler.start()
+            try:
+                yield record
+            finally:
+                if profiler:
+                    profiler.stop(name)
+        record['status'] = 'ok'
+    except BaseException as e:
+        record['status'] = 'error'
+        record['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _active.name = parent
+        read_after, written_after = _io_bytes()
+        record.update(
+            started_at=time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)),
+            wall_sec=time.perf_counter() - wall,
+            cpu_sec=time.process_time() - cpu,
+            peak_rss_mb=rss.peak_mb,
+            bytes_read=read_after - read_before if read_before is not None else None,
+            bytes_written=written_after - written_before if written_before is not None else None,
+        )
+        _emit(dict(record))
+
+
+def instrumented(name=None):
+    """
+    Decorator form of `stage`: rows in are taken from the first DataFrame
+    argument, rows out from the returned DataFrame (or the first element of a
+    returned tuple). When disabled, the only cost is one flag check per call.
+    """
+    def decorate(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _config['enabled']:
+                return func(*args, **kwargs)
+            rows_in = next((n for n in map(_row_count, list(args) + list(kwargs.values())) if n is not None), None)
+            with stage(stage_name, rows_in) as record:
+                result = func(*args, **kwargs)
+                record['rows_out'] = _row_count(result)
+            return result
+
+        return wrapper
+    return decorate
+
+
+def latest_metrics():
+    """Last record per stage, as a list of dicts (for printing a summary)."""
+    return [dict(record) for record in _latest.values()]
@@ -0,0 +1,95 @@
+import re
+from collections import Counter
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, cpu_count
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+# Same tokenization as CountVectorizer's defaults (lowercase + token_pattern)
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+
+def tokenize_chunk(messages, stop_words=ENGLISH_STOP_WORDS):
+    """Exact term counts of one chunk of messages."""
+    text = "\n".join(messages).lower()
+    counts = Counter(TOKEN_PATTERN.findall(text))
+    for word in stop_words:
+        counts.pop(word, None)
+    return counts
+
+
+class KeywordCounter:
+    """
+    Bounded-memory, mergeable heavy-hitter counter for message terms.
+
+    Keeps at most `capacity` terms as a frequent-items (Misra-Gries /
+    Space-Saving style) summary. Whenever the summary grows past `capacity`,
+    the (capacity + 1)-th largest count is subtracted from every term and terms
+    at or below zero are dropped. Each reported count is a lower bound and
+    undercounts the true frequency by at most `error_bound`, which never
+    exceeds total_terms / (capacity + 1). Terms with a true frequency above
+    that bound are guaranteed to be kept.
+    """
+
+    def __init__(self, capacity=10_000, stop_words=ENGLISH_STOP_WORDS):
+        self.capacity = capacity
+        self.stop_words = stop_words
+        self.counts = pd.Series(dtype='int64')
+        self.error_bound = 0
+        self.total_terms = 0
+
+    def _absorb(self, counts, error=0):
+        self.counts = self.counts.add(counts, fill_value=0).astype('int64')
+        self.error_bound += error
+        if len(self.counts) > self.capacity:
+            cut = int(self.counts.nlargest(self.capacity + 1).iloc[-1])
+            self.counts = self.counts[self.counts > cut] - cut
+            self.error_bound += cut
+
+    def update(self, messages):
+        """Count one chunk of messages."""
+        chunk_counts = tokenize_chunk(messages, self.stop_words)
+        self.total_terms += sum(chunk_counts.values())
+        self._absorb(pd.Series(chunk_counts, dtype='int64'))
+        return self
+
+    def merge(self, other):
+        """Combine with a counter built on other messages (e.g. by another process)."""
+        self.total_terms += other.total_terms
+        self._absorb(other.counts, other.error_bound)
+        return self
+
+    def top(self, top_n=30):
+        """Top terms as a DataFrame indexed by term with a 'Frequency' column."""
+        counts = self.counts.sort_index()
+        order = np.lexsort((np.arange(len(counts)), -counts.values))[:top_n]
+        result = pd.DataFrame({'Frequency': counts.values[order]}, index=counts.index[order])
+        return result
+
+
+def count_keywords(messages, capacity=10_000, chunk_size=10_000, n_jobs=1):
+    """
+    Stream `messages` through KeywordCounter in chunks of `chunk_size`.
+    With n_jobs != 1, contiguous shares are counted in separate processes and
+    the resulting counters are merged.
+    """
+    messages = list(messages)
+
+    def count_share(share):
+        counter = KeywordCounter(capacity)
+        for start in range(0, len(share), chunk_size):
+            counter.update(share[start:start + chunk_size])
+        return counter
+
+    if n_jobs == 1 or len(messages) <= chunk_size:
+        return count_share(messages)
+
+    n_shares = max(1, min(len(messages) // chunk_size, n_jobs if n_jobs > 0 else cpu_count()))
+    bounds = np.linspace(0, len(messages), n_shares + 1).astype(int)
+    counters = Parallel(n_jobs=n_jobs)(
+        delayed(count_share)(messages[start:end]) for start, end in zip(bounds[:-1], bounds[1:])
+    )
+    total = counters[0]
+    for counter in counters[1:]:
+        total.merge(counter)
+    return total
@@ -1,47 +1,319 @@
 import pandas as pd
+import numpy as np
 import json
 import re
+from joblib import Parallel, delayed
+from preprocess import first_truthy
+from instrumentation import instrumented
+from log_store import resolve_logs
 
-def detect_large_json_arrays(df_logs_parsed, array_length_threshold=500):
+LARGE_ARRAY_COLUMNS = ['line.message', 'line.mdc.trace_id', 'fields.TraceID', 'timestamp_raw']
+
+RECEIVED_EVENT_PATTERN = re.compile(r"Received event result from database: ({.*})")
+
+# Byte classes for the scanner, looked up in one pass over the payload
+_OTHER, _QUOTE, _OPENER, _CLOSER, _COMMA, _WHITESPACE = range(6)
+_BYTE_CLASS = np.zeros(256, dtype=np.uint8)
+_BYTE_CLASS[ord('"')] = _QUOTE
+_BYTE_CLASS[[ord('{'), ord('[')]] = _OPENER
+_BYTE_CLASS[[ord('}'), ord(']')]] = _CLOSER
+_BYTE_CLASS[ord(',')] = _COMMA
+_BYTE_CLASS[[ord(' '), ord('\t'), ord('\r'), ord('\n')]] = _WHITESPACE
+# bytes.translate table mapping quotes and structural bytes to 1, everything else to 0
+_TOKEN_TABLE = ((_BYTE_CLASS != _OTHER) & (_BYTE_CLASS != _WHITESPACE)).astype(np.uint8).tobytes()
+
+_BACKSLASH = ord('\\')
+_OPEN_ARRAY, _CLOSE_ARRAY = ord('['), ord(']')
+_BEFORE_STRING = np.zeros(256, dtype=bool)
+_BEFORE_STRING[list(b'{[,:')] = True
+_AFTER_STRING = np.zeros(256, dtype=bool)
+_AFTER_STRING[list(b',:]}')] = True
+
+
+def _skip_whitespace(buf, positions, step):
+    """Move each position by `step` until it lands on a non-whitespace byte (or leaves `buf`)."""
+    positions = positions.copy()
+    pending = np.ones(len(positions), dtype=bool)
+    while pending.any():
+        inside = (positions >= 0) & (positions < len(buf))
+        pending &= inside
+        pending[pending] = _BYTE_CLASS[buf[positions[pending]]] == _WHITESPACE
+        positions[pending] += step
+    return positions
+
+
+def _escaped_quotes(buf, quotes):
+    """
+    Which quotes are escaped inside a string once the payload is unescaped.
+
+    Unescaping `\\"` drops the last backslash in front of a quote, so a quote
+    after k backslashes keeps k - 1 of them: it still delimits a string when k
+    is 0 or odd and is an escaped quote (`\\\\"` -> `\\"`) when k is even.
+    """
+    run = np.zeros(len(quotes), dtype=np.int64)
+    pending = np.ones(len(quotes), dtype=bool)
+    while pending.any():
+        before = quotes - run - 1
+        pending &= before >= 0
+        pending[pending] = buf[before[pending]] == _BACKSLASH
+        run[pending] += 1
+    return (run > 0) & (run % 2 == 0)
+
+
+def _strings_well_formed(buf, opening, closing):
+    """
+    Cheap token check on string boundaries: an opening quote must follow one of
+    '{[,:' and a closing quote must be followed by one of ',:]}' (ignoring
+    whitespace). This rejects payloads whose quotes were broken by unescaping,
+    which `json.loads` would refuse, without validating the whole document.
+    """
+    # The backslash of an escaped `\\"` sits between the quote and the token before it
+    before = _skip_whitespace(buf, opening - (buf[opening - 1] == _BACKSLASH) - 1, -1)
+    if (before < 0).any() or not _BEFORE_STRING[buf[before]].all():
+        return False
+    after = _skip_whitespace(buf, closing + 1, 1)
+    after = after[after < len(buf)]
+    return bool(_AFTER_STRING[buf[after]].all())
+
+
+def _array_lengths(payload, complete=True):
+    """
+    Element counts of the arrays that are direct values of the top-level object.
+
+    Quotes and structural bytes are picked out with one `bytes.translate` pass
+    and then handled as one compact token stream. Quotes escaped inside strings
+    are dropped, string spans are masked out by the running parity of the
+    remaining quotes, bracket depth is a cumulative sum over the other tokens,
+    and an array's length is the number of depth-2 commas it owns (plus one
+    when it is non-empty). With `complete=False`, `buf` is a prefix of the
+    payload and the array still open at its end has a lower-bound count.
+
+    Returns (quotes, [(open_position, length, still_open), ...]) or None if a
+    complete payload is not a balanced object (e.g. truncated).
+    """
+    buf = np.frombuffer(payload, dtype=np.uint8)
+    tokens = np.flatnonzero(np.frombuffer(payload.translate(_TOKEN_TABLE), dtype=bool))
+    token_class = _BYTE_CLASS[buf[tokens]]
+
+    # Only a quote after two or more backslashes can be escaped (see `_escaped_quotes`)
+    if b'\\\\"' in payload:
+        quote_tokens = np.flatnonzero(token_class == _QUOTE)
+        escaped = quote_tokens[_escaped_quotes(buf, tokens[quote_tokens])]
+        tokens, token_class = np.delete(tokens, escaped), np.delete(token_class, escaped)
+
+    is_quote = token_class == _QUOTE
+    quote_tokens = np.flatnonzero(is_quote)
+    quotes = tokens[quote_tokens]
+    if complete and len(quotes) % 2:
+        return None
+    if len(quotes) and not _strings_well_formed(buf, quotes[0::2], quotes[1::2]):
+        return None
+
+    # Tokens outside of strings (the running quote parity is 0 before them)
+    outside = (np.cumsum(is_quote) % 2 == 0) & ~is_quote
+    outside[quote_tokens] = False
+    structural = tokens[outside]
+    chars = token_class[outside]
+    if len(structural) == 0:
+        return None if complete else (quotes, [])
+
+    step = (chars == _OPENER).astype(np.int64) - (chars == _CLOSER)
+    depth_after = np.cumsum(step)
+    if complete and (depth_after[-1] != 0 or (depth_after[:-1] <= 0).any()):
+        return None
+
+    # Top-level arrays open at depth 2; every depth-2 comma belongs to the
+    # latest container opened at depth 2.
+    is_container = (step == 1) & (depth_after == 2)
+    container_pos = structural[is_container]
+    container_is_array = buf[container_pos] == _OPEN_ARRAY
+    if not container_is_array.any():
+        return quotes, []
+
+    comma_pos = structural[(chars == _COMMA) & (depth_after == 2)]
+    owner = np.searchsorted(container_pos, comma_pos) - 1
+    commas = np.bincount(owner, minlength=len(container_pos))
+    # Only the last container can still be open at the end of a prefix
+    last_open = not complete and depth_after[-1] >= 2
+
+    lengths = []
+    for idx in np.flatnonzero(container_is_array):
+        start = int(container_pos[idx])
+        still_open = bool(last_open and idx == len(container_pos) - 1)
+        n_items = int(commas[idx])
+        if n_items:
+            n_items += 1
+        else:
+            # Either one element or an empty array
+            next_pos = np.searchsorted(structural, start, side='right')
+            if next_pos == len(structural) or buf[structural[next_pos]] == _CLOSE_ARRAY:
+                end = structural[next_pos] if next_pos < len(structural) else len(buf)
+                between = _BYTE_CLASS[buf[start + 1:end]]
+                n_items = int((between != _WHITESPACE).any())
+            else:
+                n_items = 1
+        lengths.append((start, n_items, still_open))
+    return quotes, lengths
+
+
+def _array_key(payload, quotes, start):
+    """
+    Decode the key of the top-level array opening at `start`: the last string
+    before it, with only ':' and whitespace in between. Only this token is
+    unescaped and decoded; None if it is not a valid key.
+    """
+    q = np.searchsorted(quotes, start) - 1
+    if q < 1 or payload[quotes[q] + 1:start].strip() != b':':
+        return None
+    raw_key = payload[quotes[q - 1]:quotes[q] + 1].replace(b'\\"', b'"').replace(b"\\'", b"'")
+    try:
+        key = json.loads(raw_key.decode('utf-8'))
+    except ValueError:
+        return None
+    return key if isinstance(key, str) else None
+
+
+def count_top_level_arrays(payload, array_length_threshold=500, stop_at_threshold=True,
+                           initial_window=1 << 16):
+    """
+    Scan a JSON object payload (bytes, still escaped as in `line.message`) and
+    return [(key, length, is_lower_bound), ...] for the top-level array values
+    longer than `array_length_threshold`. The payload is never decoded; only
+    the keys of the reported arrays are.
+
+    Payloads with fewer commas than the threshold cannot hold an oversized
+    array and are skipped straight away. By default (`stop_at_threshold=True`)
+    the payload is scanned in doubling prefixes and the scan stops at the
+    first prefix in which an array has passed the threshold: arrays closed
+    inside it get exact lengths, the array still open at its end is reported
+    with `is_lower_bound=True`, and later arrays are not looked at. With
+    `stop_at_threshold=False` the whole payload is scanned and every length
+    is exact. A key repeated in the object is reported once per array.
+
+    Returns None if the scanned bytes are not a balanced object (e.g.
+    truncated) or a reported key is not a valid string token.
+    """
+    if not payload.startswith(b'{'):
+        return None
+    if payload.count(b',') < array_length_threshold:
+        return []
+
+    window = len(payload) if not stop_at_threshold else min(initial_window, len(payload))
+    while True:
+        complete = window >= len(payload)
+        scanned = _array_lengths(payload if complete else payload[:window], complete=complete)
+        if scanned is None:
+            return None
+        quotes, lengths = scanned
+        oversized = [entry for entry in lengths if entry[1] > array_length_threshold]
+        if complete or oversized:
+            break
+        window *= 2
+
+    results = []
+    for start, n_items, still_open in oversized:
+        key = _array_key(payload, quotes, start)
+        if key is None:
+            return None
+        results.append((key, n_items, still_open))
+    return results
+
+
+def _scan_chunk(messages, array_length_threshold, stop_at_threshold):
+    """Scan one chunk of messages; returns a list of per-row results (or None)."""
+    results = []
+    for msg in messages:
+        match = RECEIVED_EVENT_PATTERN.search(msg)
+        if not match:
+            results.append(None)
+            continue
+        payload = match.group(1)
+        if payload.count(',') < array_length_threshold:
+            # Too few commas to hold an oversized array
+            results.append([])
+            continue
+        try:
+            payload = payload.encode('utf-8')
+            results.append(count_top_level_arrays(payload, array_length_threshold, stop_at_threshold))
+        except Exception:
+            results.append(None)
+    return results
+
+
+@instrumented()
+def detect_large_json_arrays(df_logs_parsed, array_length_threshold=500, n_jobs=-1, chunk_size=2000,
+                             stop_at_threshold=True, store=None):
     """
     Scan logs that contain 'Received event result from database' and detect
     embedded JSON arrays with more than `array_length_threshold` items.
-    
-    Returns a DataFrame with trace_id, timestamp, key name, and array length.
+
+    Payloads are scanned with `count_top_level_arrays` instead of being decoded,
+    in chunks of `chunk_size` rows spread over `n_jobs` worker processes. By
+    default a payload's scan stops once an array passes the threshold, so a
+    length can be a lower bound (`length_is_lower_bound`); pass
+    `stop_at_threshold=False` for exact lengths of every array. If the
+    PayloadStore from `clean_logs` is passed as `store`, its array summaries are
+    used and no message is touched at all. `df_logs_parsed` may also be a
+    LogStoreReader (only LARGE_ARRAY_COLUMNS and the PayloadStores are read).
+
+    Returns a DataFrame with trace_id, timestamp, key name, array length and
+    whether that length is a lower bound.
     """
+    df_logs_parsed, store = resolve_logs(df_logs_parsed, LARGE_ARRAY_COLUMNS, store, with_store=True)
+    if store is not None:
+        return _large_arrays_from_store(df_logs_parsed, store, array_length_threshold)
+
     df_received_events = df_logs_parsed[
         df_logs_parsed['line.message'].str.contains("Received event result from database", na=False)
-    ].copy()
+    ]
+
+    messages = df_received_events['line.message'].tolist()
+    trace_ids = first_truthy(df_received_events, ['line.mdc.trace_id', 'fields.TraceID'], 'UNKNOWN')
+    if 'timestamp_raw' in df_received_events.columns:
+        timestamps = df_received_events['timestamp_raw'].tolist()
+    else:
+        timestamps = ['UNKNOWN'] * len(messages)
+
+    chunks = [messages[i:i + chunk_size] for i in range(0, len(messages), chunk_size)]
+    if len(chunks) > 1 and n_jobs != 1:
+        chunk_results = Parallel(n_jobs=n_jobs)(
+            delayed(_scan_chunk)(chunk, array_length_threshold, stop_at_threshold) for chunk in chunks
+        )
+    else:
+        chunk_results = [_scan_chunk(chunk, array_length_threshold, stop_at_threshold) for chunk in chunks]
 
     oversized_arrays = []
+    row_results = (result for chunk in chunk_results for result in chunk)
+    for trace_id, timestamp, arrays in zip(trace_ids, timestamps, row_results):
+        for key, length, is_lower_bound in arrays or []:
+            oversized_arrays.append({
+                'trace_id': trace_id,
+                'timestamp': timestamp,
+                'array_key': key,
+                'array_length': length,
+                'length_is_lower_bound': is_lower_bound
+            })
 
-    for idx, row in df_received_events.iterrows():
-        msg = row['line.message']
-        trace_id = row.get('line.mdc.trace_id') or row.get('fields.TraceID') or 'UNKNOWN'
-        timestamp = row.get('timestamp_raw', 'UNKNOWN')
+    return pd.DataFrame(oversized_arrays)
 
-        try:
-            match = re.search(r"Received event result from database: ({.*})", msg)
-            if not match:
-                continue
-
-            json_str = match.group(1)
-            json_str = json_str.replace('\\"', '"').replace("\\'", "'")
-            parsed_json = json.loads(json_str)
-
-            for key, value in parsed_json.items():
-                if isinstance(value, list) and len(value) > array_length_threshold:
-                    oversized_arrays.append({
-                        'trace_id': trace_id,
-                        'timestamp': timestamp,
-                        'array_key': key,
-                        'array_length': len(value)
-                    })
 
-        except Exception:
-            continue
+def _large_arrays_from_store(df_logs_parsed, store, array_length_threshold):
+    """Task 3 straight from the PayloadStore array summaries."""
+    rows, keys, lengths = store.oversized_arrays(array_length_threshold)
+    df_rows = df_logs_parsed.iloc[rows]
+    trace_ids = first_truthy(df_rows, ['line.mdc.trace_id', 'fields.TraceID'], 'UNKNOWN')
+    if 'timestamp_raw' in df_rows.columns:
+        timestamps = df_rows['timestamp_raw'].tolist()
+    else:
+        timestamps = ['UNKNOWN'] * len(rows)
 
-    return pd.DataFrame(oversized_arrays)
+    return pd.DataFrame({
+        'trace_id': trace_ids,
+        'timestamp': timestamps,
+        'array_key': keys,
+        'array_length': lengths.tolist(),
+        'length_is_lower_bound': False
+    }) if len(rows) else pd.DataFrame()
 
 
 def preview_large_arrays(df_oversized):
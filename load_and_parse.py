@@ -1,38 +1,130 @@
 import os
+import io
+import bz2
+import gzip
 import json
+import shutil
+import subprocess
 import pandas as pd
 from typing import Union
+from instrumentation import instrumented
+
+LOG_FORMATS = ('.json', '.jsonl', '.ndjson')
+COMPRESSIONS = ('.gz', '.bz2', '.zst')
+# Used when installed: they decompress in their own process, in parallel with
+# parsing (pbzip2 also splits the decompression itself across threads)
+EXTERNAL_DECOMPRESSORS = {'.gz': ['pigz', '-dc'], '.bz2': ['pbzip2', '-dc'], '.zst': ['zstd', '-dcq']}
 
 # 📌 Utility: Recursively flatten a nested dictionary or list
-def recursive_flatten(obj, parent_key='', sep='.'):
-    """Flatten nested JSON/dict into dot notation"""
+def recursive_flatten(obj, parent_key='', sep='.', keep=None, descend=None):
+    """
+    Flatten nested JSON/dict into dot notation.
+    `descend(path)` limits the keys visited (whole subtrees are skipped) and
+    `keep(path)` the leaves returned; both default to everything.
+    """
     items = []
     if isinstance(obj, dict):
         for k, v in obj.items():
             new_key = f"{parent_key}{sep}{k}" if parent_key else k
-            items.extend(recursive_flatten(v, new_key, sep=sep).items())
+            if descend is None or descend(new_key):
+                items.extend(recursive_flatten(v, new_key, sep=sep, keep=keep, descend=descend).items())
     elif isinstance(obj, list):
         for i, v in enumerate(obj):
             new_key = f"{parent_key}[{i}]"
-            items.extend(recursive_flatten(v, new_key, sep=sep).items())
-    else:
+            if descend is None or descend(new_key):
+                items.extend(recursive_flatten(v, new_key, sep=sep, keep=keep, descend=descend).items())
+    elif keep is None or keep(parent_key):
         items.append((parent_key, obj))
     return dict(items)
 
 
+def log_file_type(file_name):
+    """(format, compression) of a log file name, e.g. ('.jsonl', '.gz'), or None if it is not a log file."""
+    base, compression = os.path.splitext(file_name)
+    if compression not in COMPRESSIONS:
+        base, compression = file_name, None
+    log_format = os.path.splitext(base)[1]
+    return (log_format, compression) if log_format in LOG_FORMATS else None
+
+
+def _open_log_file(file_path, compression):
+    """
+    Text stream of a (possibly compressed) log file, decompressed on the fly:
+    through an external decompressor's pipe if one is installed, else in-process.
+    Returns (stream, process or None).
+    """
+    if compression is None:
+        return open(file_path, 'r', encoding='utf-8'), None
+
+    command = EXTERNAL_DECOMPRESSORS[compression]
+    if shutil.which(command[0]):
+        process = subprocess.Popen(command + [file_path], stdout=subprocess.PIPE)
+        return io.TextIOWrapper(process.stdout, encoding='utf-8'), process
+    if compression == '.gz':
+        return gzip.open(file_path, 'rt', encoding='utf-8'), None
+    if compression == '.bz2':
+        return bz2.open(file_path, 'rt', encoding='utf-8'), None
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(f"Reading {file_path} needs the `zstd` command or the zstandard package")
+    return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), closefd=True),
+                            encoding='utf-8'), None
+
+
+def read_log_file(file_path):
+    """Raw records of one log file: a JSON array (.json) or one record per line (.jsonl/.ndjson)."""
+    log_format, compression = log_file_type(os.path.basename(file_path))
+    f, process = _open_log_file(file_path, compression)
+    try:
+        with f:
+            if log_format == '.json':
+                content = json.load(f)
+            else:
+                content = [json.loads(line) for line in f if line.strip()]
+    finally:
+        # A decompressor error explains any parse error; a negative status is
+        # SIGPIPE from closing the stream after a parse error
+        if process is not None and process.wait() > 0:
+            raise OSError(f"{process.args[0]} exited with status {process.returncode}")
+    return content
+
+
+def _read_log_file_safe(file_path):
+    try:
+        content = read_log_file(file_path)
+        print(f"✅ Loaded {len(content)} records from {os.path.basename(file_path)}")
+        return content
+    except Exception as e:
+        print(f"⚠️ Error reading {file_path}: {e}")
+        return []
+
+
 # ✅ Main function to load and flatten all logs
-def load_all_logs(data_folder="data"):
+@instrumented()
+def load_all_logs(data_folder="data", n_jobs=-1, projection=None):
+    """
+    Load and flatten every log file in `data_folder`: .json arrays and
+    .jsonl/.ndjson lines, each optionally .gz/.bz2/.zst compressed. Files are
+    decompressed as a stream (no temporary files) and read by `n_jobs`
+    threads; decompression and file I/O release the GIL.
+    With a `projection` (see projection.py), only its columns are flattened
+    and other `fields`/`line` subtrees are skipped.
+    """
     raw_logs = []
-    json_files = [os.path.join(data_folder, f) for f in os.listdir(data_folder) if f.endswith(".json")]
+    log_files = [os.path.join(data_folder, f) for f in os.listdir(data_folder) if log_file_type(f)]
 
-    for file_path in json_files:
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = json.load(f)
-                raw_logs.extend(content)
-                print(f"✅ Loaded {len(content)} records from {os.path.basename(file_path)}")
-        except Exception as e:
-            print(f"⚠️ Error reading {file_path}: {e}")
+    if n_jobs == 1 or len(log_files) <= 1:
+        contents = [_read_log_file_safe(file_path) for file_path in log_files]
+    else:
+        from joblib import Parallel, delayed
+        contents = Parallel(n_jobs=n_jobs, prefer='threads')(
+            delayed(_read_log_file_safe)(file_path) for file_path in log_files
+        )
+    for content in contents:
+        raw_logs.extend(content)
+    keep = projection.keeps if projection is not None else None
+    descend = projection.visits if projection is not None else None
 
     all_flattened_logs = []
 
@@ -41,22 +133,25 @@ def load_all_logs(data_folder="data"):
         flattened_entry["timestamp_raw"] = entry.get("timestamp")
 
         if "fields" in entry:
-            flattened_entry.update(recursive_flatten(entry["fields"], parent_key="fields"))
+            flattened_entry.update(recursive_flatten(entry["fields"], parent_key="fields", keep=keep, descend=descend))
 
         try:
             line_data = json.loads(entry["line"])
             for key, value in line_data.items():
+                if descend is not None and not descend(f"line.{key}"):
+                    continue
                 if isinstance(value, str):
                     try:
                         parsed_inner = json.loads(value)
                         if isinstance(parsed_inner, dict):
-                            flattened_entry.update(recursive_flatten(parsed_inner, parent_key=f"line.{key}"))
+                            flattened_entry.update(recursive_flatten(parsed_inner, parent_key=f"line.{key}",
+                                                                     keep=keep, descend=descend))
                         else:
                             flattened_entry[f"line.{key}"] = parsed_inner
                     except json.JSONDecodeError:
                         flattened_entry[f"line.{key}"] = value
                 elif isinstance(value, dict):
-                    flattened_entry.update(recursive_flatten(value, parent_key=f"line.{key}"))
+                    flattened_entry.update(recursive_flatten(value, parent_key=f"line.{key}", keep=keep, descend=descend))
                 else:
                     flattened_entry[f"line.{key}"] = value
         except json.JSONDecodeError:
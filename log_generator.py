@@ -0,0 +1,129 @@
+import os
+import json
+import numpy as np
+
+LOGGERS = [
+    'com.eresult.tf.EventService', 'com.eresult.tf.DatabaseClient',
+    'com.eresult.tf.FileImporter', 'com.eresult.tf.SyncJob',
+]
+STOPWATCHES = {
+    'execute event on file temp': ['read', 'parse', 'write', 'commit'],
+    'load file': ['open', 'read', 'parse'],
+    'sync': ['fetch', 'merge', 'commit'],
+}
+OTHER_MESSAGES = [
+    "Connection opened", "Connection closed", "User login ok",
+    "Cache miss for key {}", "File {} moved to archive",
+]
+NS_PER_SEC = 10**9
+
+
+def _escaped(obj):
+    """JSON embedded in a message the way the service logs it (quotes escaped)."""
+    return json.dumps(obj).replace('"', '\\"')
+
+
+def _execute_event(rng):
+    event = {
+        'FileTypeID': int(rng.integers(1, 5)),
+        'EventID': int(rng.integers(1, 40)),
+        'FieldID': int(rng.integers(1, 200)),
+        'CommandID': int(rng.integers(1, 4)),
+    }
+    return "Executing stored procedure: EXEC P_MS_TF_ExecuteEvent " + _escaped({'Event': event})
+
+
+def _received_event(rng, large, large_array_size):
+    n_rows = large_array_size if large else int(rng.integers(1, 20))
+    payload = {
+        'EventID': int(rng.integers(1, 40)),
+        'Rows': [{'FieldID': int(i), 'Value': f"value {i}"} for i in range(n_rows)],
+        'Status': 'OK',
+    }
+    return "Received event result from database: " + _escaped(payload)
+
+
+def _stopwatch(rng, anomalous):
+    name = list(STOPWATCHES)[int(rng.integers(len(STOPWATCHES)))]
+    subtasks = STOPWATCHES[name]
+    total = float(rng.lognormal(0, 0.6))
+    shares = rng.dirichlet(np.full(len(subtasks), 0.5))
+    if anomalous:
+        # Much slower, with the time spread over subtasks that are normally small
+        total *= float(rng.uniform(10, 40))
+        shares = rng.dirichlet(np.full(len(subtasks), 5.0))
+
+    lines = [f"{total * share:.3f}  {int(round(share * 100)):02d}%  {task}" for share, task in zip(shares, subtasks)]
+    return (f"StopWatch '{name}': {total:.3f} seconds\n"
+            "---------------------------------------------\n"
+            "seconds  %  Task name\n"
+            "---------------------------------------------\n" + "\n".join(lines))
+
+
+def _record(rng, timestamp_ns, trace_id, message):
+    level = 'ERROR' if rng.random() < 0.02 else 'INFO'
+    line = {
+        'timestamp': int(timestamp_ns // 10**6),
+        'level': level,
+        'logger': LOGGERS[int(rng.integers(len(LOGGERS)))],
+        'message': message,
+        'mdc': {'trace_id': trace_id},
+    }
+    return {
+        'timestamp': str(timestamp_ns),
+        'fields': {'detected_level': level.lower(), 'TraceID': trace_id, 'service_name': 'tf-service'},
+        'line': json.dumps(line),
+    }
+
+
+def _trace_records(rng, trace_id, start_ns, anomaly_rate, large_array_rate, large_array_size):
+    """One ExecuteEvent session: call, database result, StopWatch blocks and chatter."""
+    messages = [_execute_event(rng),
+                _received_event(rng, rng.random() < large_array_rate, large_array_size)]
+    messages += [_stopwatch(rng, rng.random() < anomaly_rate) for _ in range(int(rng.integers(1, 4)))]
+    if rng.random() < 0.3:
+        messages.append("Executing stored procedure: P_MS_TF_Cleanup")
+    for _ in range(int(rng.integers(0, 3))):
+        template = OTHER_MESSAGES[int(rng.integers(len(OTHER_MESSAGES)))]
+        messages.append(template.format(int(rng.integers(1, 10_000))))
+
+    offsets = np.cumsum(rng.exponential(0.2 * NS_PER_SEC, size=len(messages))).astype(np.int64)
+    return [_record(rng, start_ns + int(offset), trace_id, msg) for offset, msg in zip(offsets, messages)]
+
+
+def generate_synthetic_logs(output_dir="data", n_records=10_000, n_files=4, anomaly_rate=0.01,
+                            large_array_rate=0.02, large_array_size=1_000, days=7,
+                            start_ns=1_700_000_000 * NS_PER_SEC, seed=42):
+    """
+    Write synthetic SQL Server service logs as `log_<i>.json` files in
+    `output_dir`, in the format `load_all_logs` reads. Each trace has an
+    ExecuteEvent call, a 'Received event result from database' payload (with a
+    `large_array_size`-row array at `large_array_rate`), 1-3 StopWatch blocks
+    with subtask tables (slow and evenly spread at `anomaly_rate`) and some
+    unrelated messages. Returns the list of written file paths.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+
+    records = []
+    trace_number = 0
+    while len(records) < n_records:
+        start = start_ns + int(rng.integers(0, days * 86_400)) * NS_PER_SEC
+        records.extend(_trace_records(rng, f"trace-{trace_number:08d}", start,
+                                      anomaly_rate, large_array_rate, large_array_size))
+        trace_number += 1
+    records = records[:n_records]
+
+    paths = []
+    for i, chunk in enumerate(np.array_split(np.arange(len(records)), n_files)):
+        path = os.path.join(output_dir, f"log_{i}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump([records[j] for j in chunk], f)
+        paths.append(path)
+
+    print(f"🧪 Generated {len(records)} log records ({trace_number} traces) in {len(paths)} files under {output_dir}")
+    return paths
+
+
+if __name__ == "__main__":
+    generate_synthetic_logs()
@@ -0,0 +1,459 @@
+import os
+import json
+import shutil
+import operator
+import numpy as np
+import pandas as pd
+from payload_store import PayloadStore, PayloadStoreBuilder
+from event_index import EventIndex, INDEX_DIR, is_index_column
+from eda import EDAAggregates
+
+STORE_DIR = "output/log_store"
+MANIFEST = "_manifest.json"
+UNKNOWN_DATE = "unknown"
+EDA_DIR = "eda_aggregates"
+# columns.bin layout: 2 = .npy arrays per column (1 was pickled Series, no longer read)
+STORE_FORMAT = 2
+
+_OPERATORS = {
+    '==': operator.eq, '!=': operator.ne, '<': operator.lt,
+    '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+}
+
+
+def _partition_dates(timestamp_raw):
+    """'YYYY-MM-DD' (UTC) per nanosecond `timestamp_raw` value ('unknown' when missing)."""
+    ts = pd.to_datetime(pd.to_numeric(pd.Series(timestamp_raw), errors='coerce'), unit='ns', errors='coerce')
+    return ts.dt.strftime('%Y-%m-%d').fillna(UNKNOWN_DATE).to_numpy()
+
+
+def _partition_name(date, message_type=None):
+    name = f"date={date}"
+    return name if message_type is None else os.path.join(name, f"message_type={message_type}")
+
+
+def _column_stats(df_part):
+    """
+    Null count per column, plus JSON-safe min/max for numeric columns, computed
+    frame-wide (per-column Series calls dominate on the wide flattened frames).
+    """
+    non_null = df_part.count()
+    numeric = df_part.select_dtypes(include=['number'])
+    lows, highs = numeric.min(), numeric.max()
+    stats = {}
+    for col in df_part.columns:
+        entry = {'null_count': int(len(df_part) - non_null[col]), 'min': None, 'max': None}
+        if col in lows.index and pd.notna(lows[col]):
+            entry['min'], entry['max'] = lows[col].item(), highs[col].item()
+        stats[col] = entry
+    return stats
+
+
+def _encode_values(values):
+    """
+    UTF-8 blob + offsets for a list of str (encoding 'text') or other JSON
+    scalars (encoding 'json', so ints, floats and bools keep their type).
+    """
+    values = list(values)
+    encoding = 'text' if all(isinstance(v, str) for v in values) else 'json'
+    if encoding == 'json':
+        values = [json.dumps(v.item() if isinstance(v, np.generic) else v, default=str) for v in values]
+    encoded = [v.encode('utf-8') for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(v) for v in encoded])
+    return {'blob': np.frombuffer(b''.join(encoded), dtype=np.uint8), 'offsets': offsets}, encoding
+
+
+def _decode_values(blob, offsets, encoding):
+    data = blob.tobytes()
+    texts = [data[a:b].decode('utf-8') for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+    return texts if encoding == 'text' else [json.loads(text) for text in texts]
+
+
+def _is_masked_dtype(dtype):
+    """Nullable Int*/UInt*/Float*/boolean extension dtypes (values + NA mask)."""
+    return pd.api.types.is_extension_array_dtype(dtype) and dtype.kind in 'iufb' and hasattr(dtype, 'numpy_dtype')
+
+
+def _encode_column(series):
+    """
+    (arrays, layout) for one column: plain .npy-safe arrays (no pickled
+    objects) and the JSON-safe description `_decode_column` rebuilds it from.
+    - category: int codes (-1 = null) + the categories, encoded the same way
+    - nullable Int/Float/boolean: NumPy values + null mask
+    - NumPy numeric/bool/datetime: the values as they are
+    - str/object: factorized int32 codes (-1 = null) + the distinct values
+    """
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        category_arrays, category_layout = _encode_column(pd.Series(dtype.categories))
+        arrays = {'codes': series.cat.codes.to_numpy(),
+                  **{f"categories.{name}": values for name, values in category_arrays.items()}}
+        return arrays, {'kind': 'category', 'dtype': 'category', 'ordered': bool(dtype.ordered),
+                        'categories': category_layout}
+    if _is_masked_dtype(dtype):
+        mask = series.isna().to_numpy()
+        values = series.to_numpy(dtype=dtype.numpy_dtype, na_value=dtype.numpy_dtype.type(0))
+        return {'values': values, 'mask': mask}, {'kind': 'masked', 'dtype': str(dtype)}
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biufcmM':
+        return {'values': series.to_numpy()}, {'kind': 'numpy', 'dtype': str(dtype)}
+
+    codes, uniques = pd.factorize(series.to_numpy(dtype=object))
+    value_arrays, encoding = _encode_values(uniques)
+    return {'codes': codes.astype(np.int32), **value_arrays}, {'kind': 'values', 'dtype': str(dtype),
+                                                               'encoding': encoding}
+
+
+def _decode_column(arrays, layout):
+    """Inverse of `_encode_column`."""
+    kind = layout['kind']
+    if kind == 'category':
+        prefix = "categories."
+        categories = _decode_column({name[len(prefix):]: values for name, values in arrays.items()
+                                     if name.startswith(prefix)}, layout['categories'])
+        return pd.Series(pd.Categorical.from_codes(arrays['codes'], categories=pd.Index(categories),
+                                                   ordered=layout['ordered']))
+    if kind == 'masked':
+        dtype = pd.api.types.pandas_dtype(layout['dtype'])
+        array_type = {'b': pd.arrays.BooleanArray, 'f': pd.arrays.FloatingArray}.get(dtype.kind, pd.arrays.IntegerArray)
+        return pd.Series(array_type(arrays['values'], arrays['mask']))
+    if kind == 'numpy':
+        return pd.Series(arrays['values'])
+
+    uniques = _decode_values(arrays['blob'], arrays['offsets'], layout['encoding'])
+    lookup = np.empty(len(uniques) + 1, dtype=object)
+    lookup[:len(uniques)] = uniques
+    lookup[-1] = np.nan  # code -1
+    series = pd.Series(lookup[arrays['codes']], dtype=object)
+    return series if layout['dtype'] == 'object' else series.astype(layout['dtype'])
+
+
+def _write_partition(path, df_part, store_part):
+    """
+    One partition: every non-empty column written back to back into
+    columns.bin as .npy arrays (see `_encode_column`), with their byte
+    offsets, dtype layout and min/max stats in columns.json, and the rows'
+    PayloadStore, EventIndex and EDAAggregates next to it.
+    """
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    df_part = df_part.reset_index(drop=True)
+    stats = _column_stats(df_part)
+    index = {}
+    with open(os.path.join(tmp_path, "columns.bin"), 'wb') as f:
+        for col in df_part.columns:
+            if stats[col]['null_count'] == len(df_part):
+                continue  # the wide flattened-payload columns are mostly empty per partition
+            arrays, layout = _encode_column(df_part[col])
+            extents = {}
+            for name, values in arrays.items():
+                offset = f.tell()
+                np.save(f, np.ascontiguousarray(values), allow_pickle=False)
+                extents[name] = [offset, f.tell() - offset]
+            index[col] = {'arrays': extents, 'dtype': layout['dtype'], 'layout': layout, **stats[col]}
+    with open(os.path.join(tmp_path, "columns.json"), 'w', encoding='utf-8') as f:
+        json.dump({'format': STORE_FORMAT, 'n_rows': len(df_part), 'columns': index}, f)
+    if store_part is not None:
+        store_part.save(os.path.join(tmp_path, "payload_store"), quiet=True)
+    EventIndex.build(df_part).save(os.path.join(tmp_path, INDEX_DIR))
+    EDAAggregates().update(df_part).save(os.path.join(tmp_path, EDA_DIR))
+
+    # Replace a partition written by an earlier run of the same day atomically
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmp_path, path)
+    return index
+
+
+def write_log_store(df_logs_parsed, store=None, path=STORE_DIR, partition_by_message_type=False):
+    """
+    Save the output of `clean_logs` (and its PayloadStore) partitioned by day of
+    `timestamp_raw`, and optionally by `message_type`:
+
+        <path>/date=2024-01-31/[message_type=stopwatch/]columns.bin|columns.json|payload_store/|event_index/|eda_aggregates/
+
+    Columns are stored as plain .npy arrays with their dtype in columns.json,
+    so the store does not depend on the pandas/NumPy version that wrote it.
+
+    Partitions present in the frame are overwritten, others are kept, so a
+    day can be re-ingested on its own. Returns the manifest (one entry per
+    partition with row count, timestamp range and columns).
+    """
+    dates = _partition_dates(df_logs_parsed['timestamp_raw'].to_numpy())
+    keys = pd.DataFrame({'date': dates})
+    if partition_by_message_type:
+        keys['message_type'] = df_logs_parsed['message_type'].astype(str).to_numpy()
+
+    groups = keys.groupby(list(keys.columns), sort=True).indices
+    manifest = read_manifest(path)
+    timestamps = pd.to_numeric(pd.Series(df_logs_parsed['timestamp_raw'].to_numpy()), errors='coerce')
+    for key, rows in groups.items():
+        key = key if isinstance(key, tuple) else (key,)
+        date, message_type = key[0], key[1] if partition_by_message_type else None
+        name = _partition_name(date, message_type)
+        part_path = os.path.join(path, name)
+        os.makedirs(os.path.dirname(part_path), exist_ok=True)
+
+        df_part = df_logs_parsed.iloc[rows]
+        index = _write_partition(part_path, df_part, store.take(rows) if store is not None else None)
+        ts = timestamps.iloc[rows]
+        manifest[name] = {
+            'date': date,
+            'message_type': message_type,
+            'n_rows': int(len(rows)),
+            'timestamp_min': None if ts.isna().all() else int(ts.min()),
+            'timestamp_max': None if ts.isna().all() else int(ts.max()),
+            'columns': sorted(index),
+            'has_payload_store': store is not None,
+            'has_event_index': True,
+            'has_eda_aggregates': True,
+        }
+
+    with open(os.path.join(path, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    print(f"💾 Log store written to {path} ({len(groups)} partitions, "
+          f"{len(df_logs_parsed)} rows)")
+    return manifest
+
+
+def read_manifest(path=STORE_DIR):
+    manifest_path = os.path.join(path, MANIFEST)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _to_ns(value):
+    return None if value is None else pd.Timestamp(value).value
+
+
+def _may_match(stats, op, value):
+    """Whether a partition whose column spans [min, max] can hold rows passing the filter."""
+    low, high = stats.get('min'), stats.get('max')
+    if low is None:
+        return True
+    try:
+        if op == 'in':
+            return any(low <= v <= high for v in value)
+        if op == '==':
+            return low <= value <= high
+        if op in ('<', '<='):
+            return _OPERATORS[op](low, value)
+        if op in ('>', '>='):
+            return _OPERATORS[op](high, value)
+    except TypeError:
+        return True
+    return True
+
+
+def _row_mask(series, op, value):
+    if op == 'in':
+        return series.isin(list(value)).to_numpy(dtype=bool)
+    return _OPERATORS[op](series, value).fillna(False).to_numpy(dtype=bool)
+
+
+class LogStoreReader:
+    """
+    Reads a log store written by `write_log_store`, opening only what is needed:
+    - `start` / `end` (anything pd.Timestamp accepts, end exclusive) prune
+      partitions by day and then rows by `timestamp_raw`
+    - `message_types` prunes `message_type` partitions (or rows)
+    - `filters`, a list of (column, op, value) with op in ==, !=, <, <=, >, >=, in,
+      skip partitions whose column min/max cannot match, then filter rows
+    - `read(columns=...)` loads only those columns' bytes from each partition
+
+    Rows come back partition by partition (in day order), in their original
+    order within a partition. Task 1-3 functions and the feature builders
+    accept a reader wherever they take the parsed frame.
+    """
+
+    def __init__(self, path=STORE_DIR, start=None, end=None, message_types=None, filters=None):
+        self.path = path
+        self.start, self.end = _to_ns(start), _to_ns(end)
+        self.message_types = None if message_types is None else {str(t) for t in message_types}
+        self.filters = list(filters or [])
+        self.manifest = read_manifest(path)
+        if not self.manifest:
+            raise FileNotFoundError(f"❌ No log store found at {path}")
+
+    def _partition_in_range(self, entry):
+        if self.start is not None and entry['timestamp_max'] is not None and entry['timestamp_max'] < self.start:
+            return False
+        if self.end is not None and entry['timestamp_min'] is not None and entry['timestamp_min'] >= self.end:
+            return False
+        if (self.start is not None or self.end is not None) and entry['timestamp_min'] is None:
+            return False
+        if self.message_types is not None and entry['message_type'] is not None:
+            return entry['message_type'] in self.message_types
+        return True
+
+    def partitions(self):
+        """Partition names left after pruning by time range, message type and column stats."""
+        selected = []
+        for name in sorted(self.manifest):
+            entry = self.manifest[name]
+            if not self._partition_in_range(entry):
+                continue
+            if self.filters:
+                index = self._column_index(name)
+                if not all(col in index and _may_match(index[col], op, value) for col, op, value in self.filters):
+                    continue
+            selected.append(name)
+        return selected
+
+    @property
+    def columns(self):
+        """Union of the columns of the selected partitions."""
+        return sorted({col for name in self.partitions() for col in self.manifest[name]['columns']})
+
+    def _column_index(self, name):
+        return self._partition_index(name)[0]
+
+    def _read_columns(self, name, index, n_rows, columns, loaded=None):
+        """
+        Decode `columns` of a partition, seeking to each of their arrays in
+        columns.bin; columns already decoded in the `loaded` frame are reused.
+        """
+        columns = [col for col in columns if col in index]
+        data = {}
+        to_read = [col for col in columns if loaded is None or col not in loaded.columns]
+        if to_read:
+            with open(os.path.join(self.path, name, "columns.bin"), 'rb') as f:
+                for col in to_read:
+                    arrays = {}
+                    for array_name, (offset, _) in index[col]['arrays'].items():
+                        f.seek(offset)
+                        arrays[array_name] = np.lib.format.read_array(f, allow_pickle=False)
+                    data[col] = _decode_column(arrays, index[col]['layout'])
+        data = {col: data[col] if col in data else loaded[col] for col in columns}
+        return pd.DataFrame(data, index=pd.RangeIndex(n_rows))
+
+    def _row_selection(self, name, index, n_rows):
+        """
+        Row positions of a partition passing the time range, message type and
+        filters (None = all), and the frame of the columns read to decide
+        (None if none were), so callers do not read them again.
+        """
+        needed = [col for col, _, _ in self.filters]
+        if self.start is not None or self.end is not None:
+            needed.append('timestamp_raw')
+        entry = self.manifest[name]
+        if self.message_types is not None and entry['message_type'] is None:
+            needed.append('message_type')
+        if not needed:
+            return None, None
+
+        df = self._read_columns(name, index, n_rows, list(dict.fromkeys(needed)))
+        mask = np.ones(n_rows, dtype=bool)
+        for col, op, value in self.filters:
+            mask &= _row_mask(df[col], op, value) if col in df.columns else False
+        if 'timestamp_raw' in needed:
+            ts = pd.to_numeric(df['timestamp_raw'].astype(object), errors='coerce')
+            if self.start is not None:
+                mask &= (ts >= self.start).to_numpy(dtype=bool)
+            if self.end is not None:
+                mask &= (ts < self.end).to_numpy(dtype=bool)
+        if 'message_type' in needed and self.message_types is not None:
+            mask &= df['message_type'].astype(str).isin(self.message_types).to_numpy(dtype=bool)
+        return np.flatnonzero(mask), df
+
+    def _partition_index(self, name):
+        with open(os.path.join(self.path, name, "columns.json"), encoding='utf-8') as f:
+            part = json.load(f)
+        if part.get('format') != STORE_FORMAT:
+            raise ValueError(f"❌ Partition {name} uses an old log store format, re-run `python cli.py ingest`")
+        return part['columns'], part['n_rows']
+
+    def event_index(self):
+        """
+        EventIndex of the selected rows, numbered like the rows of `read()`.
+        Uses the index saved with each partition (built from the ID columns
+        for partitions written without one).
+        """
+        indexes = []
+        for name in self.partitions():
+            index, n_rows = self._partition_index(name)
+            rows, loaded = self._row_selection(name, index, n_rows)
+            if rows is not None and not len(rows):
+                continue
+            index_path = os.path.join(self.path, name, INDEX_DIR)
+            if os.path.isdir(index_path):
+                event_index = EventIndex.load(index_path)
+            else:
+                event_index = EventIndex.build(self._read_columns(
+                    name, index, n_rows, [col for col in index if is_index_column(col)], loaded))
+            indexes.append(event_index if rows is None else event_index.take(rows))
+
+        if not indexes:
+            return EventIndex.build(pd.DataFrame())
+        return indexes[0] if len(indexes) == 1 else EventIndex.concat(indexes)
+
+    def eda_aggregates(self):
+        """
+        EDAAggregates of the selected rows, merged from the ones saved with
+        each partition; partitions that are only partly selected (or were
+        written without them) are aggregated from their rows instead.
+        """
+        aggregates = EDAAggregates()
+        for name in self.partitions():
+            index, n_rows = self._partition_index(name)
+            rows, loaded = self._row_selection(name, index, n_rows)
+            if rows is None and self.manifest[name].get('has_eda_aggregates'):
+                aggregates.merge(EDAAggregates.load(os.path.join(self.path, name, EDA_DIR)))
+                continue
+            if rows is not None and not len(rows):
+                continue
+            df = self._read_columns(name, index, n_rows, list(index), loaded)
+            aggregates.update(df if rows is None else df.iloc[rows])
+        return aggregates
+
+    def read(self, columns=None, with_store=False):
+        """
+        (frame, PayloadStore or None) for the selected partitions and rows.
+        `columns` is a list of names or a predicate on the column name
+        (default: all columns); missing columns are simply absent.
+        """
+        names = self.partitions()
+        # Partitions written without a PayloadStore: callers fall back to the messages
+        with_store = with_store and all(self.manifest[name]['has_payload_store'] for name in names)
+        frames, stores = [], []
+        for name in names:
+            index, n_rows = self._partition_index(name)
+            if columns is None:
+                wanted = list(index)
+            elif callable(columns):
+                wanted = [col for col in index if columns(col)]
+            else:
+                wanted = [col for col in columns if col in index]
+
+            rows, loaded = self._row_selection(name, index, n_rows)
+            if rows is not None and not len(rows):
+                continue
+            df = self._read_columns(name, index, n_rows, wanted, loaded)
+            store = PayloadStore.load(os.path.join(self.path, name, "payload_store")) if with_store else None
+            if rows is not None:
+                df = df.iloc[rows].reset_index(drop=True)
+                store = store.take(rows) if store is not None else None
+            frames.append(df)
+            stores.append(store)
+
+        if not frames:
+            empty_columns = list(columns) if isinstance(columns, (list, tuple)) else []
+            return pd.DataFrame(columns=empty_columns), PayloadStoreBuilder().build() if with_store else None
+        df_logs_parsed = pd.concat(frames, ignore_index=True, sort=False) if len(frames) > 1 else frames[0]
+        store = PayloadStore.concat(stores) if with_store else None
+        return df_logs_parsed, store
+
+
+def resolve_logs(logs, columns=None, store=None, with_store=False):
+    """
+    (frame, store) from either a parsed frame or a LogStoreReader. With a reader,
+    only `columns` are read and, if `with_store` and no `store` was passed,
+    the PayloadStore of the selected rows is loaded too.
+    """
+    if isinstance(logs, LogStoreReader):
+        df_logs_parsed, reader_store = logs.read(columns=columns, with_store=with_store and store is None)
+        return df_logs_parsed, store if store is not None else reader_store
+    return logs, store
@@ -1,8 +1,10 @@
 import pandas as pd
 import os
-import matplotlib.pyplot as plt
 from load_and_parse import load_all_logs
 from preprocess import clean_logs  
+from template_miner import load_or_create_miner
+from dtype_optimizer import optimize_dtypes
+from event_index import EventIndex
 
 from global_stats import (
     analyze_execute_event_flat,
@@ -10,29 +12,38 @@ from global_stats import (
     plot_execute_event_combinations
 )
 from stopwatch import extract_stopwatch_tasks, plot_stopwatch_analysis
+from quantile_sketch import LatencySketches
 from large_array_check import detect_large_json_arrays
+from trace_sessions import build_trace_index, build_trace_features
+from timeseries_monitor import detect_time_series_anomalies
 from eda import (
     summarize_columns,
     group_columns_by_prefix,
     plot_log_volume_over_time,
     plot_status_and_loggers,
     extract_top_keywords,
+    EDAAggregates,
+    plot_top_templates,
 )
 
-from task2_anomaly_features import build_stopwatch_features
+from task2_anomaly_features import build_stopwatch_features, build_template_features
 from anomaly_detection import run_isolation_forest, plot_anomaly_scores
+from subtask_timings import build_subtask_timing_matrix, run_subtask_models
 
-from anomaly_model_tester import load_model, generate_test_samples, test_model_on_samples
+from anomaly_model_tester import load_registered_model, generate_test_samples, test_model_on_samples
 from feature_engineering import process as feature_engineering_process
 
 from dbscan_clustering import run_dbscan_clustering, plot_dbscan_clusters
+from shared_features import run_models_shared
 from anomaly_detection_vs_dbscan import compare_dbscan_and_anomaly
+from instrumentation import is_enabled, latest_metrics
 
 def save_result(df, filename):
     os.makedirs("output", exist_ok=True)
     df.to_csv(f"output/{filename}", index=False)
 
 def save_plot(filename):
+    import matplotlib.pyplot as plt
     os.makedirs("output/plots", exist_ok=True)
     plt.savefig(f"output/plots/{filename}", bbox_inches="tight")
     plt.close()
@@ -46,16 +57,26 @@ def main():
 
     # ✅ Step 2: Clean and parse embedded message JSON
     print("🧹 Cleaning + Flattening embedded message JSON...")
-    df_logs_parsed = clean_logs(df_logs)
+    template_miner = load_or_create_miner("output/template_miner.json")
+    eda_aggregates = EDAAggregates()
+    df_logs_parsed, payload_store = clean_logs(df_logs, return_store=True, template_miner=template_miner,
+                                               eda_aggregates=eda_aggregates)
     print(f"✅ Final parsed log shape: {df_logs_parsed.shape}")
+    template_miner.save("output/template_miner.json")
+    save_result(template_miner.template_table(), "log_templates.csv")
+    print(f"🧩 {len(template_miner.templates)} log templates mined")
+
+    # ✅ Compact dtypes (categoricals, nullable ints, float32) for every later step
+    df_logs_parsed, _ = optimize_dtypes(df_logs_parsed, report_csv="output/dtype_report.csv")
 
     # ✅ Step 3: Run Task 1 - Global Field Combinations
     print("\n📊 Running Task 1: Occurrence Counts (Flat + Hierarchy)...")
-    df_task1_1 =analyze_execute_event_flat(df_logs_parsed)
+    event_index = EventIndex.build(df_logs_parsed)
+    df_task1_1 =analyze_execute_event_flat(df_logs_parsed, index=event_index)
     print("\n🔍 Task 1 Method 1 Preview:")
     print(df_task1_1.head())
 
-    plot_execute_event_combinations(df_logs_parsed)
+    plot_execute_event_combinations(df_logs_parsed, index=event_index)
 
     print("\n📊 Running Hierarchy-aware analysis...")
     df_task1_2 = analyze_execute_event_hierarchy(df_logs_parsed)
@@ -65,21 +86,37 @@ def main():
 
     # ✅ Step 4: Run Task 2 - Stopwatch Performance Analysis
     print("\n⏱️ Running Task 2: Stopwatch Timing Breakdown...")
-    df_task2 = extract_stopwatch_tasks(df_logs_parsed)
+    latency_sketches = LatencySketches()
+    df_task2 = extract_stopwatch_tasks(df_logs_parsed, store=payload_store, sketches=latency_sketches)
     print("\n🔍 Task 2 Preview:")
     print(df_task2.head())
 
+    latency_sketches.save("output/latency_sketches")
+    save_result(latency_sketches.quantile_table('stopwatch_total'), "task2_stopwatch_latency_quantiles.csv")
+    save_result(latency_sketches.quantile_table('subtask_time'), "task2_subtask_latency_quantiles.csv")
 
-    plot_stopwatch_analysis(df_task2)
+    plot_stopwatch_analysis(df_task2, sketches=latency_sketches)
   
 
     # ✅ Step 5: Run Task 3 - Large Array Detection
     print("\n📦 Running Task 3: Large Array Detection...")
-    detect_large_json_arrays(df_logs_parsed)
+    detect_large_json_arrays(df_logs_parsed, store=payload_store)
+
+    # ✅ Step 5b: Sessionize by trace
+    print("\n🧵 Sessionizing logs by trace...")
+    trace_index = build_trace_index(df_logs_parsed)
+    df_traces = build_trace_features(df_logs_parsed, index=trace_index, store=payload_store)
+    print(f"✅ {len(trace_index)} traces")
+    print(df_traces.head())
+
+    # ✅ Step 5c: Sliding-window volume and latency alerts
+    print("\n📈 Running time-series anomaly detection...")
+    df_ts_alerts = detect_time_series_anomalies(df_logs_parsed, store=payload_store)
+    print(df_ts_alerts.head())
 
     # ✅ Step 6: Optional - EDA and Exploratory Insights
     print("\n🔎 Running EDA...")
-    df_summarize = summarize_columns(df_logs_parsed)
+    df_summarize = summarize_columns(aggregates=eda_aggregates)
     print(df_summarize.head())
 
 
@@ -89,10 +126,13 @@ def main():
         print(f"{prefix}: {count} columns")
 
 
-    plot_log_volume_over_time(df_logs_parsed)
+    plot_log_volume_over_time(aggregates=eda_aggregates)
 
 
-    plot_status_and_loggers(df_logs_parsed)
+    plot_status_and_loggers(aggregates=eda_aggregates)
+
+
+    plot_top_templates(template_miner=template_miner, aggregates=eda_aggregates)
 
 
     extract_top_keywords(df_logs_parsed)
@@ -107,13 +147,31 @@ def main():
     df_features = build_stopwatch_features()
     print(df_features.head())
 
-    # ✅ Step 8: Anomaly Detection from Task 2 Features
-    print("\n🚨 Running Anomaly Detection...")
-    anomaly_df = run_isolation_forest("output/task2_stopwatch_features.csv")
+    df_template_features = build_template_features(df_logs_parsed)
+    print(df_template_features.head())
+
+    # Sparse (stopwatch x subtask) timings, kept sparse through Isolation Forest and DBSCAN
+    build_subtask_timing_matrix()
+    run_subtask_models()
+
+    # ✅ PIPELINE_SHARED_MEMORY=1: feature engineering first, then Isolation Forest and the
+    # DBSCAN grid run together in worker processes sharing one copy of the feature matrices
+    shared_memory_mode = os.environ.get('PIPELINE_SHARED_MEMORY', '') == '1'
+    if shared_memory_mode:
+        print("\n🔧 Running Feature Engineering for DBSCAN...")
+        feature_engineering_process(
+        input_csv="output/task2_stopwatch_features.csv",
+        output_csv="output/preprocessed_clustering_features.csv")
+        print("\n🧵 Running Anomaly Detection and DBSCAN Clustering in shared memory...")
+        anomaly_df, dbscan_df = run_models_shared()
+    else:
+        # ✅ Step 8: Anomaly Detection from Task 2 Features
+        print("\n🚨 Running Anomaly Detection...")
+        anomaly_df = run_isolation_forest("output/task2_stopwatch_features.csv")
     plot_anomaly_scores(anomaly_df)
 
-    # Load the trained model
-    model = load_model("output/isolation_forest_model.joblib")
+    # Load the trained model (latest registered version)
+    model = load_registered_model()
 
     # Generate or load real test data (use generate_test_samples() if you want synthetic data)
     test_df = generate_test_samples()  # Or load your real data
@@ -126,19 +184,20 @@ def main():
     print(results[['total_time_sec', 'max_subtask_percent', 'sum_other_subtask_time', 'ratio_other_to_max', 'prediction', 'anomaly_score']])
 
 
-    # ✅ Step 9: Feature Engineering for DBSCAN clustering
-    print("\n🔧 Running Feature Engineering for DBSCAN...")
-    feature_engineering_process(
-    input_csv="output/task2_stopwatch_features.csv",
-    output_csv="output/preprocessed_clustering_features.csv")
+    if not shared_memory_mode:
+        # ✅ Step 9: Feature Engineering for DBSCAN clustering
+        print("\n🔧 Running Feature Engineering for DBSCAN...")
+        feature_engineering_process(
+        input_csv="output/task2_stopwatch_features.csv",
+        output_csv="output/preprocessed_clustering_features.csv")
 
-    print("✅ Feature engineering completed and saved.")
+        print("✅ Feature engineering completed and saved.")
 
 
-    # ✅ Step 10: DBSCAN Clustering
-    print("\n🔍 Running DBSCAN Clustering...")
-    dbscan_df = run_dbscan_clustering()
-    print("✅ DBSCAN clustering completed and results saved.")
+        # ✅ Step 10: DBSCAN Clustering
+        print("\n🔍 Running DBSCAN Clustering...")
+        dbscan_df = run_dbscan_clustering()
+        print("✅ DBSCAN clustering completed and results saved.")
     plot_dbscan_clusters(dbscan_df)
 
 
@@ -146,5 +205,10 @@ def main():
     print("\n🔍 Comparing DBSCAN and Anomaly Detection results...")
     compare_dbscan_and_anomaly()
     print("✅ Comparison completed and results saved.")
+
+    # ✅ Per-stage metrics (PIPELINE_METRICS=1)
+    if is_enabled():
+        print("\n📏 Stage metrics:")
+        print(pd.DataFrame(latest_metrics())[['stage', 'wall_sec', 'cpu_sec', 'peak_rss_mb', 'rows_in', 'rows_out']])
 if __name__ == "__main__":
     main()
@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import functools
+import numpy as np
+import pandas as pd
+
+REGISTRY_DIR = "output/models"
+CACHE_SIZE = 8
+
+
+def data_fingerprint(df):
+    """
+    SHA-256 of the training frame's column names and row hashes (order-sensitive),
+    or of a sparse matrix's shape and CSR arrays.
+    """
+    if hasattr(df, 'tocsr'):
+        X = df.tocsr()
+        digest = hashlib.sha256(json.dumps(list(X.shape)).encode('utf-8'))
+        for values in (X.data, X.indices, X.indptr):
+            digest.update(np.ascontiguousarray(values).tobytes())
+        return digest.hexdigest()
+    digest = hashlib.sha256(json.dumps([str(col) for col in df.columns]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def feature_schema(df, feature_names=None):
+    if hasattr(df, 'tocsr'):
+        names = feature_names if feature_names is not None else range(df.shape[1])
+        return [{'name': str(name), 'dtype': str(df.dtype)} for name in names]
+    return [{'name': str(col), 'dtype': str(dtype)} for col, dtype in df.dtypes.items()]
+
+
+class RegisteredModel:
+    """
+    One saved model version: metadata, memory-mapped arrays and (optionally)
+    the pickled estimator, which is only unpickled when `model` is accessed.
+    """
+
+    def __init__(self, path, metadata, arrays):
+        self.path = path
+        self.metadata = metadata
+        self.arrays = arrays
+        self._model = None
+
+    @property
+    def name(self):
+        return self.metadata['name']
+
+    @property
+    def version(self):
+        return self.metadata['version']
+
+    @property
+    def params(self):
+        return self.metadata['params']
+
+    @property
+    def feature_columns(self):
+        return [field['name'] for field in self.metadata['feature_schema']]
+
+    @property
+    def model(self):
+        if self._model is None:
+            model_path = os.path.join(self.path, "model.joblib")
+            if not os.path.exists(model_path):
+                raise FileNotFoundError(f"❌ {self.name} v{self.version} has no pickled model")
+            import joblib
+            self._model = joblib.load(model_path, mmap_mode='r')
+        return self._model
+
+    def select_features(self, df):
+        """Columns of `df` in training order; raises if any are missing."""
+        missing = [col for col in self.feature_columns if col not in df.columns]
+        if missing:
+            raise ValueError(f"Missing required columns for {self.name} v{self.version}: {missing}")
+        return df[self.feature_columns]
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _load_version(path):
+    # Versions are immutable once registered, so caching by directory is safe
+    with open(os.path.join(path, "metadata.json"), encoding='utf-8') as f:
+        metadata = json.load(f)
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in metadata['arrays']}
+    return RegisteredModel(path, metadata, arrays)
+
+
+class ModelRegistry:
+    """
+    Local model registry under `root`: `<root>/<name>/v<version>/` holds
+    metadata.json (version, params, feature schema, training-data fingerprint,
+    metrics), one .npy file per array (loaded memory-mapped) and an optional
+    model.joblib. Loaded versions are kept in an in-process LRU cache.
+    """
+
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+
+    def versions(self, name):
+        model_dir = os.path.join(self.root, name)
+        if not os.path.isdir(model_dir):
+            return []
+        return sorted(int(entry[1:]) for entry in os.listdir(model_dir)
+                      if entry.startswith('v') and entry[1:].isdigit())
+
+    def latest_version(self, name):
+        versions = self.versions(name)
+        if not versions:
+            raise FileNotFoundError(f"❌ No registered versions of '{name}' in {self.root}")
+        return versions[-1]
+
+    def register(self, name, training_data, model=None, arrays=None, params=None, metrics=None,
+                 feature_names=None):
+        """
+        Save a new version of `name` and return its version number.
+        `training_data` is the feature frame the model was fit on (its columns
+        and dtypes become the feature schema), or a sparse matrix whose
+        columns are named by `feature_names`; `arrays` are saved as .npy files
+        and `model` (if given) with joblib.
+        """
+        arrays = arrays or {}
+        model_dir = os.path.join(self.root, name)
+        os.makedirs(model_dir, exist_ok=True)
+
+        # Write into a temporary directory and rename, so a version is either complete or absent
+        tmp_dir = os.path.join(model_dir, f".tmp-{os.getpid()}-{time.time_ns()}")
+        os.makedirs(tmp_dir)
+        for array_name, values in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{array_name}.npy"), np.asarray(values))
+        if model is not None:
+            import joblib
+            joblib.dump(model, os.path.join(tmp_dir, "model.joblib"))
+
+        metadata = {
+            'name': name,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'params': params or {},
+            'metrics': metrics or {},
+            'feature_schema': feature_schema(training_data, feature_names),
+            'data_fingerprint': data_fingerprint(training_data),
+            'n_training_rows': int(training_data.shape[0]),
+            'arrays': sorted(arrays),
+            'has_model': model is not None,
+        }
+        while True:
+            version = self.versions(name)[-1] + 1 if self.versions(name) else 1
+            metadata['version'] = version
+            with open(os.path.join(tmp_dir, "metadata.json"), 'w', encoding='utf-8') as f:
+                json.dump(metadata, f, indent=2)
+            try:
+                os.rename(tmp_dir, os.path.join(model_dir, f"v{version}"))
+                break
+            except OSError:
+                # Another process registered this version first
+                if not os.path.isdir(os.path.join(model_dir, f"v{version}")):
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                    raise
+
+        print(f"💾 Registered {name} v{version} in {self.root}")
+        return version
+
+    def load(self, name, version=None):
+        """RegisteredModel for `version` (default: the latest)."""
+        version = self.latest_version(name) if version is None else int(version)
+        path = os.path.abspath(os.path.join(self.root, name, f"v{version}"))
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"❌ {name} v{version} not found in {self.root}")
+        return _load_version(path)
+
+    def list_models(self):
+        """One row per registered version."""
+        rows = []
+        for name in sorted(os.listdir(self.root)) if os.path.isdir(self.root) else []:
+            for version in self.versions(name):
+                metadata = self.load(name, version).metadata
+                rows.append({
+                    'name': name,
+                    'version': version,
+                    'created_at': metadata['created_at'],
+                    'n_training_rows': metadata['n_training_rows'],
+                    'n_features': len(metadata['feature_schema']),
+                    'data_fingerprint': metadata['data_fingerprint'][:12],
+                })
+        return pd.DataFrame(rows, columns=['name', 'version', 'created_at', 'n_training_rows',
+                                           'n_features', 'data_fingerprint'])
+
+
+def clear_cache():
+    _load_version.cache_clear()
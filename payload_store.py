@@ -0,0 +1,299 @@
+import os
+import json
+import re
+import numpy as np
+
+RECEIVED_EVENT_MARKER = "Received event result from database"
+STOPWATCH_HEADER_PATTERN = re.compile(r"StopWatch '(.*?)':\s*([0-9.eE+-]+) seconds")
+STOPWATCH_SUBTASK_PATTERN = re.compile(r"([0-9.eE+-]+)\s+(\d+)%\s+(.*)")
+
+
+def _offsets(counts):
+    """CSR offsets (length n + 1) from per-row counts."""
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def _take_ranges(offsets, rows):
+    """
+    CSR take: (new offsets, positions into the values array) for `rows`, keeping
+    each row's entries contiguous and in order.
+    """
+    counts = np.diff(offsets)[rows]
+    new_offsets = _offsets(counts)
+    positions = np.repeat(np.asarray(offsets[:-1])[rows] - new_offsets[:-1], counts) + np.arange(new_offsets[-1])
+    return new_offsets, positions
+
+
+def _remap(codes, vocab, merged):
+    """Translate int32 codes into `vocab` to codes into the `merged` _Vocabulary (-1 stays -1)."""
+    lookup = np.array([merged.code(value) for value in vocab] + [-1], dtype=np.int32)
+    return lookup[np.asarray(codes)]
+
+
+def _read_only(array):
+    array = np.asarray(array)
+    if array.flags.writeable:
+        array.flags.writeable = False
+    return array
+
+
+class _Vocabulary:
+    """Interns strings to int32 codes while the store is being built."""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class PayloadStoreBuilder:
+    """
+    Collects per-message parse results while `clean_logs` walks the messages,
+    so every message is decoded exactly once. Call `add` once per row (in row
+    order) and `build` at the end.
+    """
+
+    def __init__(self):
+        self.payload_chunks = []
+        self.payload_sizes = []
+        self.received_event = []
+        self.array_counts = []
+        self.array_keys = []
+        self.array_lengths = []
+        self.stopwatch_names = []
+        self.stopwatch_totals = []
+        self.subtask_counts = []
+        self.subtask_secs = []
+        self.subtask_pcts = []
+        self.subtask_names = []
+        self.key_vocab = _Vocabulary()
+        self.stopwatch_vocab = _Vocabulary()
+        self.subtask_vocab = _Vocabulary()
+
+    def add(self, msg=None, json_text=None, parsed=None):
+        """
+        Record one row. `json_text` / `parsed` are the embedded JSON as matched
+        and decoded by `preprocess.decode_message` (None if the message has none).
+        """
+        encoded = json_text.encode('utf-8') if json_text is not None else b''
+        self.payload_chunks.append(encoded)
+        self.payload_sizes.append(len(encoded))
+
+        msg = msg if isinstance(msg, str) else ''
+        self._add_arrays(msg, parsed)
+        self._add_stopwatch(msg)
+
+    def _add_arrays(self, msg, parsed):
+        is_received = RECEIVED_EVENT_MARKER in msg
+        self.received_event.append(is_received)
+        count = 0
+        if is_received and isinstance(parsed, dict):
+            for key, value in parsed.items():
+                if isinstance(value, list):
+                    self.array_keys.append(self.key_vocab.code(key))
+                    self.array_lengths.append(len(value))
+                    count += 1
+        self.array_counts.append(count)
+
+    def _add_stopwatch(self, msg):
+        name_code, total, count = -1, np.nan, 0
+        header = STOPWATCH_HEADER_PATTERN.search(msg) if 'StopWatch' in msg else None
+        if header:
+            try:
+                total = float(header.group(2))
+                name_code = self.stopwatch_vocab.code(header.group(1))
+                for sec, pct, task in STOPWATCH_SUBTASK_PATTERN.findall(msg):
+                    sec, pct = float(sec), int(pct)
+                    task = task.strip() if task.strip() else 'Unnamed Task'
+                    self.subtask_secs.append(sec)
+                    self.subtask_pcts.append(pct)
+                    self.subtask_names.append(self.subtask_vocab.code(task))
+                    count += 1
+            except ValueError:
+                # Same as the per-row extraction: keep the subtasks parsed so far
+                pass
+        self.stopwatch_names.append(name_code)
+        self.stopwatch_totals.append(total)
+        self.subtask_counts.append(count)
+
+    def build(self):
+        return PayloadStore(
+            buffer=np.frombuffer(b''.join(self.payload_chunks), dtype=np.uint8),
+            payload_offsets=_offsets(self.payload_sizes),
+            received_event=np.array(self.received_event, dtype=bool),
+            array_offsets=_offsets(self.array_counts),
+            array_key_codes=np.array(self.array_keys, dtype=np.int32),
+            array_lengths=np.array(self.array_lengths, dtype=np.int64),
+            array_key_vocab=self.key_vocab.values,
+            stopwatch_name_codes=np.array(self.stopwatch_names, dtype=np.int32),
+            stopwatch_totals=np.array(self.stopwatch_totals, dtype=np.float64),
+            stopwatch_vocab=self.stopwatch_vocab.values,
+            subtask_offsets=_offsets(self.subtask_counts),
+            subtask_secs=np.array(self.subtask_secs, dtype=np.float64),
+            subtask_pcts=np.array(self.subtask_pcts, dtype=np.int64),
+            subtask_codes=np.array(self.subtask_names, dtype=np.int32),
+            subtask_vocab=self.subtask_vocab.values,
+        )
+
+
+class PayloadStore:
+    """
+    Read-only per-message parse results, indexed by row position of the frame
+    returned by `clean_logs`.
+
+    Nothing is stored per row as a Python object: embedded JSON payloads live in
+    one shared byte buffer addressed by `payload_offsets`, top-level array
+    summaries and StopWatch subtasks are CSR-style arrays (`*_offsets[i]` to
+    `*_offsets[i + 1]` are row i's entries), and strings are int32 codes into
+    small vocabularies.
+    """
+
+    ARRAY_FIELDS = (
+        'buffer', 'payload_offsets', 'received_event',
+        'array_offsets', 'array_key_codes', 'array_lengths',
+        'stopwatch_name_codes', 'stopwatch_totals',
+        'subtask_offsets', 'subtask_secs', 'subtask_pcts', 'subtask_codes',
+    )
+    VOCAB_FIELDS = ('array_key_vocab', 'stopwatch_vocab', 'subtask_vocab')
+
+    def __init__(self, **fields):
+        for name in self.ARRAY_FIELDS:
+            setattr(self, name, _read_only(fields[name]))
+        for name in self.VOCAB_FIELDS:
+            setattr(self, name, tuple(fields[name]))
+
+    def __len__(self):
+        return len(self.payload_offsets) - 1
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAY_FIELDS)
+
+    def payload_text(self, row):
+        """Embedded JSON text of a row ('' if it had none)."""
+        start, end = self.payload_offsets[row], self.payload_offsets[row + 1]
+        return self.buffer[start:end].tobytes().decode('utf-8')
+
+    def payload(self, row):
+        """Decoded embedded JSON of a row (None if it had none) - for drill-down only."""
+        text = self.payload_text(row)
+        return json.loads(text) if text else None
+
+    def oversized_arrays(self, array_length_threshold=500):
+        """
+        Top-level arrays of 'Received event result' payloads longer than the
+        threshold, as (row positions, keys, lengths) in row and key order.
+        """
+        counts = np.diff(self.array_offsets)
+        rows = np.repeat(np.arange(len(self)), counts)
+        mask = self.array_lengths > array_length_threshold
+        keys = [self.array_key_vocab[code] for code in self.array_key_codes[mask]]
+        return rows[mask], keys, self.array_lengths[mask]
+
+    def stopwatch_subtasks(self, rows=None):
+        """
+        Subtask captures of StopWatch rows, as (row positions, stopwatch names,
+        totals, subtask names, subtask seconds, subtask percents), one entry per
+        subtask in row order. `rows` optionally restricts to a boolean row mask.
+        """
+        entry_rows = np.repeat(np.arange(len(self)), np.diff(self.subtask_offsets))
+        keep = rows[entry_rows] if rows is not None else slice(None)
+        entry_rows = entry_rows[keep]
+
+        names = np.array(self.stopwatch_vocab + ('',), dtype=object)
+        subtasks = np.array(self.subtask_vocab + ('',), dtype=object)
+        return (
+            entry_rows,
+            names[self.stopwatch_name_codes[entry_rows]],
+            self.stopwatch_totals[entry_rows],
+            subtasks[self.subtask_codes[keep]],
+            self.subtask_secs[keep],
+            self.subtask_pcts[keep],
+        )
+
+    def take(self, rows):
+        """New store holding `rows` (positions, in the given order); vocabularies are shared."""
+        rows = np.asarray(rows, dtype=np.int64)
+        payload_offsets, payload_positions = _take_ranges(self.payload_offsets, rows)
+        array_offsets, array_positions = _take_ranges(self.array_offsets, rows)
+        subtask_offsets, subtask_positions = _take_ranges(self.subtask_offsets, rows)
+        return PayloadStore(
+            buffer=self.buffer[payload_positions],
+            payload_offsets=payload_offsets,
+            received_event=self.received_event[rows],
+            array_offsets=array_offsets,
+            array_key_codes=self.array_key_codes[array_positions],
+            array_lengths=self.array_lengths[array_positions],
+            array_key_vocab=self.array_key_vocab,
+            stopwatch_name_codes=self.stopwatch_name_codes[rows],
+            stopwatch_totals=self.stopwatch_totals[rows],
+            stopwatch_vocab=self.stopwatch_vocab,
+            subtask_offsets=subtask_offsets,
+            subtask_secs=self.subtask_secs[subtask_positions],
+            subtask_pcts=self.subtask_pcts[subtask_positions],
+            subtask_codes=self.subtask_codes[subtask_positions],
+            subtask_vocab=self.subtask_vocab,
+        )
+
+    @classmethod
+    def concat(cls, stores):
+        """One store with the rows of `stores` back to back (vocabularies are merged)."""
+        stores = list(stores)
+        if len(stores) == 1:
+            return stores[0]
+        key_vocab, stopwatch_vocab, subtask_vocab = _Vocabulary(), _Vocabulary(), _Vocabulary()
+
+        def joined_offsets(name):
+            parts = [getattr(store, name) for store in stores]
+            starts = np.cumsum([0] + [part[-1] for part in parts[:-1]])
+            return np.concatenate([parts[0][:1]] + [part[1:] + start for part, start in zip(parts, starts)])
+
+        return cls(
+            buffer=np.concatenate([store.buffer for store in stores]),
+            payload_offsets=joined_offsets('payload_offsets'),
+            received_event=np.concatenate([store.received_event for store in stores]),
+            array_offsets=joined_offsets('array_offsets'),
+            array_key_codes=np.concatenate([_remap(store.array_key_codes, store.array_key_vocab, key_vocab)
+                                            for store in stores]),
+            array_lengths=np.concatenate([store.array_lengths for store in stores]),
+            stopwatch_name_codes=np.concatenate([
+                _remap(store.stopwatch_name_codes, store.stopwatch_vocab, stopwatch_vocab) for store in stores]),
+            stopwatch_totals=np.concatenate([store.stopwatch_totals for store in stores]),
+            subtask_offsets=joined_offsets('subtask_offsets'),
+            subtask_secs=np.concatenate([store.subtask_secs for store in stores]),
+            subtask_pcts=np.concatenate([store.subtask_pcts for store in stores]),
+            subtask_codes=np.concatenate([_remap(store.subtask_codes, store.subtask_vocab, subtask_vocab)
+                                          for store in stores]),
+            array_key_vocab=key_vocab.values,
+            stopwatch_vocab=stopwatch_vocab.values,
+            subtask_vocab=subtask_vocab.values,
+        )
+
+    def save(self, path="output/payload_store", quiet=False):
+        """Save as one .npy file per array (memory-mappable) plus a vocabulary JSON."""
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAY_FIELDS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(path, "vocab.json"), 'w', encoding='utf-8') as f:
+            json.dump({name: list(getattr(self, name)) for name in self.VOCAB_FIELDS}, f)
+        if not quiet:
+            print(f"💾 Payload store saved to {path}")
+
+    @classmethod
+    def load(cls, path="output/payload_store", mmap_mode='r'):
+        """Load a saved store; arrays are memory-mapped so processes share the same pages."""
+        fields = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in cls.ARRAY_FIELDS
+        }
+        with open(os.path.join(path, "vocab.json"), encoding='utf-8') as f:
+            fields.update(json.load(f))
+        return cls(**fields)
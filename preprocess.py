@@ -1,7 +1,10 @@
 from load_and_parse import recursive_flatten
+from payload_store import PayloadStoreBuilder
 import json
 import re
 import pandas as pd
+from instrumentation import instrumented
+from eda import collect_eda_aggregates
 
 
 
@@ -20,26 +23,66 @@ def classify_message(msg):
     else:
         return 'OTHER'
 
-def parse_message_safely(msg):
-    """Try to extract and flatten JSON content from the message string."""
+def decode_message(msg):
+    """
+    Extract and decode the JSON content embedded in the message string.
+    Returns (json_text, parsed), or (None, None) if there is no valid JSON.
+    """
     try:
         match = re.search(r'({.*})', msg, flags=re.DOTALL)
         if match:
             json_like = match.group(1).replace('\\"', '"').replace("\\'", "'")
-            parsed = json.loads(json_like)
+            return json_like, json.loads(json_like)
+    except Exception:
+        pass
+    return None, None
+
+
+def parse_message_safely(msg):
+    """Try to extract and flatten JSON content from the message string."""
+    try:
+        _, parsed = decode_message(msg)
+        if parsed is not None:
             return recursive_flatten(parsed)
     except Exception:
         pass
     return {}
 
 
-def clean_logs(df_logs: pd.DataFrame) -> pd.DataFrame:
+def first_truthy(df, columns, default):
+    """Row-wise `a or b or default` over the given columns (missing columns count as None)."""
+    values = [df[col].tolist() if col in df.columns else [None] * len(df) for col in columns]
+    out = []
+    for candidates in zip(*values):
+        chosen = default
+        for candidate in candidates:
+            if candidate:
+                chosen = candidate
+                break
+        out.append(chosen)
+    return out
+
+
+@instrumented()
+def clean_logs(df_logs: pd.DataFrame, return_store: bool = False, template_miner=None, projection=None,
+               eda_aggregates=None):
     """
     Cleans and enriches the log data:
     - Parses datetime
     - Drops noisy columns
     - Classifies messages
+    - Assigns mined log template IDs (if a TemplateMiner is passed)
     - Parses line.message JSON into flat columns
+
+    With `return_store=True`, returns (df_logs_parsed, PayloadStore): the store
+    keeps each row's decoded payload, array-length summary and StopWatch
+    captures so later tasks never decode a message again.
+
+    With a `projection` (see projection.py), only payload paths it keeps are
+    flattened; if it keeps none, payloads are only decoded for the store.
+
+    With `eda_aggregates` (an EDAAggregates), the cleaned rows are folded into
+    it chunk by chunk here, so the EDA needs no second pass over the frame.
     """
     # ✅ Parse datetime
     if "line.timestamp" in df_logs.columns:
@@ -57,11 +100,38 @@ def clean_logs(df_logs: pd.DataFrame) -> pd.DataFrame:
     # ✅ Classify message type
     df_logs['message_type'] = df_logs['line.message'].fillna('').apply(classify_message)
 
-    # ✅ Parse line.message JSON
-    parsed_msgs = df_logs['line.message'].dropna().apply(parse_message_safely)
+    # ✅ Categorical template ID per message (the miner keeps learning as it goes)
+    if template_miner is not None:
+        df_logs['template_id'] = template_miner.assign(df_logs['line.message'])
+
+    # ✅ Parse line.message JSON (each message is decoded exactly once)
+    store_builder = PayloadStoreBuilder() if return_store else None
+    flatten_payloads = projection is None or bool(projection.payload_keys)
+    keep = projection.keeps_payload if projection is not None else None
+    parsed_msgs = []
+    for msg in df_logs['line.message']:
+        if pd.isna(msg):
+            if store_builder is not None:
+                store_builder.add(msg)
+            continue
+        if not flatten_payloads and store_builder is None:
+            continue
+        json_text, parsed = decode_message(msg)
+        try:
+            parsed_msgs.append(recursive_flatten(parsed, keep=keep) if parsed is not None and flatten_payloads else {})
+        except Exception:
+            parsed_msgs.append({})
+        if store_builder is not None:
+            store_builder.add(msg, json_text, parsed)
     flat_msg_df = pd.json_normalize(parsed_msgs)
 
     # ✅ Merge into final parsed log
     df_logs_parsed = pd.concat([df_logs.reset_index(drop=True), flat_msg_df], axis=1)
 
+    # ✅ Streaming EDA statistics of the cleaned rows
+    if eda_aggregates is not None:
+        collect_eda_aggregates(df_logs_parsed, aggregates=eda_aggregates)
+
+    if return_store:
+        return df_logs_parsed, store_builder.build()
     return df_logs_parsed
@@ -0,0 +1,75 @@
+import re
+from event_index import EXECUTE_EVENT_FIELDS, TRACE_ID_COLUMNS
+from stopwatch import STOPWATCH_COLUMNS
+from large_array_check import LARGE_ARRAY_COLUMNS
+from trace_sessions import TRACE_FEATURE_COLUMNS
+from timeseries_monitor import VOLUME_COLUMNS
+
+# Needed by clean_logs itself (message classification, templates, PayloadStore)
+BASE_COLUMNS = ['timestamp_raw', 'line.message']
+# Flattened columns each stage reads (message_type and template_id are derived by clean_logs)
+STAGE_COLUMNS = {
+    'task1': TRACE_ID_COLUMNS,
+    'task2': STOPWATCH_COLUMNS,
+    'task3': LARGE_ARRAY_COLUMNS,
+    'traces': TRACE_FEATURE_COLUMNS,
+    'timeseries': ['timestamp_raw', *TRACE_ID_COLUMNS, 'line.message', *VOLUME_COLUMNS],
+    'template_features': TRACE_ID_COLUMNS,
+    'eda': ['timestamp_raw', 'line.message', 'fields.detected_level', 'line.logger'],
+}
+# Message-payload keys each stage reads, matched as substrings of the flattened payload path
+STAGE_PAYLOAD_KEYS = {
+    'task1': EXECUTE_EVENT_FIELDS,
+}
+ALL_STAGES = tuple(STAGE_COLUMNS)
+
+
+def _ancestors(path):
+    """'line.mdc.trace_id' -> ['line', 'line.mdc']; 'Rows[0].V' -> ['Rows', 'Rows[0]']."""
+    return [path[:match.start()] for match in re.finditer(r'[.\[]', path) if match.start()]
+
+
+class ColumnProjection:
+    """
+    The flattened columns a set of stages reads, pushed down into
+    `load_all_logs` (which skips every other `fields`/`line` subtree) and
+    `clean_logs` (which keeps only payload paths containing `payload_keys`, or
+    skips payload flattening when there are none).
+    """
+
+    def __init__(self, columns, payload_keys=()):
+        self.columns = frozenset(columns)
+        self.payload_keys = tuple(payload_keys)
+        self.prefixes = frozenset(prefix for col in self.columns for prefix in _ancestors(col))
+
+    def visits(self, path):
+        """Whether `path` is a wanted column or lies on the way to one."""
+        return path in self.columns or path in self.prefixes
+
+    def keeps(self, path):
+        return path in self.columns
+
+    def keeps_payload(self, path):
+        return path in self.columns or any(key in path for key in self.payload_keys)
+
+    def __repr__(self):
+        return f"ColumnProjection({len(self.columns)} columns, payload keys {list(self.payload_keys)})"
+
+
+def projection_for(stages=ALL_STAGES, full=False):
+    """
+    ColumnProjection covering `stages` (names from STAGE_COLUMNS), or None
+    with `full=True`, which flattens everything (full-width EDA summaries).
+    """
+    if full:
+        return None
+    unknown = set(stages) - set(STAGE_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown stages {sorted(unknown)}, expected some of {list(ALL_STAGES)}")
+
+    columns = set(BASE_COLUMNS)
+    payload_keys = []
+    for stage in stages:
+        columns.update(STAGE_COLUMNS[stage])
+        payload_keys += [key for key in STAGE_PAYLOAD_KEYS.get(stage, []) if key not in payload_keys]
+    return ColumnProjection(columns, payload_keys)
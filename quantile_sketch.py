@@ -0,0 +1,218 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+class KLLSketch:
+    """
+    Mergeable quantile sketch (KLL compactor hierarchy).
+
+    Level h holds items that each stand for 2^h values. When a level grows past
+    its capacity it is sorted and every other item (alternating the starting
+    offset between compactions) moves up a level. Level capacities shrink
+    geometrically from `k` at the top, so the sketch keeps O(k) items and rank
+    errors stay around 1/k of the count. The exact min and max are kept too.
+    """
+
+    def __init__(self, k=1000):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.offsets = [0]
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                    self.offsets.append(0)
+                items = np.sort(items)
+                keep_odd = len(items) % 2
+                offset = self.offsets[level]
+                self.offsets[level] ^= 1
+                pairs = items[keep_odd:]
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], pairs[offset::2]])
+                self.levels[level] = items[:keep_odd]
+            level += 1
+
+    def update(self, values):
+        """Add an array of values."""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """Fold in a sketch built on other values (another file, day or process)."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+            self.offsets.append(0)
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def weighted_values(self):
+        """Retained items and their weights (sum of weights == count)."""
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        return values, weights
+
+    def quantiles(self, qs=(0.5, 0.95, 0.99)):
+        if not self.count:
+            return [np.nan] * len(qs)
+        values, weights = self.weighted_values()
+        order = np.argsort(values, kind='stable')
+        values, cum = values[order], np.cumsum(weights[order])
+        result = []
+        for q in qs:
+            if q <= 0:
+                result.append(self.min)
+            elif q >= 1:
+                result.append(self.max)
+            else:
+                idx = min(np.searchsorted(cum, q * cum[-1]), len(values) - 1)
+                result.append(float(values[idx]))
+        return result
+
+    def to_dict(self):
+        return {
+            'k': self.k,
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'offsets': self.offsets,
+            'levels': [items.tolist() for items in self.levels],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['k'])
+        sketch.count = data['count']
+        sketch.min = data['min']
+        sketch.max = data['max']
+        sketch.offsets = list(data['offsets'])
+        sketch.levels = [np.asarray(items, dtype=np.float64) for items in data['levels']]
+        return sketch
+
+
+class LatencySketches:
+    """
+    KLL sketches of StopWatch latency per day, kind and name:
+    - 'stopwatch_total': total seconds of each StopWatch block, per stopwatch name
+    - 'subtask_time' / 'subtask_percent': seconds and percent of each subtask, per subtask
+
+    Built during Task 2 extraction, saved as one JSON file per day and merged
+    across days, files or processes without going back to the raw logs.
+    """
+
+    def __init__(self, k=1000):
+        self.k = k
+        self.sketches = {}
+
+    def update(self, days, kind, names, values):
+        """Add `values`, grouped by (day, name); all arguments are aligned arrays."""
+        df = pd.DataFrame({'day': days, 'name': names, 'value': values})
+        for (day, name), group in df.groupby(['day', 'name'], sort=False):
+            key = (day, kind, name)
+            if key not in self.sketches:
+                self.sketches[key] = KLLSketch(self.k)
+            self.sketches[key].update(group['value'].to_numpy())
+        return self
+
+    def merge(self, other):
+        for key, sketch in other.sketches.items():
+            if key in self.sketches:
+                self.sketches[key].merge(sketch)
+            else:
+                self.sketches[key] = KLLSketch.from_dict(sketch.to_dict())
+        return self
+
+    @property
+    def days(self):
+        return sorted({day for day, _, _ in self.sketches})
+
+    def combined(self, kind, days=None):
+        """{name: sketch} for one kind, merged over `days` (default: all)."""
+        result = {}
+        for (day, sketch_kind, name), sketch in self.sketches.items():
+            if sketch_kind != kind or (days is not None and day not in days):
+                continue
+            if name not in result:
+                result[name] = KLLSketch(self.k)
+            result[name].merge(sketch)
+        return result
+
+    def overall(self, kind, days=None):
+        """One sketch of `kind` over all names."""
+        total = KLLSketch(self.k)
+        for sketch in self.combined(kind, days).values():
+            total.merge(sketch)
+        return total
+
+    def quantile_table(self, kind, qs=(0.5, 0.95, 0.99), days=None):
+        """Count, min/max and quantiles per name as a DataFrame."""
+        rows = []
+        for name, sketch in self.combined(kind, days).items():
+            rows.append([name, sketch.count, sketch.min, sketch.max] + sketch.quantiles(qs))
+        columns = ['name', 'count', 'min', 'max'] + [f"p{int(q * 100)}" for q in qs]
+        return pd.DataFrame(rows, columns=columns).sort_values('name', ignore_index=True)
+
+    def save(self, path="output/latency_sketches", merge_existing=False):
+        """
+        Write one `<day>.json` per day. With `merge_existing=True`, sketches
+        already saved for a day are merged in (e.g. when files are ingested one
+        at a time) instead of being overwritten.
+        """
+        os.makedirs(path, exist_ok=True)
+        for day in self.days:
+            day_sketches = LatencySketches(self.k)
+            day_sketches.sketches = {key: sketch for key, sketch in self.sketches.items() if key[0] == day}
+            file_path = os.path.join(path, f"{day}.json")
+            if merge_existing and os.path.exists(file_path):
+                day_sketches = LatencySketches.load(path, days=[day]).merge(day_sketches)
+
+            state = {}
+            for (_, kind, name), sketch in day_sketches.sketches.items():
+                state.setdefault(kind, {})[name] = sketch.to_dict()
+            with open(file_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+        print(f"💾 Latency sketches saved to {path} ({len(self.days)} days)")
+
+    @classmethod
+    def load(cls, path="output/latency_sketches", days=None, k=1000):
+        """Load the saved days (all, or only `days`) into one LatencySketches."""
+        sketches = cls(k)
+        for file_name in sorted(os.listdir(path)):
+            day = file_name[:-len('.json')]
+            if not file_name.endswith('.json') or (days is not None and day not in days):
+                continue
+            with open(os.path.join(path, file_name), encoding='utf-8') as f:
+                state = json.load(f)
+            for kind, by_name in state.items():
+                for name, data in by_name.items():
+                    sketches.sketches[(day, kind, name)] = KLLSketch.from_dict(data)
+        return sketches
+
+
+def timestamp_days(timestamp_raw):
+    """'YYYY-MM-DD' for nanosecond `timestamp_raw` values ('unknown' when missing)."""
+    ts = pd.to_datetime(pd.to_numeric(pd.Series(timestamp_raw), errors='coerce'), unit='ns', errors='coerce')
+    return ts.dt.strftime('%Y-%m-%d').fillna('unknown').to_numpy()
@@ -0,0 +1,104 @@
+import os
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from model_registry import REGISTRY_DIR
+from instrumentation import instrumented
+
+
+class SharedMatrix:
+    """
+    A 2-D float64 matrix copied once into `multiprocessing.shared_memory`.
+    Worker processes receive only `spec` (name, shape, dtype) and map the same
+    pages with `attach`, without copying or pickling the data.
+    """
+
+    def __init__(self, values):
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        self.array = np.ndarray(values.shape, dtype=values.dtype, buffer=self._shm.buf)
+        self.array[:] = values
+        self.spec = (self._shm.name, values.shape, values.dtype.str)
+
+    def close(self):
+        """Release and remove the segment (the owner calls this once workers are done)."""
+        self.array = None
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(spec):
+    """(read-only array view, SharedMemory handle) for a SharedMatrix `spec`; close the handle after use."""
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    array.flags.writeable = False
+    return array, shm
+
+
+def _isolation_forest_task(spec, columns, contamination, random_state, max_train_rows):
+    from anomaly_detection import train_isolation_forest
+    X, shm = attach(spec)
+    X_df = None
+    try:
+        X_df = pd.DataFrame(X, columns=columns, copy=False)
+        return train_isolation_forest(X_df, contamination, random_state, max_train_rows=max_train_rows)
+    finally:
+        del X, X_df
+        shm.close()
+
+
+def _dbscan_candidate_task(spec, eps, min_samples):
+    from dbscan_clustering import score_dbscan_candidate
+    X, shm = attach(spec)
+    try:
+        return score_dbscan_candidate(X, eps, min_samples)
+    finally:
+        del X
+        shm.close()
+
+
+@instrumented()
+def run_models_shared(features_csv="output/task2_stopwatch_features.csv",
+                      preprocessed_csv="output/preprocessed_clustering_features.csv",
+                      contamination=0.01, random_state=42, max_train_rows=None, n_workers=None,
+                      registry_dir=REGISTRY_DIR):
+    """
+    Isolation Forest training and every DBSCAN tuning candidate (fit +
+    silhouette score) as tasks of one process pool. Each feature matrix is
+    read once and placed in shared memory; workers attach to it zero-copy.
+    Results are gathered in submission order and the best DBSCAN candidate
+    is chosen in grid order, so outputs match `run_isolation_forest` +
+    `run_dbscan_clustering` whatever order the workers finish in.
+    Returns (anomaly results, DBSCAN results).
+    """
+    from anomaly_detection import load_isolation_forest_features, save_isolation_forest_results
+    from dbscan_clustering import load_dbscan_features, dbscan_candidates, best_dbscan_params, save_dbscan_results
+
+    df_anomaly, X_anomaly = load_isolation_forest_features(features_csv)
+    df_dbscan, X_dbscan = load_dbscan_features(preprocessed_csv)
+    candidates = dbscan_candidates()
+    n_workers = n_workers or os.cpu_count() or 1
+    print(f"🧵 Running Isolation Forest + {len(candidates)} DBSCAN candidates on {n_workers} workers")
+
+    with SharedMatrix(X_anomaly.to_numpy()) as shared_anomaly, SharedMatrix(X_dbscan.to_numpy()) as shared_dbscan, \
+            ProcessPoolExecutor(max_workers=n_workers) as pool:
+        forest_future = pool.submit(_isolation_forest_task, shared_anomaly.spec, list(X_anomaly.columns),
+                                    contamination, random_state, max_train_rows)
+        candidate_futures = [pool.submit(_dbscan_candidate_task, shared_dbscan.spec, eps, min_samples)
+                             for eps, min_samples in candidates]
+        scores = [future.result() for future in candidate_futures]
+        model, raw_scores = forest_future.result()
+
+    anomaly_df = save_isolation_forest_results(df_anomaly, X_anomaly, model, raw_scores, random_state,
+                                               max_train_rows, registry_dir)
+    best_params, best_score = best_dbscan_params(scores)
+    dbscan_df = save_dbscan_results(df_dbscan, X_dbscan, best_params, best_score, registry_dir)
+    return anomaly_df, dbscan_df
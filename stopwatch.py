@@ -1,17 +1,42 @@
 import pandas as pd
 import re
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
+import numpy as np
+from preprocess import first_truthy
+from quantile_sketch import timestamp_days
+from instrumentation import instrumented
+from log_store import resolve_logs
 
-def extract_stopwatch_tasks(df_logs_parsed, output_csv="output/task2_stopwatch_details.csv"):
+STOPWATCH_COLUMNS = ['line.message', 'line.mdc.trace_id', 'fields.TraceID', 'timestamp_raw']
+
+@instrumented()
+def extract_stopwatch_tasks(df_logs_parsed, output_csv="output/task2_stopwatch_details.csv", store=None,
+                            sketches=None):
     """
     Extract stopwatch logs and return a structured DataFrame with:
     trace_id, stopwatch_name, total_time_sec, subtask, subtask_time_sec, subtask_percent
+
+    If the PayloadStore from `clean_logs` is passed as `store`, the StopWatch
+    captures made during cleaning are reused instead of re-running the regexes.
+    If a LatencySketches is passed as `sketches`, it is updated with the
+    extracted block totals and subtask timings, per day.
+
+    `df_logs_parsed` may also be a LogStoreReader: only STOPWATCH_COLUMNS and
+    the selected partitions' PayloadStores are read.
     """
+    df_logs_parsed, store = resolve_logs(df_logs_parsed, STOPWATCH_COLUMNS, store, with_store=True)
+    if store is not None:
+        result_df, record_rows = _stopwatch_tasks_from_store(df_logs_parsed, store)
+        if sketches is not None:
+            _update_sketches(sketches, df_logs_parsed, result_df, record_rows)
+        os.makedirs(os.path.dirname(output_csv), exist_ok=True)
+        result_df.to_csv(output_csv, index=False)
+        return result_df
+
     df_stopwatch_logs = df_logs_parsed[df_logs_parsed['line.message'].str.contains("StopWatch", na=False)].copy()
 
     stopwatch_records = []
+    record_rows = []
 
     for idx, row in df_stopwatch_logs.iterrows():
         msg = row['line.message']
@@ -37,25 +62,76 @@ def extract_stopwatch_tasks(df_logs_parsed, output_csv="output/task2_stopwatch_d
                     'subtask_time_sec': float(sec),
                     'subtask_percent': int(pct)
                 })
+                record_rows.append(idx)
         except Exception:
             continue
 
     result_df = pd.DataFrame(stopwatch_records)
+    if sketches is not None:
+        record_rows = df_logs_parsed.index.get_indexer(record_rows)
+        _update_sketches(sketches, df_logs_parsed, result_df, record_rows)
 
     os.makedirs(os.path.dirname(output_csv), exist_ok=True)
     result_df.to_csv(output_csv, index=False)
     return result_df
 
 
-def plot_stopwatch_analysis(df_stopwatch_tasks, save_dir="output/figures"):
+def _stopwatch_tasks_from_store(df_logs_parsed, store):
+    """Task 2 records built in one vectorized pass over the PayloadStore captures."""
+    trace_ids = np.array(first_truthy(df_logs_parsed, ['line.mdc.trace_id', 'fields.TraceID'], None), dtype=object)
+    has_trace = np.array([bool(t) for t in trace_ids], dtype=bool)
+
+    rows, names, totals, subtasks, secs, pcts = store.stopwatch_subtasks(rows=has_trace)
+    if len(rows) == 0:
+        return pd.DataFrame(), rows
+    return pd.DataFrame({
+        'trace_id': trace_ids[rows],
+        'stopwatch_name': names,
+        'total_time_sec': totals,
+        'subtask': subtasks,
+        'subtask_time_sec': secs,
+        'subtask_percent': pcts
+    }), rows
+
+
+def _update_sketches(sketches, df_logs_parsed, result_df, record_rows):
+    """Feed Task 2 records (with their row positions) into LatencySketches by day."""
+    if result_df.empty:
+        return
+    record_rows = np.asarray(record_rows)
+    if 'timestamp_raw' in df_logs_parsed.columns:
+        days = timestamp_days(df_logs_parsed['timestamp_raw'].to_numpy()[record_rows])
+    else:
+        days = np.full(len(record_rows), 'unknown', dtype=object)
+
+    # One total per StopWatch block (records repeat it for every subtask)
+    _, first = np.unique(record_rows, return_index=True)
+    sketches.update(days[first], 'stopwatch_total', result_df['stopwatch_name'].to_numpy()[first],
+                    result_df['total_time_sec'].to_numpy()[first])
+    sketches.update(days, 'subtask_time', result_df['subtask'].to_numpy(), result_df['subtask_time_sec'].to_numpy())
+    sketches.update(days, 'subtask_percent', result_df['subtask'].to_numpy(), result_df['subtask_percent'].to_numpy())
+
+
+@instrumented()
+def plot_stopwatch_analysis(df_stopwatch_tasks=None, save_dir="output/figures", sketches=None):
     """
     Plot and save charts for stopwatch analysis.
+
+    With `sketches` (LatencySketches, e.g. loaded for a range of days) the charts
+    are drawn from the quantile sketches instead of the subtask frame, and a
+    p50/p95/p99 chart per stopwatch is added.
     """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
     os.makedirs(save_dir, exist_ok=True)
 
     # ✅ Total duration histogram
     plt.figure(figsize=(10, 6))
-    sns.histplot(df_stopwatch_tasks['total_time_sec'], bins=30, kde=True)
+    if sketches is not None:
+        values, weights = sketches.overall('stopwatch_total').weighted_values()
+        sns.histplot(x=values, weights=weights, bins=30, kde=True)
+    else:
+        sns.histplot(df_stopwatch_tasks['total_time_sec'], bins=30, kde=True)
     plt.xlabel("Total Execution Time (seconds)")
     plt.title("Distribution of Total Stopwatch Execution Times")
     plt.grid(True)
@@ -64,12 +140,12 @@ def plot_stopwatch_analysis(df_stopwatch_tasks, save_dir="output/figures"):
     plt.close()
 
     # ✅ Top subtasks by max %
-    top_subtasks = (
-        df_stopwatch_tasks.groupby('subtask')['subtask_percent']
-        .max().reset_index()
-        .sort_values(by='subtask_percent', ascending=False)
-        .head(15)
-    )
+    if sketches is not None:
+        top_subtasks = sketches.quantile_table('subtask_percent')[['name', 'max']]
+        top_subtasks.columns = ['subtask', 'subtask_percent']
+    else:
+        top_subtasks = df_stopwatch_tasks.groupby('subtask')['subtask_percent'].max().reset_index()
+    top_subtasks = top_subtasks.sort_values(by='subtask_percent', ascending=False).head(15)
 
     plt.figure(figsize=(12, 6))
     barplot = sns.barplot(y='subtask', x='subtask_percent', data=top_subtasks, palette="Blues_d")
@@ -85,3 +161,15 @@ def plot_stopwatch_analysis(df_stopwatch_tasks, save_dir="output/figures"):
     plt.tight_layout()
     plt.savefig(f"{save_dir}/task2_top_subtasks.png")
     plt.close()
+
+    # ✅ Latency quantiles per stopwatch
+    if sketches is not None:
+        quantiles = sketches.quantile_table('stopwatch_total').set_index('name')[['p50', 'p95', 'p99']]
+        quantiles.sort_values('p99', ascending=False).head(15).plot(kind='barh', figsize=(12, 6))
+        plt.gca().invert_yaxis()
+        plt.xlabel("Total Execution Time (seconds)")
+        plt.ylabel("Stopwatch")
+        plt.title("Stopwatch Latency p50 / p95 / p99")
+        plt.tight_layout()
+        plt.savefig(f"{save_dir}/task2_stopwatch_latency_quantiles.png")
+        plt.close()
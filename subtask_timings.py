@@ -0,0 +1,175 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from instrumentation import instrumented
+from model_registry import ModelRegistry, REGISTRY_DIR
+
+SUBTASK_TIMINGS_DIR = "output/task2_subtask_timings"
+STOPWATCH_KEYS = ['trace_id', 'stopwatch_name']
+
+
+def hash_subtasks(subtasks, n_hash_features):
+    """
+    Hashed column of each subtask name (a stable 64-bit hash, the same in
+    every run and process, modulo `n_hash_features`), -1 for missing names.
+    """
+    names = pd.Series(subtasks, dtype=object)
+    columns = pd.util.hash_array(names.fillna('').astype(str).to_numpy(dtype=object)) % np.uint64(n_hash_features)
+    return np.where(names.isna(), -1, columns).astype(np.int32)
+
+
+class SubtaskTimingMatrix:
+    """
+    Sparse (stopwatch x subtask) timings: one CSR row per (trace_id,
+    stopwatch_name) in `keys`, holding the seconds spent in each subtask
+    (repeated subtasks summed). Columns are the sorted subtask vocabulary
+    `columns`, or with `n_hash_features` hashed buckets, so subtask names
+    never seen before need no vocabulary.
+    """
+
+    def __init__(self, matrix, keys, columns=None, n_hash_features=None):
+        self.matrix = matrix
+        self.keys = keys
+        self.columns = list(columns) if columns is not None else None
+        self.n_hash_features = n_hash_features
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def feature_names(self):
+        """Name of each column: the subtask, or `subtask_hash_<i>` for hashed buckets."""
+        if self.n_hash_features is not None:
+            return [f"subtask_hash_{i}" for i in range(self.n_hash_features)]
+        return list(self.columns)
+
+    def column_of(self, subtasks):
+        """Column of each subtask name, -1 for names outside the vocabulary."""
+        if self.n_hash_features is not None:
+            return hash_subtasks(subtasks, self.n_hash_features)
+        return pd.Index(self.columns).get_indexer(pd.Series(subtasks, dtype=object)).astype(np.int32)
+
+    @classmethod
+    def build(cls, df_details, n_hash_features=None, columns=None):
+        """
+        Pivot `extract_stopwatch_tasks` rows in one vectorized pass. Rows
+        follow `build_stopwatch_features` order. Pass the `columns` of a
+        training matrix to score new stopwatches against its vocabulary.
+        """
+        from scipy import sparse
+
+        groups = df_details.groupby(STOPWATCH_KEYS, sort=True)
+        rows = groups.ngroup().to_numpy()
+        keys = groups.size().index.to_frame(index=False)
+
+        if n_hash_features is None and columns is None:
+            codes, vocabulary = pd.factorize(df_details['subtask'], sort=True)
+            timings = cls(None, keys, columns=vocabulary.astype(str))
+            cols = codes.astype(np.int32)
+        else:
+            timings = cls(None, keys, columns=columns, n_hash_features=n_hash_features)
+            cols = timings.column_of(df_details['subtask'].to_numpy())
+        n_columns = n_hash_features if n_hash_features is not None else len(timings.columns)
+
+        values = df_details['subtask_time_sec'].to_numpy(dtype=np.float32)
+        keep = (rows >= 0) & (cols >= 0) & ~np.isnan(values)
+        # COO -> CSR sums the duplicate (row, column) entries of repeated subtasks
+        timings.matrix = sparse.csr_matrix((values[keep], (rows[keep], cols[keep])), shape=(len(keys), n_columns))
+        timings.matrix.sort_indices()
+        return timings
+
+    def save(self, path=SUBTASK_TIMINGS_DIR):
+        os.makedirs(path, exist_ok=True)
+        for name in ['data', 'indices', 'indptr']:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self.matrix, name))
+        with open(os.path.join(path, "keys.json"), 'w', encoding='utf-8') as f:
+            json.dump({
+                'shape': list(self.matrix.shape),
+                'columns': self.columns,
+                'n_hash_features': self.n_hash_features,
+                **{key: self.keys[key].astype(str).tolist() for key in STOPWATCH_KEYS},
+            }, f)
+
+    @classmethod
+    def load(cls, path=SUBTASK_TIMINGS_DIR, mmap_mode='r'):
+        """Load a matrix written by `save`, with its CSR arrays memory-mapped."""
+        from scipy import sparse
+        arrays = [np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+                  for name in ['data', 'indices', 'indptr']]
+        with open(os.path.join(path, "keys.json"), encoding='utf-8') as f:
+            meta = json.load(f)
+        matrix = sparse.csr_matrix(tuple(arrays), shape=tuple(meta['shape']), copy=False)
+        keys = pd.DataFrame({key: meta[key] for key in STOPWATCH_KEYS})
+        return cls(matrix, keys, columns=meta['columns'], n_hash_features=meta['n_hash_features'])
+
+
+@instrumented()
+def build_subtask_timing_matrix(input_path="output/task2_stopwatch_details.csv", output_dir=SUBTASK_TIMINGS_DIR,
+                                n_hash_features=None):
+    """
+    Sparse per-subtask timing matrix from the stopwatch subtask breakdowns,
+    saved as CSR arrays under `output_dir`. With `n_hash_features`, subtask
+    names are hashed into that many columns instead of a vocabulary.
+    """
+    df = pd.read_csv(input_path)
+    timings = SubtaskTimingMatrix.build(df, n_hash_features=n_hash_features)
+    print(f"✅ Subtask timing matrix: {timings.shape[0]} stopwatches x {timings.shape[1]} subtask columns, "
+          f"{timings.matrix.nnz} stored timings")
+
+    if output_dir is not None:
+        timings.save(output_dir)
+        print(f"💾 Subtask timing matrix saved to {output_dir}")
+    return timings
+
+
+@instrumented()
+def run_subtask_models(matrix_dir=SUBTASK_TIMINGS_DIR, contamination=0.01, random_state=42, eps=0.5,
+                       min_samples=5, n_jobs=None, max_train_rows=None,
+                       output_csv="output/subtask_model_results.csv", registry_dir=REGISTRY_DIR):
+    """
+    Isolation Forest and DBSCAN on the sparse subtask timings, both fed the
+    CSR matrix directly (DBSCAN after max-abs scaling, which keeps it
+    sparse). Saves per-stopwatch anomaly scores, flags, the subtasks that
+    isolated each flagged stopwatch and cluster labels, and registers the
+    compiled forest as a new 'subtask_isolation_forest' version.
+    """
+    from sklearn.cluster import DBSCAN
+    from sklearn.preprocessing import MaxAbsScaler
+    from anomaly_detection import train_isolation_forest
+    from compiled_forest import compile_isolation_forest, explain_anomalies
+
+    timings = SubtaskTimingMatrix.load(matrix_dir)
+    X = timings.matrix
+    print(f"📦 Subtask timing matrix shape: {X.shape} ({X.nnz} stored timings)")
+
+    print("🧠 Training Isolation Forest on the sparse matrix...")
+    model, raw_scores = train_isolation_forest(X, contamination, random_state, n_jobs=n_jobs,
+                                               max_train_rows=max_train_rows)
+    print("🔍 Running DBSCAN on the scaled sparse matrix...")
+    labels = DBSCAN(eps=eps, min_samples=min_samples).fit_predict(MaxAbsScaler().fit_transform(X))
+
+    df = timings.keys.copy()
+    df['anomaly_score_value'] = raw_scores - model.offset_
+    df['is_anomaly'] = df['anomaly_score_value'] < 0
+    # Which subtasks isolated each anomaly, walked on the flagged CSR rows only
+    compiled = compile_isolation_forest(model)
+    df = explain_anomalies(df, compiled, timings.feature_names, df['is_anomaly'], X=X)
+    df['cluster'] = labels
+    print(f"🚨 {int(df['is_anomaly'].sum())} Isolation Forest anomalies, "
+          f"{int((labels == -1).sum())} DBSCAN outliers, {len(set(labels) - {-1})} clusters")
+
+    os.makedirs(os.path.dirname(output_csv), exist_ok=True)
+    df.to_csv(output_csv, index=False)
+    print(f"💾 Subtask model results saved to {output_csv}")
+
+    ModelRegistry(registry_dir).register(
+        'subtask_isolation_forest', X, model=model, feature_names=timings.feature_names,
+        arrays={**compiled.to_arrays(), 'score_distribution': np.sort(raw_scores)},
+        params={'n_estimators': model.n_estimators, 'n_jobs': model.n_jobs, 'max_samples': model.max_samples,
+                'contamination': contamination, 'random_state': random_state, 'max_train_rows': max_train_rows,
+                'n_hash_features': timings.n_hash_features},
+        metrics={'n_anomalies': int(df['is_anomaly'].sum()), 'n_dbscan_outliers': int((labels == -1).sum())},
+    )
+    return df
@@ -1,12 +1,21 @@
 import pandas as pd
 import os
+from preprocess import first_truthy
+from instrumentation import instrumented
+from log_store import LogStoreReader, resolve_logs
 
+@instrumented()
 def build_stopwatch_features(input_path="output/task2_stopwatch_details.csv" , output_csv="output/task2_stopwatch_features.csv"):
     """
     Build a feature table from stopwatch subtask breakdowns for anomaly detection.
+    `input_path` may also be the `extract_stopwatch_tasks` frame itself, or a
+    LogStoreReader, whose stopwatch rows are extracted first.
     """
-    # ✅ Step 1: Load stopwatch details CSV
-    df = pd.read_csv(input_path)
+    # ✅ Step 1: Load stopwatch details (CSV, frame, or extracted from a log store)
+    if isinstance(input_path, LogStoreReader):
+        from stopwatch import extract_stopwatch_tasks
+        input_path = extract_stopwatch_tasks(input_path)
+    df = input_path if isinstance(input_path, pd.DataFrame) else pd.read_csv(input_path)
 
     # ✅ Step 2: Identify the max subtask and summarize others per stopwatch
     groups = df.groupby(['trace_id', 'stopwatch_name'])
@@ -47,3 +56,31 @@ def build_stopwatch_features(input_path="output/task2_stopwatch_details.csv" , o
         print(f"✅ Feature table saved to {output_csv}")
 
     return df_features
+
+
+@instrumented()
+def build_template_features(df_logs_parsed, output_csv="output/template_features.csv", min_count=1):
+    """
+    Per-trace counts of every mined log template (`template_<id>` columns), from
+    the `template_id` column added by `clean_logs(..., template_miner=...)`.
+    Templates seen fewer than `min_count` times overall are dropped.
+    `df_logs_parsed` may also be a LogStoreReader.
+    """
+    df_logs_parsed, _ = resolve_logs(df_logs_parsed, ['line.mdc.trace_id', 'fields.TraceID', 'template_id'])
+    trace_ids = first_truthy(df_logs_parsed, ['line.mdc.trace_id', 'fields.TraceID'], None)
+    df = pd.DataFrame({'trace_id': trace_ids, 'template_id': df_logs_parsed['template_id'].values})
+    df = df.dropna()
+
+    counts = df.groupby(['trace_id', 'template_id'], observed=True).size().unstack(fill_value=0)
+    counts = counts.loc[:, counts.sum() >= min_count]
+    counts.columns = [f"template_{tid}" for tid in counts.columns]
+    df_features = counts.reset_index()
+
+    if output_csv is not None:
+        dir_name = os.path.dirname(output_csv)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        df_features.to_csv(output_csv, index=False)
+        print(f"✅ Template feature table saved to {output_csv}")
+
+    return df_features
@@ -0,0 +1,179 @@
+import os
+import re
+import json
+from collections import OrderedDict
+import pandas as pd
+
+WILDCARD = '<*>'
+# Embedded JSON payloads and number-like tokens are masked before mining
+JSON_PATTERN = re.compile(r'{.*}', flags=re.DOTALL)
+NUMBER_PATTERN = re.compile(r'\b(?:0x[0-9a-fA-F]+|[0-9a-fA-F]{8}(?:-[0-9a-fA-F]{4}){3}-[0-9a-fA-F]{12}|\d+(?:[.,:]\d+)*)\b')
+
+
+def mask_message(msg):
+    """Replace embedded JSON with <JSON> and numbers/hex/GUIDs with <NUM>."""
+    return NUMBER_PATTERN.sub('<NUM>', JSON_PATTERN.sub('<JSON>', msg))
+
+
+class _Node:
+    __slots__ = ('children', 'cluster_ids')
+
+    def __init__(self):
+        self.children = {}
+        self.cluster_ids = []
+
+    def to_dict(self):
+        return {
+            'children': {token: child.to_dict() for token, child in self.children.items()},
+            'cluster_ids': self.cluster_ids,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        node = cls()
+        node.children = {token: cls.from_dict(child) for token, child in data['children'].items()}
+        node.cluster_ids = list(data['cluster_ids'])
+        return node
+
+
+class TemplateMiner:
+    """
+    Online Drain-style log template miner.
+
+    A message is masked, split into tokens and routed through a fixed-depth
+    prefix tree (token count, then the first `depth - 2` tokens). The leaf holds
+    candidate templates; the message joins the most similar one if at least
+    `sim_threshold` of the template's tokens match (differing positions become
+    `<*>`), otherwise it starts a new template. Recently seen masked messages are
+    answered from an LRU cache of at most `cache_size` entries without walking
+    the tree at all.
+
+    The tree and templates can be saved to JSON and loaded again to warm-start
+    the next run with stable template IDs.
+    """
+
+    def __init__(self, depth=4, sim_threshold=0.4, max_children=100, max_tokens=64, cache_size=100_000):
+        self.depth = depth
+        self.sim_threshold = sim_threshold
+        self.max_children = max_children
+        self.max_tokens = max_tokens
+        self.cache_size = cache_size
+        self.root = _Node()
+        self.templates = []
+        self.sizes = []
+        self._cache = OrderedDict()
+
+    def _tokens(self, masked):
+        return masked.split()[:self.max_tokens]
+
+    def _leaf(self, tokens):
+        node = self.root.children.get(len(tokens))
+        if node is None:
+            node = self.root.children[len(tokens)] = _Node()
+
+        for token in tokens[:self.depth - 2]:
+            if any(ch.isdigit() for ch in token):
+                token = WILDCARD
+            child = node.children.get(token)
+            if child is None:
+                if len(node.children) < self.max_children:
+                    child = node.children[token] = _Node()
+                else:
+                    child = node.children.setdefault(WILDCARD, _Node())
+            node = child
+        return node
+
+    def _similarity(self, template, tokens):
+        matches = sum(1 for t, tok in zip(template, tokens) if t == tok and t != WILDCARD)
+        return matches / len(template) if template else 1.0
+
+    def add(self, msg):
+        """Assign a template ID to one message, learning a new template if needed."""
+        masked = mask_message(msg)
+        cluster_id = self._cache.get(masked)
+        if cluster_id is not None:
+            self._cache.move_to_end(masked)
+            self.sizes[cluster_id] += 1
+            return cluster_id
+
+        tokens = self._tokens(masked)
+        leaf = self._leaf(tokens)
+        best_id, best_sim = None, -1.0
+        for candidate in leaf.cluster_ids:
+            sim = self._similarity(self.templates[candidate], tokens)
+            if sim > best_sim:
+                best_id, best_sim = candidate, sim
+
+        if best_id is not None and best_sim >= self.sim_threshold:
+            template = self.templates[best_id]
+            self.templates[best_id] = [t if t == tok else WILDCARD for t, tok in zip(template, tokens)]
+            cluster_id = best_id
+        else:
+            cluster_id = len(self.templates)
+            self.templates.append(tokens)
+            self.sizes.append(0)
+            leaf.cluster_ids.append(cluster_id)
+
+        self.sizes[cluster_id] += 1
+        self._cache[masked] = cluster_id
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return cluster_id
+
+    def assign(self, messages):
+        """
+        Template IDs for a Series of messages as a compact categorical column
+        (missing messages stay missing).
+        """
+        ids = [self.add(msg) if isinstance(msg, str) else None for msg in messages]
+        return pd.Series(
+            pd.Categorical(ids, categories=range(len(self.templates))),
+            index=getattr(messages, 'index', None),
+            name='template_id'
+        )
+
+    def template_table(self):
+        """All templates with their IDs and how many messages they matched."""
+        return pd.DataFrame({
+            'template_id': range(len(self.templates)),
+            'template': [' '.join(tokens) for tokens in self.templates],
+            'size': self.sizes,
+        })
+
+    def save(self, path="output/template_miner.json"):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        state = {
+            'params': {
+                'depth': self.depth,
+                'sim_threshold': self.sim_threshold,
+                'max_children': self.max_children,
+                'max_tokens': self.max_tokens,
+                'cache_size': self.cache_size,
+            },
+            'templates': self.templates,
+            'sizes': self.sizes,
+            'tree': self.root.to_dict(),
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        print(f"💾 Template miner saved to {path} ({len(self.templates)} templates)")
+
+    @classmethod
+    def load(cls, path="output/template_miner.json"):
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+        miner = cls(**state['params'])
+        miner.templates = state['templates']
+        miner.sizes = state['sizes']
+        miner.root = _Node.from_dict(state['tree'])
+        # JSON object keys are strings; the first tree level is keyed by token count
+        miner.root.children = {int(length): node for length, node in miner.root.children.items()}
+        return miner
+
+
+def load_or_create_miner(path="output/template_miner.json", **params):
+    """Warm-start from a saved miner if one exists, otherwise start empty."""
+    if os.path.exists(path):
+        print(f"♻️ Warm-starting template miner from {path}")
+        return TemplateMiner.load(path)
+    return TemplateMiner(**params)
@@ -1,28 +1,36 @@
 import os
 import warnings
-import joblib
-from joblib import load
-import matplotlib.pyplot as plt
 import pandas as pd
 warnings.filterwarnings("ignore")
 
 from load_and_parse import load_all_logs
 from preprocess import clean_logs
+from template_miner import load_or_create_miner
+from dtype_optimizer import optimize_dtypes
 from global_stats import analyze_execute_event_flat, analyze_execute_event_hierarchy, plot_execute_event_combinations
 from stopwatch import extract_stopwatch_tasks, plot_stopwatch_analysis
+from quantile_sketch import LatencySketches
 from large_array_check import detect_large_json_arrays
+from trace_sessions import build_trace_index, build_trace_features
+from timeseries_monitor import detect_time_series_anomalies
 from eda import (
     summarize_columns, group_columns_by_prefix, plot_log_volume_over_time,
-    plot_status_and_loggers, extract_top_keywords
+    plot_status_and_loggers, extract_top_keywords, EDAAggregates, plot_top_templates
 )
-from task2_anomaly_features import build_stopwatch_features
+from task2_anomaly_features import build_stopwatch_features, build_template_features
 from anomaly_detection import run_isolation_forest, plot_anomaly_scores
 from feature_engineering import process as feature_engineering_process
 from dbscan_clustering import run_dbscan_clustering, plot_dbscan_clusters
 from anomaly_detection_vs_dbscan import compare_dbscan_and_anomaly
+from anomaly_model_tester import load_registered_model
+from model_registry import ModelRegistry
+from sklearn.cluster import DBSCAN
 
 TEST_DATA_DIR = "test_data"
 TEST_RESULT_DIR = "test_result"
+# Registered model versions to test (None = latest)
+ISOLATION_FOREST_VERSION = None
+DBSCAN_VERSION = None
 os.makedirs(TEST_RESULT_DIR, exist_ok=True)
 os.makedirs(os.path.join(TEST_RESULT_DIR, "figures"), exist_ok=True)
 
@@ -30,7 +38,13 @@ os.makedirs(os.path.join(TEST_RESULT_DIR, "figures"), exist_ok=True)
 logs = load_all_logs(TEST_DATA_DIR)
 
 # 2. Clean logs
-cleaned_logs = clean_logs(logs)
+# Warm-start from the templates mined in main.py so IDs stay comparable
+template_miner = load_or_create_miner("output/template_miner.json")
+eda_aggregates = EDAAggregates()
+cleaned_logs, payload_store = clean_logs(logs, return_store=True, template_miner=template_miner,
+                                         eda_aggregates=eda_aggregates)
+template_miner.template_table().to_csv(os.path.join(TEST_RESULT_DIR, "log_templates.csv"), index=False)
+cleaned_logs, _ = optimize_dtypes(cleaned_logs, report_csv=os.path.join(TEST_RESULT_DIR, "dtype_report.csv"))
 
 # 3. Task 1: Field analysis
 analyze_execute_event_flat(cleaned_logs, output_csv=os.path.join(TEST_RESULT_DIR, "task1_global_field_combination.csv"))
@@ -38,17 +52,32 @@ analyze_execute_event_hierarchy(cleaned_logs, output_csv=os.path.join(TEST_RESUL
 plot_execute_event_combinations(cleaned_logs, save_dir=os.path.join(TEST_RESULT_DIR, "figures"))
 
 # 4. Task 2: Stopwatch analysis
-stopwatch_df = extract_stopwatch_tasks(cleaned_logs, output_csv=os.path.join(TEST_RESULT_DIR, "task2_stopwatch_details.csv"))
-plot_stopwatch_analysis(stopwatch_df, save_dir=os.path.join(TEST_RESULT_DIR, "figures"))
+latency_sketches = LatencySketches()
+stopwatch_df = extract_stopwatch_tasks(cleaned_logs, output_csv=os.path.join(TEST_RESULT_DIR, "task2_stopwatch_details.csv"),
+                                       store=payload_store, sketches=latency_sketches)
+latency_sketches.save(os.path.join(TEST_RESULT_DIR, "latency_sketches"))
+latency_sketches.quantile_table('stopwatch_total').to_csv(
+    os.path.join(TEST_RESULT_DIR, "task2_stopwatch_latency_quantiles.csv"), index=False)
+plot_stopwatch_analysis(stopwatch_df, save_dir=os.path.join(TEST_RESULT_DIR, "figures"), sketches=latency_sketches)
 
 # 5. Task 3: Large array detection
-detect_large_json_arrays(cleaned_logs)
+detect_large_json_arrays(cleaned_logs, store=payload_store)
+
+# 5b. Trace sessions
+trace_index = build_trace_index(cleaned_logs)
+build_trace_features(cleaned_logs, index=trace_index, store=payload_store,
+                     output_csv=os.path.join(TEST_RESULT_DIR, "trace_features.csv"))
+
+# 5c. Time-series alerts
+detect_time_series_anomalies(cleaned_logs, store=payload_store,
+                             output_csv=os.path.join(TEST_RESULT_DIR, "timeseries_alerts.csv"))
 
 # 6. EDA
-summarize_columns(cleaned_logs, output_csv=os.path.join(TEST_RESULT_DIR, "eda_column_summary.csv"))
+summarize_columns(output_csv=os.path.join(TEST_RESULT_DIR, "eda_column_summary.csv"), aggregates=eda_aggregates)
 group_columns_by_prefix(cleaned_logs)
-plot_log_volume_over_time(cleaned_logs, save_dir=os.path.join(TEST_RESULT_DIR, "figures"))
-plot_status_and_loggers(cleaned_logs, save_dir=os.path.join(TEST_RESULT_DIR, "figures"))
+plot_log_volume_over_time(save_dir=os.path.join(TEST_RESULT_DIR, "figures"), aggregates=eda_aggregates)
+plot_status_and_loggers(save_dir=os.path.join(TEST_RESULT_DIR, "figures"), aggregates=eda_aggregates)
+plot_top_templates(template_miner=template_miner, save_dir=os.path.join(TEST_RESULT_DIR, "figures"), aggregates=eda_aggregates)
 extract_top_keywords(cleaned_logs, save_dir=TEST_RESULT_DIR)
 
 # 7. Build features for anomaly detection (Isolation Forest)
@@ -56,6 +85,7 @@ features_df = build_stopwatch_features(
     input_path=os.path.join(TEST_RESULT_DIR, "task2_stopwatch_details.csv"),
     output_csv=os.path.join(TEST_RESULT_DIR, "task2_stopwatch_features.csv")
 )
+build_template_features(cleaned_logs, output_csv=os.path.join(TEST_RESULT_DIR, "template_features.csv"))
 # 8. Predict anomalies using trained Isolation Forest
 # Use run_isolation_forest with a model_path to load the trained model (not retrain)
 
@@ -65,8 +95,8 @@ anomaly_features_path = os.path.join(TEST_RESULT_DIR, "task2_stopwatch_features.
 df_features = pd.read_csv(anomaly_features_path)
 X = df_features[['total_time_sec', 'max_subtask_percent', 'sum_other_subtask_time', 'ratio_other_to_max']].copy()
 
-# Load trained model
-model = load("output/isolation_forest_model.joblib")
+# Load trained model (compiled node arrays, memory-mapped from the registry)
+model = load_registered_model(ISOLATION_FOREST_VERSION)
 df_features['anomaly_score'] = model.predict(X)
 df_features['anomaly_score_value'] = model.decision_function(X)
 df_features['is_anomaly'] = df_features['anomaly_score'] == -1
@@ -87,10 +117,10 @@ feature_engineering_process(
 
 # 10. Predict clusters/anomalies using trained DBSCAN
 
-dbscan_info = joblib.load("output/dbscan_model.joblib")
+dbscan_entry = ModelRegistry().load('dbscan', DBSCAN_VERSION)
 df_dbscan = pd.read_csv(os.path.join(TEST_RESULT_DIR, "preprocessed_clustering_features.csv"))
-X_dbscan = df_dbscan[dbscan_info['feature_columns']]
-labels = dbscan_info['model'].fit_predict(X_dbscan)
+X_dbscan = dbscan_entry.select_features(df_dbscan)
+labels = DBSCAN(**dbscan_entry.params).fit_predict(X_dbscan)
 df_dbscan['cluster'] = labels
 dbscan_results_path = os.path.join(TEST_RESULT_DIR, "dbscan_clustering_results.csv")
 df_dbscan.to_csv(dbscan_results_path, index=False)
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+from anomaly_detection import (
+    FEATURE_COLUMNS, recalibrate_anomaly_results, save_isolation_forest_results, train_isolation_forest
+)
+from model_registry import ModelRegistry
+
+pytest.importorskip("sklearn")
+
+
+def test_registered_params_come_from_the_fitted_estimator(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.random((300, len(FEATURE_COLUMNS))), columns=FEATURE_COLUMNS)
+    model, raw_scores = train_isolation_forest(X, contamination=0.02, n_estimators=25, n_jobs=1)
+    save_isolation_forest_results(X.copy(), X, model, raw_scores, registry_dir=str(tmp_path / "models"))
+
+    params = ModelRegistry(str(tmp_path / "models")).load('isolation_forest').params
+    assert params['n_estimators'] == 25
+    assert params['n_jobs'] == 1
+    assert params['max_samples'] == 'auto'
+    assert params['contamination'] == 0.02
+
+
+def test_recalibrating_twice_does_not_compound_the_shift(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(1)
+    X = pd.DataFrame(rng.random((1000, len(FEATURE_COLUMNS))), columns=FEATURE_COLUMNS)
+    model, raw_scores = train_isolation_forest(X, contamination=0.01, n_estimators=25, n_jobs=1)
+    trained = save_isolation_forest_results(X.copy(), X, model, raw_scores, registry_dir=str(tmp_path / "models"))
+
+    assert recalibrate_anomaly_results(0.05, registry_dir=str(tmp_path / "models"))['is_anomaly'].sum() == 50
+    df = recalibrate_anomaly_results(0.01, registry_dir=str(tmp_path / "models"))
+    assert df['is_anomaly'].sum() == 10
+    np.testing.assert_allclose(df['anomaly_score_value'], trained['anomaly_score_value'])
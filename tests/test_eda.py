@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+from eda import DistinctCounter, EDAAggregates
+
+
+def _frame(n=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'timestamp_raw': (1_700_000_000 * 10**9 + np.arange(n) * 10**9 * 37).astype(str),
+        'line.logger': rng.choice(['a.B', 'c.D', 'e.F'], n),
+        'fields.detected_level': rng.choice(['info', 'error', None], n),
+        'duration': np.where(rng.random(n) < 0.5, rng.random(n), np.nan),
+    })
+
+
+def test_sketch_estimate_never_exceeds_the_values_added():
+    for n in [1100, 2000, 3000, 5000]:
+        counter = DistinctCounter()
+        counter.update(pd.Series(np.arange(n)).astype(str))
+        assert counter.registers is not None
+        assert counter.count() <= n
+
+
+def test_merge_keeps_value_counts_for_the_cap():
+    left, right = DistinctCounter(), DistinctCounter()
+    left.update(pd.Series(np.arange(0, 3000, 2)))
+    right.update(pd.Series(np.arange(1, 3000, 2)))
+    merged = left.merge(right)
+    assert merged.n_values == 3000
+    assert merged.count() <= 3000
+
+
+def test_column_summary_unique_values_are_bounded_by_non_null():
+    summary = EDAAggregates().update(_frame()).column_summary().set_index('Column')
+    assert (summary['Unique Values'] <= summary['Non-Null Count']).all()
+    assert summary.loc['line.logger', 'Unique Values'] == 3
+
+
+def test_save_and_load_round_trip(tmp_path):
+    df = _frame()
+    aggregates = EDAAggregates().update(df.iloc[:1500]).update(df.iloc[1500:])
+    aggregates.save(str(tmp_path))
+    loaded = EDAAggregates.load(str(tmp_path))
+
+    pd.testing.assert_frame_equal(loaded.column_summary(), aggregates.column_summary(), check_dtype=False)
+    assert loaded.day_counts.equals(aggregates.day_counts)
+    assert loaded.hour_counts.sort_index().equals(aggregates.hour_counts.sort_index())
+    for col in EDAAggregates.VALUE_COUNT_COLUMNS:
+        assert loaded.value_counts[col].to_dict() == aggregates.value_counts[col].to_dict()
+
+    # Loaded aggregates keep merging like fresh ones
+    merged = loaded.merge(EDAAggregates().update(_frame(seed=1)))
+    assert merged.n_rows == 6000
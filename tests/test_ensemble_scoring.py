@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from ensemble_scoring import DBSCANCoreDistanceDetector, EnsembleScorer
+
+pytest.importorskip("sklearn")
+
+
+def _features(seed=0, n=500):
+    return np.random.default_rng(seed).normal(size=(n, 3))
+
+
+def test_dbscan_training_scores_skip_each_core_row_itself():
+    X = _features()
+    detector = DBSCANCoreDistanceDetector(eps=0.5).fit(X)
+    core = detector.core_sample_indices_
+    training = detector.training_scores(X)
+
+    assert len(core) and (training[core] > 0).all()
+    assert (detector.score(X)[core] == 0).all()
+    others = np.setdiff1d(np.arange(len(X)), core)
+    np.testing.assert_array_equal(training[others], detector.score(X)[others])
+
+
+def test_lof_is_normalized_against_its_out_of_sample_training_scores():
+    X = _features()
+    scorer = EnsembleScorer(detectors=('lof', 'robust_zscore'), feature_columns=range(3)).fit(X)
+    lof = scorer.detectors[0].lof_
+    np.testing.assert_allclose(scorer.training_scores_[0], np.sort(-lof.negative_outlier_factor_))
+
+
+def test_fit_score_uses_the_training_scores_of_the_training_rows():
+    X = _features()
+    scorer = EnsembleScorer(detectors=('lof', 'dbscan_core_distance', 'robust_zscore'), feature_columns=range(3))
+    fitted = scorer.fit_score(X)
+    rescored = scorer.score(X)
+
+    np.testing.assert_allclose(fitted['lof_raw'], -scorer.detectors[0].lof_.negative_outlier_factor_)
+    assert (fitted['dbscan_core_distance_raw'] >= rescored['dbscan_core_distance_raw']).all()
+    np.testing.assert_array_equal(fitted['robust_zscore_raw'], rescored['robust_zscore_raw'])
@@ -0,0 +1,116 @@
+import json
+import random
+import pytest
+from large_array_check import count_top_level_arrays, detect_large_json_arrays
+
+
+def legacy_array_lengths(payload, array_length_threshold):
+    """The original Task 3 path: unescape, json.loads, report oversized top-level lists."""
+    try:
+        parsed = json.loads(payload.replace('\\"', '"').replace("\\'", "'"))
+        return [(key, len(value)) for key, value in parsed.items()
+                if isinstance(value, list) and len(value) > array_length_threshold]
+    except Exception:
+        return []
+
+
+def _random_string(rng):
+    return ''.join(rng.choice('ab "\\\'/\n\t{}[],:') if rng.random() < 0.3 else 'k'
+                   for _ in range(rng.randint(0, 5)))
+
+
+def _random_value(rng, depth=0):
+    r = rng.random()
+    if depth < 2 and r < 0.3:
+        return [_random_value(rng, depth + 1) for _ in range(rng.randint(0, 6))]
+    if depth < 2 and r < 0.4:
+        return {_random_string(rng): _random_value(rng, depth + 1) for _ in range(rng.randint(0, 3))}
+    if r < 0.7:
+        return _random_string(rng)
+    return rng.choice([1, -2.5, True, None, 0])
+
+
+def _random_payload(rng):
+    """A logged payload (quotes escaped as `\\"`), then a few random escape and byte edits."""
+    obj = {_random_string(rng): _random_value(rng) for _ in range(rng.randint(1, 4))}
+    chars = list(json.dumps(obj, ensure_ascii=rng.random() < 0.5).replace('"', '\\"'))
+    for _ in range(rng.choice([0, 0, 1, 2, 3])):
+        pos = rng.randrange(len(chars) + 1)
+        op = rng.random()
+        if op < 0.4:
+            chars.insert(pos, rng.choice(['\\', '"', '\\"', '\\\\', "\\'", "'", ',', '[', ']', '{', '}', ':', ' ', '\n']))
+        elif op < 0.8 and chars:
+            del chars[min(pos, len(chars) - 1)]
+        elif chars:
+            chars[min(pos, len(chars) - 1)] = rng.choice(['\\', '"', ','])
+    return ''.join(chars)
+
+
+def _decodes_without_repeated_keys(payload):
+    """Whether the legacy path decodes `payload` to an object whose top-level keys are all distinct."""
+    try:
+        pairs = json.loads(payload.replace('\\"', '"').replace("\\'", "'"), object_pairs_hook=list)
+    except ValueError:
+        return False
+    return isinstance(pairs, list) and len({key for key, _ in pairs}) == len(pairs)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_exact_scan_matches_json_loads_on_random_payloads(seed):
+    rng = random.Random(seed)
+    for _ in range(2000):
+        payload = _random_payload(rng)
+        if not (payload.startswith('{') and _decodes_without_repeated_keys(payload)):
+            # Malformed payloads only need to be scanned without raising
+            count_top_level_arrays(payload.encode('utf-8'), 1, stop_at_threshold=False)
+            continue
+        threshold = rng.choice([0, 1, 3])
+        got = count_top_level_arrays(payload.encode('utf-8'), threshold, stop_at_threshold=False)
+        assert got == [(key, n, False) for key, n in legacy_array_lengths(payload, threshold)], payload
+
+
+@pytest.mark.parametrize('seed', range(2))
+def test_early_exit_flags_the_same_payloads_with_lower_bounds(seed):
+    rng = random.Random(seed)
+    for _ in range(1000):
+        payload = _random_payload(rng)
+        if not (payload.startswith('{') and _decodes_without_repeated_keys(payload)):
+            continue
+        exact = dict(legacy_array_lengths(payload, 1))
+        got = count_top_level_arrays(payload.encode('utf-8'), 1, initial_window=8)
+        assert bool(got) == bool(exact), payload
+        for key, n, is_lower_bound in got:
+            assert 1 < n <= exact[key] and (is_lower_bound or n == exact[key]), payload
+
+
+@pytest.mark.parametrize('payload, expected', [
+    ('{\\"a\\": [1, 2, 3], \\"b\\": \\"x\\\\\\"}', [('a', 3, False)]),  # escaped backslash before a closing quote
+    ('{\\"a\\": [\\"\\\\\\"\\", 2, 3]}', None),  # `\\\"` closes the string and leaves a stray quote
+    ('{\\"a\\": [\\"x\\\\"],\\", 2, 3]}', [('a', 3, False)]),  # escaped quote inside a string
+    ('{\\"a\\n[\\": [\\"\\t,\\", 2, 3]}', [('a\n[', 3, False)]),  # other escapes in a key and a string
+    ('{\\"a\\\\\\\\\\": [1, 2, 3]}', [('a\\\\', 3, False)]),  # escaped backslashes ending a key
+    ('{"a": [1, 2, 3], \\"b\\": "\\"}', [('a', 3, False)]),  # raw and escaped quotes mixed
+    ('{\\"a\\": [1, 2, 3], \\"a\\": [4, 5, 6]}', [('a', 3, False), ('a', 3, False)]),  # a repeated key is reported per array
+    ('{\\"a\\": [1, 2, 3], \\"b\\": [1, 2, 3]', None),  # truncated
+])
+def test_escape_edge_cases(payload, expected):
+    assert count_top_level_arrays(payload.encode('utf-8'), 2, stop_at_threshold=False) == expected
+
+
+def test_early_exit_stops_at_the_first_oversized_array():
+    payload = json.dumps({'Small': [1], 'Rows': list(range(1000)), 'More': list(range(50))}).replace('"', '\\"')
+    payload = payload.encode('utf-8')
+
+    [(key, n, is_lower_bound)] = count_top_level_arrays(payload, 10, initial_window=64)
+    assert key == 'Rows' and is_lower_bound and 10 < n < 1000
+    assert count_top_level_arrays(payload, 10, stop_at_threshold=False) == [('Rows', 1000, False), ('More', 50, False)]
+
+
+def test_detect_large_json_arrays_reports_oversized_arrays():
+    import pandas as pd
+    payload = json.dumps({'Rows': list(range(12)), 'Small': [1]}).replace('"', '\\"')
+    df = pd.DataFrame({'line.message': [f"Received event result from database: {payload}", "other"],
+                       'line.mdc.trace_id': ['t1', 't2'], 'timestamp_raw': [1, 2]})
+    result = detect_large_json_arrays(df, array_length_threshold=10, n_jobs=1)
+    columns = ['trace_id', 'array_key', 'array_length', 'length_is_lower_bound']
+    assert result[columns].values.tolist() == [['t1', 'Rows', 12, False]]
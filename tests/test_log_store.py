@@ -0,0 +1,109 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from log_store import LogStoreReader, write_log_store
+
+DAY_NS = 86_400 * 10**9
+
+
+def _frame():
+    return pd.DataFrame({
+        'timestamp_raw': pd.array([1_700_000_000 * 10**9 + i * DAY_NS // 2 for i in range(6)], dtype='Int64'),
+        'message_type': pd.Categorical(['stopwatch', 'log', None, 'log', 'stopwatch', 'log']),
+        'level': pd.array([1, None, 3, 4, None, 6], dtype='Int8'),
+        'duration': pd.array([0.5, None, 1.25, 2.0, 3.5, None], dtype='Float32'),
+        'ok': pd.array([True, False, None, True, True, False], dtype='boolean'),
+        'bytes': np.arange(6, dtype=np.int64),
+        'message': pd.array(['a', None, 'ccc', 'a', 'é', 'b'], dtype='str'),
+        'raw': pd.Series(['x', 1, 2.5, None, True, 'x'], dtype=object),
+    })
+
+
+def test_round_trip_keeps_values_and_dtypes(tmp_path):
+    df = _frame()
+    write_log_store(df, None, str(tmp_path))
+    back, _ = LogStoreReader(str(tmp_path)).read()
+    back = back.sort_values('bytes').reset_index(drop=True)[df.columns]
+
+    for col in df.columns:
+        assert str(back[col].dtype) == str(df[col].dtype), col
+        expected = df[col].astype(object).where(df[col].notna(), None).tolist()
+        assert back[col].astype(object).where(back[col].notna(), None).tolist() == expected, col
+
+
+def test_columns_are_npy_arrays_without_pickles(tmp_path):
+    write_log_store(_frame(), None, str(tmp_path))
+    for root, _, files in os.walk(tmp_path):
+        if 'columns.bin' not in files:
+            continue
+        with open(os.path.join(root, 'columns.json'), encoding='utf-8') as f:
+            index = json.load(f)
+        with open(os.path.join(root, 'columns.bin'), 'rb') as f:
+            data = f.read()
+        for entry in index['columns'].values():
+            for offset, length in entry['arrays'].values():
+                assert data[offset:offset + 6] == b'\x93NUMPY'
+
+
+def test_old_format_partitions_are_rejected(tmp_path):
+    write_log_store(_frame(), None, str(tmp_path))
+    for root, _, files in os.walk(tmp_path):
+        if 'columns.json' in files:
+            path = os.path.join(root, 'columns.json')
+            with open(path, encoding='utf-8') as f:
+                index = json.load(f)
+            index['format'] = 1
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(index, f)
+    with pytest.raises(ValueError, match="old log store format"):
+        LogStoreReader(str(tmp_path)).read()
+
+
+class _RecordingFile:
+    """Wraps a file and records the (path, offset, size) of every read."""
+
+    def __init__(self, path, f, reads):
+        self._path, self._f, self._reads = path, f, reads
+
+    def read(self, size=-1):
+        offset = self._f.tell()
+        data = self._f.read(size)
+        self._reads.append((self._path, offset, len(data)))
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._f.close()
+
+
+def test_reads_only_the_byte_ranges_of_requested_and_filter_columns(tmp_path, monkeypatch):
+    import builtins
+    import log_store
+    write_log_store(_frame(), None, str(tmp_path))
+    reads = []
+
+    def recording_open(path, mode='r', *args, **kwargs):
+        f = builtins.open(path, mode, *args, **kwargs)
+        return _RecordingFile(str(path), f, reads) if str(path).endswith('columns.bin') else f
+
+    monkeypatch.setattr(log_store, 'open', recording_open, raising=False)
+    reader = LogStoreReader(str(tmp_path), filters=[('level', '>=', 3)])
+    df, _ = reader.read(columns=['level', 'message'])
+    assert df['level'].tolist() == [3, 4, 6]
+
+    # `level` is read once for the filter and reused; no other column is touched
+    ranges = {}
+    for name in reader.partitions():
+        index, _ = reader._partition_index(name)
+        ranges[os.path.join(str(tmp_path), name, "columns.bin")] = [
+            (offset, offset + length) for col in ('level', 'message') for offset, length in index[col]['arrays'].values()]
+    assert sum(size for _, _, size in reads) == sum(end - start for spans in ranges.values() for start, end in spans)
+    for path, offset, size in reads:
+        assert any(start <= offset and offset + size <= end for start, end in ranges[path])
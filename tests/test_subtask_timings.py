@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+from compiled_forest import CompiledForest
+from model_registry import ModelRegistry
+from subtask_timings import SubtaskTimingMatrix, build_subtask_timing_matrix, run_subtask_models
+
+pytest.importorskip("sklearn")
+
+
+def _details(n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n):
+        for subtask in rng.choice(['read', 'parse', 'commit', 'notify'], size=rng.integers(1, 4), replace=False):
+            rows.append({'trace_id': f"tr{i}", 'stopwatch_name': 'load file', 'subtask': subtask,
+                         'subtask_time_sec': float(rng.gamma(2.0, 0.1)), 'subtask_percent': '10%',
+                         'total_time_sec': 1.0})
+    rows.append({'trace_id': 'slow', 'stopwatch_name': 'load file', 'subtask': 'commit',
+                 'subtask_time_sec': 50.0, 'subtask_percent': '99%', 'total_time_sec': 50.0})
+    return pd.DataFrame(rows)
+
+
+@pytest.mark.parametrize('n_hash_features', [None, 16])
+def test_sparse_forest_is_explained_and_registered(tmp_path, n_hash_features):
+    details_csv = tmp_path / "details.csv"
+    _details().to_csv(details_csv, index=False)
+    build_subtask_timing_matrix(str(details_csv), str(tmp_path / "matrix"), n_hash_features=n_hash_features)
+
+    df = run_subtask_models(str(tmp_path / "matrix"), n_jobs=1, output_csv=str(tmp_path / "results.csv"),
+                            registry_dir=str(tmp_path / "models"))
+    timings = SubtaskTimingMatrix.load(str(tmp_path / "matrix"))
+
+    slow = df['trace_id'] == 'slow'
+    assert df.loc[slow, 'is_anomaly'].item()
+    expected = 'commit' if n_hash_features is None else timings.feature_names[timings.column_of(['commit'])[0]]
+    assert df.loc[slow, 'top_feature_1'].item() == expected
+    assert df.loc[~df['is_anomaly'], 'top_feature_1'].isna().all()
+
+    entry = ModelRegistry(str(tmp_path / "models")).load('subtask_isolation_forest')
+    assert entry.feature_columns == timings.feature_names
+    assert entry.params['n_estimators'] == 100
+    scores = CompiledForest.from_arrays(entry.arrays).score_samples(timings.matrix)
+    np.testing.assert_allclose(scores - entry.model.offset_, df['anomaly_score_value'], atol=1e-12)
@@ -0,0 +1,22 @@
+from template_miner import TemplateMiner
+
+
+def test_cache_keeps_only_the_most_recent_messages():
+    miner = TemplateMiner(cache_size=3)
+    for name in 'abcde':
+        miner.add(f"user {name} logged in")
+    miner.add("user c logged in")
+
+    assert list(miner._cache) == ["user d logged in", "user e logged in", "user c logged in"]
+
+
+def test_bounded_cache_assigns_the_same_templates(tmp_path):
+    messages = [f"request {i % 7} from host{i % 5} took {i} ms" for i in range(200)]
+    messages += [f"cache miss for key{i % 11}" for i in range(200)]
+    bounded, unbounded = TemplateMiner(cache_size=4), TemplateMiner(cache_size=10**6)
+
+    assert [bounded.add(m) for m in messages] == [unbounded.add(m) for m in messages]
+    assert bounded.sizes == unbounded.sizes
+
+    bounded.save(str(tmp_path / "miner.json"))
+    assert TemplateMiner.load(str(tmp_path / "miner.json")).cache_size == 4
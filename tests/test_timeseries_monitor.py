@@ -0,0 +1,55 @@
+import numpy as np
+from timeseries_monitor import EWMADetector, TimeSeriesMonitor
+
+
+def _steady_monitor(seed=0, minutes=600, rate=20.0):
+    rng = np.random.default_rng(seed)
+    monitor = TimeSeriesMonitor()
+    for minute in range(minutes):
+        monitor.observe_counts(minute, {'line.logger=app': int(rng.poisson(rate)),
+                                        'fields.detected_level=error': int(rng.poisson(0.2))})
+    return monitor
+
+
+def test_steady_traffic_raises_few_volume_alerts():
+    monitor = _steady_monitor()
+    monitor.flush()
+    alerts = monitor.alert_frame()
+    assert len(alerts) <= 0.01 * 600
+    assert np.isfinite(alerts['z_score'].astype(float)).all()
+
+
+def test_quiet_gap_does_not_turn_ordinary_counts_into_alerts():
+    monitor = TimeSeriesMonitor()
+    for minute in range(30):
+        monitor.observe_counts(minute, {'line.logger=app': 5})
+    # 60 zero-filled minutes, then ordinary traffic again
+    for minute in range(90, 120):
+        monitor.observe_counts(minute, {'line.logger=app': 5})
+    monitor.flush()
+    assert len(monitor.alert_frame()) == 0
+
+
+def test_burst_is_still_flagged():
+    monitor = _steady_monitor(minutes=100)
+    monitor.observe_counts(100, {'line.logger=app': 200})
+    monitor.flush()
+    alerts = monitor.alert_frame()
+    assert (alerts['series'] == 'line.logger=app').any()
+
+
+def test_ewma_never_returns_infinite_z():
+    detector = EWMADetector(warmup=0)
+    scores = [detector.update(value)[0] for value in [0] * 50 + [1, 3, 0, 7]]
+    assert not np.isinf(scores).any()
+
+
+def test_constant_latency_scores_off_median_values_finitely():
+    monitor = TimeSeriesMonitor()
+    for i in range(50):
+        monitor.observe_latency(i, 'Checkout', 2.0)
+    monitor.observe_latency(50, 'Checkout', 2.05)
+    monitor.observe_latency(51, 'Checkout', 8.0)
+    alerts = monitor.alert_frame()
+    assert alerts['value'].tolist() == [8.0]
+    assert np.isfinite(alerts[['z_score', 'anomaly_score_value']].astype(float).to_numpy()).all()
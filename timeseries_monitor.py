@@ -0,0 +1,286 @@
+import os
+import math
+import numpy as np
+import pandas as pd
+from payload_store import STOPWATCH_HEADER_PATTERN
+from trace_sessions import trace_keys
+from instrumentation import instrumented
+from log_store import resolve_logs
+
+NS_PER_MINUTE = 60 * 10**9
+# Per-minute volume is tracked for each value of these columns
+VOLUME_COLUMNS = ('line.logger', 'fields.detected_level', 'message_type')
+# Same columns as anomaly_detection.run_isolation_forest output, plus time-series context
+ALERT_COLUMNS = [
+    'trace_id', 'stopwatch_name', 'total_time_sec', 'max_subtask', 'max_subtask_percent',
+    'sum_other_subtask_time', 'ratio_other_to_max', 'anomaly_score', 'anomaly_score_value', 'is_anomaly',
+    'timestamp', 'series', 'detector', 'value', 'expected', 'z_score',
+]
+
+
+class RingBuffer:
+    """Fixed-size window of the latest values (O(1) append)."""
+
+    def __init__(self, capacity):
+        self.values = np.empty(capacity, dtype=np.float64)
+        self.capacity = capacity
+        self.size = 0
+        self.pos = 0
+
+    def append(self, value):
+        self.values[self.pos] = value
+        self.pos = (self.pos + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def window(self):
+        return self.values[:self.size]
+
+    def quantiles(self, qs=(0.5, 0.95, 0.99)):
+        if not self.size:
+            return [np.nan] * len(qs)
+        return np.quantile(self.window(), qs).tolist()
+
+
+class EWMADetector:
+    """
+    Exponentially weighted mean/variance; the z-score of each new value is taken
+    against the state before it is absorbed. O(1) time and memory per value.
+
+    The variance used for the z-score is floored at the expected value (the
+    Poisson variance of a count) and at `min_std`**2, so a run of quiet minutes
+    cannot shrink it towards 0, and no score is given until `warmup` values
+    have been seen and the expected value reaches `min_expected`.
+    """
+
+    def __init__(self, alpha=0.1, threshold=4.0, warmup=10, min_std=1.0, min_expected=1.0):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.min_std = min_std
+        self.min_expected = min_expected
+        self.mean = 0.0
+        self.var = 0.0
+        self.n = 0
+
+    def update(self, value):
+        """Returns (z_score, expected); z_score is NaN during warm-up or below `min_expected`."""
+        expected = self.mean
+        z = np.nan
+        if self.n == 0:
+            self.mean = value
+        else:
+            if self.n >= self.warmup and expected >= self.min_expected:
+                std = math.sqrt(max(self.var, expected, self.min_std ** 2))
+                z = (value - expected) / std
+            diff = value - self.mean
+            incr = self.alpha * diff
+            self.mean += incr
+            self.var = (1 - self.alpha) * (self.var + diff * incr)
+        self.n += 1
+        return z, expected
+
+
+class RobustZDetector:
+    """
+    Median/MAD z-score against a ring buffer of the last `window` values. Cost
+    per value is bounded by the (fixed) window size, and the buffer doubles as
+    the rolling quantile window.
+
+    The MAD used for the z-score is floored at `relative_min_mad` times the
+    median and at `min_mad`, so a window of identical values (a constant-latency
+    stopwatch) scores the next different value by how far it is relative to
+    the median instead of giving it an infinite z-score.
+    """
+
+    def __init__(self, window=200, threshold=4.0, warmup=10, min_mad=0.001, relative_min_mad=0.05):
+        self.buffer = RingBuffer(window)
+        self.threshold = threshold
+        self.warmup = warmup
+        self.min_mad = min_mad
+        self.relative_min_mad = relative_min_mad
+
+    def update(self, value):
+        """Returns (z_score, expected); z_score is NaN during warm-up."""
+        z, expected = np.nan, np.nan
+        if self.buffer.size >= self.warmup:
+            window = self.buffer.window()
+            expected = float(np.median(window))
+            mad = float(np.median(np.abs(window - expected)))
+            mad = max(mad, self.relative_min_mad * abs(expected), self.min_mad)
+            z = 0.6745 * (value - expected) / mad
+        self.buffer.append(value)
+        return z, expected
+
+
+class TimeSeriesMonitor:
+    """
+    Streaming detectors over the log stream, fed in time order.
+
+    - Volume: events are counted per minute for every (column, value) series
+      in VOLUME_COLUMNS. When a minute closes, each series' count goes through
+      its own EWMADetector (empty minutes count as 0, up to `max_gap_minutes`;
+      `volume_min_std` / `volume_min_expected` set its variance floor and the
+      expected count below which it stays silent).
+    - Latency: every StopWatch total goes through a per-stopwatch
+      RobustZDetector, whose ring buffer also gives rolling p50/p95/p99
+      (`latency_min_mad` / `latency_relative_min_mad` set its MAD floor).
+
+    Only upward spikes (z > threshold) are reported as alerts.
+    """
+
+    def __init__(self, volume_alpha=0.1, latency_window=200, threshold=4.0, warmup=10, max_gap_minutes=60,
+                 volume_min_std=1.0, volume_min_expected=1.0, latency_min_mad=0.001,
+                 latency_relative_min_mad=0.05):
+        self.volume_alpha = volume_alpha
+        self.volume_min_std = volume_min_std
+        self.volume_min_expected = volume_min_expected
+        self.latency_window = latency_window
+        self.latency_min_mad = latency_min_mad
+        self.latency_relative_min_mad = latency_relative_min_mad
+        self.threshold = threshold
+        self.warmup = warmup
+        self.max_gap_minutes = max_gap_minutes
+        self.volume_detectors = {}
+        self.latency_detectors = {}
+        self.current_minute = None
+        self.current_counts = {}
+        self.alerts = []
+
+    def _alert(self, **fields):
+        z = fields['z_score']
+        fields.update(anomaly_score=-1, anomaly_score_value=self.threshold - z, is_anomaly=True)
+        self.alerts.append(fields)
+
+    def _close_minute(self):
+        timestamp = self.current_minute * NS_PER_MINUTE
+        for series, detector in self.volume_detectors.items():
+            count = self.current_counts.get(series, 0)
+            z, expected = detector.update(count)
+            if z > self.threshold:
+                self._alert(trace_id=None, stopwatch_name=None, timestamp=timestamp, series=series,
+                            detector='volume_ewma', value=count, expected=expected, z_score=z)
+        self.current_counts = {}
+
+    def observe_counts(self, minute, counts):
+        """Add the event counts of one minute ({series: count}); minutes must not go backwards."""
+        if self.current_minute is not None and minute != self.current_minute:
+            self._close_minute()
+            # Quiet minutes in between are zero counts
+            for gap_minute in range(max(self.current_minute + 1, minute - self.max_gap_minutes), minute):
+                self.current_minute = gap_minute
+                self._close_minute()
+        self.current_minute = minute
+        for series, count in counts.items():
+            if series not in self.volume_detectors:
+                self.volume_detectors[series] = EWMADetector(self.volume_alpha, self.threshold, self.warmup,
+                                                             self.volume_min_std, self.volume_min_expected)
+            self.current_counts[series] = self.current_counts.get(series, 0) + count
+
+    def observe_event(self, timestamp, labels):
+        """Streaming entry point: one event with its {column: value} labels."""
+        self.observe_counts(int(timestamp // NS_PER_MINUTE), {f"{col}={value}": 1 for col, value in labels.items()})
+
+    def observe_latency(self, timestamp, stopwatch_name, total_time_sec, trace_id=None):
+        detector = self.latency_detectors.get(stopwatch_name)
+        if detector is None:
+            detector = self.latency_detectors[stopwatch_name] = RobustZDetector(
+                self.latency_window, self.threshold, self.warmup, self.latency_min_mad, self.latency_relative_min_mad)
+        z, expected = detector.update(total_time_sec)
+        if z > self.threshold:
+            self._alert(trace_id=trace_id, stopwatch_name=stopwatch_name, total_time_sec=total_time_sec,
+                        timestamp=timestamp, series=f"stopwatch={stopwatch_name}", detector='latency_robust_z',
+                        value=total_time_sec, expected=expected, z_score=z)
+
+    def flush(self):
+        if self.current_minute is not None:
+            self._close_minute()
+            self.current_minute = None
+
+    def latency_quantiles(self, qs=(0.5, 0.95, 0.99)):
+        """Rolling quantiles of the last `latency_window` totals per stopwatch."""
+        rows = []
+        for name, detector in self.latency_detectors.items():
+            rows.append([name, detector.buffer.size] + detector.buffer.quantiles(qs))
+        return pd.DataFrame(rows, columns=['stopwatch_name', 'window_size'] + [f"p{int(q * 100)}" for q in qs])
+
+    def alert_frame(self):
+        return pd.DataFrame(self.alerts, columns=ALERT_COLUMNS)
+
+
+def _stopwatch_events(df_logs_parsed, store=None):
+    """(row positions, stopwatch names, totals) of every StopWatch header."""
+    if store is not None:
+        rows = np.flatnonzero(store.stopwatch_name_codes >= 0)
+        names = np.array(store.stopwatch_vocab, dtype=object)[store.stopwatch_name_codes[rows]]
+        return rows, names, store.stopwatch_totals[rows]
+
+    headers = df_logs_parsed['line.message'].str.extract(STOPWATCH_HEADER_PATTERN)
+    totals = pd.to_numeric(headers[1], errors='coerce')
+    rows = np.flatnonzero(headers[0].notna().to_numpy() & totals.notna().to_numpy())
+    return rows, headers[0].to_numpy()[rows], totals.to_numpy()[rows]
+
+
+@instrumented()
+def detect_time_series_anomalies(df_logs_parsed, store=None, monitor=None,
+                                 output_csv="output/timeseries_alerts.csv"):
+    """
+    Replay the parsed logs through a TimeSeriesMonitor in `timestamp_raw` order.
+
+    Per-minute counts are built with one groupby per volume column and fed
+    minute by minute; StopWatch totals (from the PayloadStore if given) are fed
+    one by one. Alerts are saved in the Isolation Forest result schema
+    (`anomaly_score` = -1, `anomaly_score_value` = threshold - z, so lower is
+    more anomalous) with the series, detector and z-score added.
+    `df_logs_parsed` may also be a LogStoreReader.
+    """
+    columns = ['timestamp_raw', 'line.mdc.trace_id', 'fields.TraceID', 'line.message', *VOLUME_COLUMNS]
+    df_logs_parsed, store = resolve_logs(df_logs_parsed, columns, store, with_store=True)
+    monitor = monitor if monitor is not None else TimeSeriesMonitor()
+    timestamps = pd.to_numeric(df_logs_parsed['timestamp_raw'], errors='coerce').to_numpy(dtype=np.float64)
+    valid = ~np.isnan(timestamps)
+    minutes = np.full(len(timestamps), -1, dtype=np.int64)
+    minutes[valid] = (timestamps[valid] // NS_PER_MINUTE).astype(np.int64)
+
+    # ✅ Per-minute counts for every (column, value) series
+    per_minute = []
+    for col in VOLUME_COLUMNS:
+        if col not in df_logs_parsed.columns:
+            continue
+        counts = pd.DataFrame({'minute': minutes[valid], 'value': df_logs_parsed[col].to_numpy()[valid]})
+        counts = counts.dropna().value_counts().reset_index(name='count')
+        counts['series'] = col + '=' + counts['value'].astype(str)
+        per_minute.append(counts[['minute', 'series', 'count']])
+    volume = pd.concat(per_minute, ignore_index=True) if per_minute else pd.DataFrame(columns=['minute', 'series', 'count'])
+    volume_by_minute = {minute: dict(zip(group['series'], group['count']))
+                        for minute, group in volume.groupby('minute', sort=True)}
+
+    # ✅ StopWatch totals in time order
+    trace_ids = trace_keys(df_logs_parsed)
+    rows, names, totals = _stopwatch_events(df_logs_parsed, store)
+    keep = valid[rows]
+    rows, names, totals = rows[keep], names[keep], totals[keep]
+    order = np.argsort(timestamps[rows], kind='stable')
+    latency_events = zip(minutes[rows][order], timestamps[rows][order], names[order], totals[order],
+                         trace_ids.to_numpy()[rows][order])
+
+    # ✅ Replay: a minute's latency events, then the minute's counts
+    pending = next(latency_events, None)
+    for minute, counts in volume_by_minute.items():
+        while pending is not None and pending[0] <= minute:
+            _, ts, name, total, trace_id = pending
+            monitor.observe_latency(int(ts), name, float(total), trace_id)
+            pending = next(latency_events, None)
+        monitor.observe_counts(minute, counts)
+    while pending is not None:
+        _, ts, name, total, trace_id = pending
+        monitor.observe_latency(int(ts), name, float(total), trace_id)
+        pending = next(latency_events, None)
+    monitor.flush()
+
+    alerts = monitor.alert_frame()
+    print(f"🚨 Time-series alerts: {len(alerts)}")
+    if output_csv is not None:
+        os.makedirs(os.path.dirname(output_csv) or ".", exist_ok=True)
+        alerts.to_csv(output_csv, index=False)
+        print(f"💾 Time-series alerts saved to {output_csv}")
+    return alerts
@@ -0,0 +1,188 @@
+import os
+import numpy as np
+import pandas as pd
+from instrumentation import instrumented
+from log_store import resolve_logs
+
+MESSAGE_TYPES = (
+    'EXECUTE_EVENT', 'STOPWATCH_EXECUTE_TEMP', 'STOPWATCH_GENERIC',
+    'RECEIVED_EVENT_RESULT', 'OTHER_EXEC_PROC', 'OTHER',
+)
+STOPWATCH_TYPES = ('STOPWATCH_EXECUTE_TEMP', 'STOPWATCH_GENERIC')
+TRACE_COLUMNS = ['line.mdc.trace_id', 'fields.TraceID', 'timestamp_raw']
+TRACE_FEATURE_COLUMNS = TRACE_COLUMNS + ['message_type', 'line.message', 'line.logger', 'template_id']
+
+
+class TraceIndex:
+    """
+    Rows of the parsed log frame grouped by trace, CSR style.
+
+    `order` holds the row positions sorted by trace (then timestamp), and trace
+    i's rows are `order[offsets[i]:offsets[i + 1]]`, so any trace can be sliced
+    in O(1) after a dictionary lookup. Rows without a trace ID are left out.
+    """
+
+    def __init__(self, trace_ids, offsets, order, timestamps):
+        self.trace_ids = trace_ids
+        self.offsets = offsets
+        self.order = order
+        self.timestamps = timestamps
+        self._positions = {trace_id: i for i, trace_id in enumerate(trace_ids)}
+
+    def __len__(self):
+        return len(self.trace_ids)
+
+    @property
+    def trace_codes(self):
+        """Trace position of every entry of `order`."""
+        return np.repeat(np.arange(len(self)), np.diff(self.offsets))
+
+    def rows(self, trace_id):
+        """Row positions (in time order) of one trace."""
+        i = self._positions[trace_id]
+        return self.order[self.offsets[i]:self.offsets[i + 1]]
+
+    def frame(self, df_logs_parsed, trace_id):
+        """Drill-down: the parsed log rows of one trace."""
+        return df_logs_parsed.iloc[self.rows(trace_id)]
+
+
+def trace_keys(df_logs_parsed):
+    """`line.mdc.trace_id`, falling back to `fields.TraceID` where it is missing or empty."""
+    trace_ids = pd.Series(None, index=df_logs_parsed.index, dtype=object)
+    for col in ['fields.TraceID', 'line.mdc.trace_id']:
+        if col in df_logs_parsed.columns:
+            values = df_logs_parsed[col].astype(object)
+            trace_ids = values.where(values.notna() & (values != ''), trace_ids)
+    return trace_ids
+
+
+@instrumented()
+def build_trace_index(df_logs_parsed):
+    """Sort the parsed logs by (trace, timestamp) once and build the TraceIndex (frame or LogStoreReader)."""
+    df_logs_parsed, _ = resolve_logs(df_logs_parsed, TRACE_COLUMNS)
+    codes, uniques = pd.factorize(trace_keys(df_logs_parsed), sort=True)
+    if 'timestamp_raw' in df_logs_parsed.columns:
+        timestamps = pd.to_numeric(df_logs_parsed['timestamp_raw'], errors='coerce').to_numpy(dtype=np.float64)
+    else:
+        timestamps = np.full(len(df_logs_parsed), np.nan)
+
+    keep = np.flatnonzero(codes >= 0)
+    order = keep[np.lexsort((timestamps[keep], codes[keep]))]
+    offsets = np.zeros(len(uniques) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes[keep], minlength=len(uniques)), out=offsets[1:])
+    return TraceIndex(np.asarray(uniques, dtype=object), offsets, order, timestamps)
+
+
+def _grouped_counts(trace_codes, codes, n_traces, n_codes):
+    """Dense (n_traces, n_codes) count matrix of code occurrences per trace."""
+    flat = np.bincount(trace_codes * n_codes + codes, minlength=n_traces * n_codes)
+    return flat.reshape(n_traces, n_codes)
+
+
+def _mix(trace_codes, values, n_traces):
+    """Per trace: number of distinct values, the most frequent one and its share of rows."""
+    values = pd.Series(values)
+    codes, uniques = pd.factorize(values)
+    valid = codes >= 0
+    trace_codes, codes = trace_codes[valid], codes[valid]
+
+    n_distinct = np.zeros(n_traces, dtype=np.int64)
+    top_value = np.full(n_traces, None, dtype=object)
+    top_share = np.zeros(n_traces, dtype=np.float64)
+    if len(codes) == 0:
+        return n_distinct, top_value, top_share
+
+    pairs, counts = np.unique(trace_codes.astype(np.int64) * len(uniques) + codes, return_counts=True)
+    pair_traces = pairs // len(uniques)
+    n_distinct += np.bincount(pair_traces, minlength=n_traces)
+
+    # Most frequent value per trace: highest count first within each trace
+    ranked = np.lexsort((-counts, pair_traces))
+    first = ranked[np.r_[True, pair_traces[ranked][1:] != pair_traces[ranked][:-1]]]
+    rows_per_trace = np.bincount(trace_codes, minlength=n_traces)
+    top_value[pair_traces[first]] = np.asarray(uniques, dtype=object)[pairs[first] % len(uniques)]
+    top_share[pair_traces[first]] = counts[first] / rows_per_trace[pair_traces[first]]
+    return n_distinct, top_value, top_share
+
+
+@instrumented()
+def build_trace_features(df_logs_parsed, index=None, store=None, array_length_threshold=500,
+                         output_csv="output/trace_features.csv"):
+    """
+    One feature row per trace, computed in a single vectorized pass over the
+    TraceIndex:
+    - event counts per message type (`n_<message_type>`)
+    - first/last timestamp and duration in seconds
+    - number of StopWatch blocks
+    - number of oversized top-level arrays (from the PayloadStore if given,
+      otherwise by scanning the 'Received event result' payloads)
+    - logger mix: distinct loggers, the dominant logger and its share of rows
+    - distinct mined templates (if `clean_logs` added `template_id`)
+
+    `df_logs_parsed` may also be a LogStoreReader (TRACE_FEATURE_COLUMNS and
+    the PayloadStores are read); a passed `index` must come from the same reader.
+    """
+    df_logs_parsed, store = resolve_logs(df_logs_parsed, TRACE_FEATURE_COLUMNS, store, with_store=True)
+    index = index if index is not None else build_trace_index(df_logs_parsed)
+    n_traces = len(index)
+    rows = index.order
+    trace_codes = index.trace_codes
+
+    features = pd.DataFrame({'trace_id': index.trace_ids})
+    features['n_events'] = np.diff(index.offsets)
+
+    # ✅ Event counts per message type
+    type_codes = pd.Categorical(df_logs_parsed['message_type'].to_numpy()[rows], categories=MESSAGE_TYPES).codes
+    type_counts = _grouped_counts(trace_codes, np.where(type_codes >= 0, type_codes, len(MESSAGE_TYPES) - 1),
+                                  n_traces, len(MESSAGE_TYPES))
+    for i, message_type in enumerate(MESSAGE_TYPES):
+        features[f"n_{message_type.lower()}"] = type_counts[:, i]
+
+    # ✅ Duration (timestamp_raw is in nanoseconds)
+    timestamps = index.timestamps[rows]
+    start = np.full(n_traces, np.nan)
+    end = np.full(n_traces, np.nan)
+    valid = ~np.isnan(timestamps)
+    np.fmin.at(start, trace_codes[valid], timestamps[valid])
+    np.fmax.at(end, trace_codes[valid], timestamps[valid])
+    features['start_timestamp'] = start
+    features['end_timestamp'] = end
+    features['duration_sec'] = (end - start) / 1e9
+
+    # ✅ StopWatch blocks
+    if store is not None:
+        is_stopwatch = store.stopwatch_name_codes[rows] >= 0
+    else:
+        is_stopwatch = np.isin(type_codes, [MESSAGE_TYPES.index(t) for t in STOPWATCH_TYPES])
+    features['n_stopwatch_blocks'] = np.bincount(trace_codes[is_stopwatch], minlength=n_traces)
+
+    # ✅ Oversized-array hits
+    if store is not None:
+        oversized_rows, _, _ = store.oversized_arrays(array_length_threshold)
+        row_hits = np.bincount(oversized_rows, minlength=len(df_logs_parsed))[rows]
+    else:
+        from large_array_check import _scan_chunk
+        messages = df_logs_parsed['line.message'].to_numpy()[rows]
+        received = np.flatnonzero(type_codes == MESSAGE_TYPES.index('RECEIVED_EVENT_RESULT'))
+        row_hits = np.zeros(len(rows), dtype=np.int64)
+        scanned = _scan_chunk(messages[received].tolist(), array_length_threshold, False)
+        row_hits[received] = [len(arrays or []) for arrays in scanned]
+    features['n_oversized_arrays'] = np.bincount(trace_codes, weights=row_hits, minlength=n_traces).astype(np.int64)
+
+    # ✅ Logger mix
+    if 'line.logger' in df_logs_parsed.columns:
+        n_loggers, top_logger, top_share = _mix(trace_codes, df_logs_parsed['line.logger'].to_numpy()[rows], n_traces)
+        features['n_loggers'] = n_loggers
+        features['top_logger'] = top_logger
+        features['top_logger_share'] = top_share
+
+    if 'template_id' in df_logs_parsed.columns:
+        features['n_templates'], _, _ = _mix(trace_codes, df_logs_parsed['template_id'].to_numpy()[rows], n_traces)
+
+    if output_csv is not None:
+        os.makedirs(os.path.dirname(output_csv) or ".", exist_ok=True)
+        features.to_csv(output_csv, index=False)
+        print(f"✅ Trace feature table saved to {output_csv}")
+
+    return features